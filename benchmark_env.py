@@ -0,0 +1,355 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from gym_exchange.envs import StockExchange, StockExchangeContinuous, VecStockExchangeContinuous, \
+    SubprocVecStockExchangeContinuous, TrajectoryRecorder, TrajectoryReader
+from gym_exchange.gym_engine import Ticker, Engine, Portfolio
+from gym_exchange.gym_engine.market_data import cache
+
+
+parser = argparse.ArgumentParser(description='Micro-benchmarks for gym_exchange')
+parser.add_argument('--bench',          default='all', type=str,
+                    choices=['all', 'build', 'ticker', 'engine', 'portfolio', 'window', 'reset',
+                             'episodes', 'render', 'vec', 'subproc', 'record'])
+parser.add_argument('--num_steps',      default=5000, type=int)
+parser.add_argument('--start_date',     default=StockExchange.start_date, type=str)
+parser.add_argument('--num_days_iter',  default=StockExchange.num_days_to_iterate, type=int)
+parser.add_argument('--num_envs',       default=[1, 8, 64], type=int, nargs='+')
+parser.add_argument('--num_workers',    default=[1, 2, 4, 8], type=int, nargs='+')
+parser.add_argument('--num_tickers',    default=500, type=int,
+                    help='size of the large universe, capped by what is in iexfinance/iexdata')
+
+
+def timeit(fn, num_steps):
+    start = time.perf_counter()
+    fn(num_steps)
+    return (time.perf_counter() - start) / num_steps
+
+
+def report(name, seconds_per_step):
+    print('{:<40}: {:>10.2f} us/step, {:>10.0f} steps/sec'.format(
+        name, seconds_per_step * 1e6, 1.0 / seconds_per_step))
+
+
+def bench_build(args):
+    # First build parses the csvs, the next ones come out of the market data cache
+    cache.clear()
+    for i in range(3):
+        start = time.perf_counter()
+        StockExchangeContinuous()
+        print('{:<40}: {:>10.2f} ms'.format(f'StockExchangeContinuous() #{i + 1}',
+                                           (time.perf_counter() - start) * 1e3))
+    print(cache)
+
+
+def bench_ticker(args):
+    # One engine step worth of work on the 13-ticker StockExchange configuration
+    tickers = [Ticker(ticker, args.start_date, args.num_days_iter)
+               for ticker in StockExchange.tickers]
+    actions = np.random.randint(0, 3, args.num_steps)
+
+    def run(num_steps):
+        for i in range(num_steps):
+            for ticker in tickers:
+                if ticker.done():
+                    ticker.reset()
+                ticker.step(actions[i])
+                ticker.get_state()
+
+    report(f'Ticker.step + get_state x{len(tickers)}', timeit(run, args.num_steps))
+
+
+def universe(args):
+    # Every symbol with enough history after start_date, up to num_tickers
+    tickers = []
+    for ticker in sorted(os.listdir('iexfinance/iexdata')):
+        if not ticker.isupper() or len(tickers) >= args.num_tickers:
+            continue
+        with open(f'iexfinance/iexdata/{ticker}') as f:
+            if sum(1 for line in f if line[:10] >= args.start_date) > args.num_days_iter:
+                tickers += [ticker]
+    return tickers
+
+
+def bench_engine(args):
+    for tickers in (StockExchange.tickers, universe(args)):
+        for vectorized in (False, True):
+            engine = Engine(tickers, args.start_date, args.num_days_iter, vectorized=vectorized)
+            actions = np.random.randint(0, 3, (args.num_steps, len(tickers)))
+
+            def run(num_steps):
+                for i in range(num_steps):
+                    _, done = engine.step(actions[i])
+                    engine.get_state()
+                    if done:
+                        engine.reset_game()
+
+            mode = 'vectorized' if vectorized else 'loop'
+            report(f'Engine.step + get_state x{len(tickers)}, {mode}',
+                   timeit(run, args.num_steps))
+
+
+def bench_portfolio(args):
+    portfolio = Portfolio(StockExchange.tickers, args.start_date, args.num_days_iter,
+                          vectorized=True)
+    action_indices = np.random.randint(0, portfolio.moves_available(), args.num_steps)
+
+    def legacy_step(action_index):
+        # What Portfolio.step used to do: a position_df column, then one float match per
+        #     ticker. position_df itself no longer exists, the column is rebuilt from the
+        #     same allocation
+        positions = pd.Series(portfolio.positions([action_index])[0])
+        actions = [np.argwhere(np.isclose(portfolio.action_space, position)).item()
+                   for position in positions]
+        return Engine.step(portfolio, actions)
+
+    def vectorized_decode_step(action_index):
+        return Engine.step(portfolio, portfolio.compositions.unrank(action_index)[0])
+
+    for mode, step in (('position_df + isclose', legacy_step),
+                       ('numpy unrank', vectorized_decode_step),
+                       ('integer unrank', portfolio.step)):
+        def run(num_steps):
+            portfolio.reset_game()
+            for i in range(num_steps):
+                _, done = step(action_indices[i])
+                if done:
+                    portfolio.reset_game()
+
+        report(f'Portfolio.step x{len(portfolio.tickers)}, {mode}', timeit(run, args.num_steps))
+
+
+def legacy_add_new_state(running_state, new_states_to_add):
+    # How StockExchange.step used to roll its window, kept here as the baseline
+    new_states = np.array([state[:-1].tolist() for state in new_states_to_add]).flatten()
+    running_state = pd.DataFrame(running_state).shift(-1)
+    running_state.iloc[-1] = new_states.squeeze()
+    return np.array(running_state)
+
+
+def bench_window(args):
+    for env_cls in (StockExchangeContinuous, StockExchange):
+        env = env_cls()
+        if env_cls is StockExchange:
+            sample_action = lambda: np.random.randint(env.moves_available())
+        else:
+            sample_action = lambda: np.random.uniform(-1.0, 1.0, env.num_action_space)
+        actions = [sample_action() for _ in range(args.num_steps)]
+
+        def run(num_steps):
+            env.reset()
+            for i in range(num_steps):
+                _, _, done, _ = env.step(actions[i])
+                if done:
+                    env.reset()
+
+        view_step = env.get_window
+        for mode in ('DataFrame shift', 'view'):
+            if mode == 'view':
+                env.get_window = view_step
+            else:
+                env.get_window = lambda: legacy_add_new_state(env.state, env.env.get_state())
+            report(f'{env_cls.__name__}.step, {mode}', timeit(run, args.num_steps))
+
+
+def legacy_reset(env):
+    # How reset() used to warm up: window - 1 full steps
+    env.env.reset_game()
+    for _ in range(env.observation_space.shape[0] - 1):
+        if isinstance(env, StockExchange):
+            env.step(np.random.randint(0, env.moves_available()))
+        else:
+            env.step([0.0] * env.num_action_space)
+    return env.state
+
+
+def bench_reset(args):
+    for env_cls in (StockExchangeContinuous, StockExchange):
+        env = env_cls()
+        for mode, reset in (('stepping', lambda: legacy_reset(env)), ('fast_forward', env.reset)):
+            def run(num_steps):
+                for _ in range(num_steps):
+                    reset()
+
+            report(f'{env_cls.__name__}.reset, {mode}', timeit(run, args.num_steps // 10))
+
+
+class SampledExchangeContinuous(StockExchangeContinuous):
+    episode_sampling = 'random'
+
+
+def bench_episodes(args):
+    # Distinct episode starts per second: a new env per start date, as one had to before,
+    #     against resets drawing the start over the loaded history
+    env = SampledExchangeContinuous()
+    dates = env.env.panel.dates[:env.sampler.num_starts()].astype(str)
+
+    class DatedExchange(StockExchangeContinuous):
+        pass
+
+    def rebuild(num_steps):
+        cache.clear()
+        for i in range(num_steps):
+            DatedExchange.start_date = dates[i % len(dates)]
+            DatedExchange()
+
+    def reset(num_steps):
+        for _ in range(num_steps):
+            env.reset()
+
+    for mode, run, num_steps in (('new env per start_date', rebuild, 20),
+                                 ('sampled reset', reset, args.num_steps)):
+        seconds = timeit(run, num_steps)
+        print('{:<40}: {:>10.2f} ms/episode, {:>10.0f} episodes/sec'.format(
+            mode, seconds * 1e3, 1.0 / seconds))
+
+
+def bench_render(args):
+    # render() after every step. 'human' runs on the Agg backend here, it still draws and
+    #     pauses on every call but nothing shows up on screen
+    import matplotlib
+    matplotlib.use('Agg')
+
+    with tempfile.TemporaryDirectory() as path:
+        class FileExchangeContinuous(StockExchangeContinuous):
+            render_mode = 'file'
+            render_path = path
+
+        for mode, env_cls, render in (('no render', StockExchangeContinuous, False),
+                                      ('file', FileExchangeContinuous, True),
+                                      ('human', StockExchangeContinuous, True)):
+            env = env_cls()
+            action = np.zeros(env.num_action_space)
+            # Human rendering redraws everything on each call, a handful of steps is enough
+            num_steps = args.num_steps if mode != 'human' else 20
+
+            def run(num_steps):
+                env.reset()
+                for _ in range(num_steps):
+                    _, _, done, _ = env.step(action)
+                    if render:
+                        env.render()
+                    if done:
+                        env.reset()
+
+            report(f'StockExchangeContinuous.step, {mode}', timeit(run, num_steps))
+            env.close()
+            if mode == 'file':
+                print(env.recorder)
+
+
+def bench_vec(args):
+    # Throughput in env steps, i.e. a step of num_envs episodes counts num_envs times
+    for num_envs in args.num_envs:
+        vec_env = VecStockExchangeContinuous(num_envs)
+        actions = np.random.uniform(-1.0, 1.0, (args.num_steps // num_envs, num_envs,
+                                                vec_env.exchange.num_action_space))
+
+        vec_env.reset()
+
+        def run(num_steps):
+            for i in range(num_steps // num_envs):
+                vec_env.step(actions[i])
+
+        report(f'VecStockExchangeContinuous x{num_envs}', timeit(run, args.num_steps))
+
+
+class LargeExchangeContinuous(StockExchangeContinuous):
+    # tickers are filled in by bench_subproc, workers are forked after that
+    tickers = []
+
+
+class LargeSubprocVecExchange(SubprocVecStockExchangeContinuous):
+    env_cls = LargeExchangeContinuous
+
+
+def bench_subproc(args):
+    LargeExchangeContinuous.tickers = universe(args)
+    LargeExchangeContinuous.num_action_space = len(LargeExchangeContinuous.tickers)
+
+    num_envs = max(args.num_workers)
+    for vec_cls in (SubprocVecStockExchangeContinuous, LargeSubprocVecExchange):
+        num_tickers = len(vec_cls.env_cls.tickers)
+        for num_workers in args.num_workers:
+            vec_env = vec_cls(num_envs, num_workers, start_method='fork')
+            actions = np.random.uniform(-1.0, 1.0, (num_envs, num_tickers))
+            # Waits for the workers to build their envs, keep it out of the timing
+            vec_env.reset()
+
+            def run(num_steps):
+                for _ in range(num_steps // num_envs):
+                    vec_env.step(actions)
+
+            report(f'Subproc x{num_envs} envs, {num_tickers} tickers, {num_workers} workers',
+                   timeit(run, args.num_steps))
+            vec_env.close()
+
+
+def bench_record(args):
+    # Stepping with and without TrajectoryRecorder, then reading the rows back against
+    #     unpickling the same transitions as ReplayMemory keeps them
+    import pickle
+    actions = np.random.uniform(-1.0, 1.0, (args.num_steps, StockExchangeContinuous.num_action_space))
+    with tempfile.TemporaryDirectory() as path:
+        for name, compress in (('none', None), ('npz', True), ('npy', False)):
+            env = StockExchangeContinuous()
+            if compress is not None:
+                env = TrajectoryRecorder(env, os.path.join(path, name), compress=compress)
+
+            def run(num_steps):
+                env.reset()
+                for i in range(num_steps):
+                    _, _, done, _ = env.step(actions[i])
+                    if done:
+                        env.reset()
+                if compress is not None:
+                    env.flush(block=True)
+
+            report(f'StockExchangeContinuous.step, record {name}', timeit(run, args.num_steps))
+            env.close()
+
+        for name in ('npz', 'npy'):
+            reader = TrajectoryReader(os.path.join(path, name))
+            start = time.perf_counter()
+            data = reader.load()
+            nbytes = sum(os.path.getsize(os.path.join(root, file))
+                         for root, _, files in os.walk(reader.path) for file in files)
+            print('{:<40}: {:>10.2f} ms, {:>8.1f} MB on disk'.format(
+                f'TrajectoryReader.load, {name}', (time.perf_counter() - start) * 1e3, nbytes / 2 ** 20))
+
+        transitions = list(zip(*(data[column] for column in ('obs', 'action', 'next_obs', 'reward', 'done'))))
+        file_name = os.path.join(path, 'transitions.p')
+        with open(file_name, 'wb') as f:
+            pickle.dump(transitions, f)
+        start = time.perf_counter()
+        with open(file_name, 'rb') as f:
+            pickle.load(f)
+        print('{:<40}: {:>10.2f} ms, {:>8.1f} MB on disk'.format(
+            'pickle.load, list of transitions', (time.perf_counter() - start) * 1e3,
+            os.path.getsize(file_name) / 2 ** 20))
+
+
+BENCHMARKS = {
+    'build': bench_build,
+    'ticker': bench_ticker,
+    'engine': bench_engine,
+    'portfolio': bench_portfolio,
+    'window': bench_window,
+    'reset': bench_reset,
+    'episodes': bench_episodes,
+    'render': bench_render,
+    'vec': bench_vec,
+    'subproc': bench_subproc,
+    'record': bench_record,
+}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for name, bench in BENCHMARKS.items():
+        if args.bench in ('all', name):
+            bench(args)
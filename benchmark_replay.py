@@ -0,0 +1,359 @@
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+from reinforcement import ArrayReplayBuffer, PrioritizedReplayBuffer, ReplayBuffer, ReplayMemory
+import torch
+from reinforcement import DuelingDQN
+from reinforcement.environment import device
+from reinforcement.models_ddpg import Actor, Critic, DDPG
+from reinforcement.utils import Update
+from reinforcement import train
+from reinforcement.train import sample_batch, train_dqn, train_ddpg
+import gym
+
+
+parser = argparse.ArgumentParser(description='Micro-benchmarks for the replay memories')
+parser.add_argument('--bench',          default='all', type=str,
+                    choices=['all', 'push', 'sample', 'prioritized', 'frames', 'mapped', 'train',
+                             'target', 'act'])
+parser.add_argument('--capacity',       default=[100000, 1000000], type=int, nargs='+')
+parser.add_argument('--batch_size',     default=[32, 256], type=int, nargs='+')
+parser.add_argument('--num_steps',      default=1000, type=int)
+parser.add_argument('--state_shape',    default=[4, 52], type=int, nargs='+',
+                    help='float32 at 1M capacity, 4 x 52 takes 1.6GB for states and next states')
+parser.add_argument('--window_shape',   default=[20, 52], type=int, nargs=2,
+                    help='rolling window of the frames bench, StockExchange is 20 x 52')
+parser.add_argument('--episode_length', default=200, type=int)
+parser.add_argument('--num_updates',    default=200, type=int)
+parser.add_argument('--hidden_dim',     default=256, type=int, help='of DDPG')
+parser.add_argument('--tmp_dir',        default=None, type=str,
+                    help='where the mapped bench writes its files')
+parser.add_argument('--max_gb',         default=2.0, type=float,
+                    help='buffers needing more are skipped')
+
+
+def timeit(fn, num_steps):
+    start = time.perf_counter()
+    fn(num_steps)
+    return (time.perf_counter() - start) / num_steps
+
+
+def report(name, seconds_per_step, unit='step'):
+    print('{:<50}: {:>10.2f} us/{}, {:>10.0f} /sec'.format(
+        name, seconds_per_step * 1e6, unit, 1.0 / seconds_per_step))
+
+
+def state_pool(args, size=256):
+    # Envs hand out new arrays every step, a pool of them stands in for that
+    return np.random.randn(size, *args.state_shape)
+
+
+def fill(memory, states, num_pushes, done=True):
+    for i in range(num_pushes):
+        j = i % len(states)
+        if done:
+            memory.push(states[j], i % 3, 0.1, states[j - 1], False)
+        else:
+            memory.push(states[j], i % 3, 0.1, states[j - 1])
+
+
+def memories(capacity):
+    # ReplayMemory takes no done, the other two do
+    return [('ReplayMemory', ReplayMemory(capacity), False),
+            ('ReplayBuffer', ReplayBuffer(capacity), True),
+            ('ArrayReplayBuffer', ArrayReplayBuffer(capacity), True)]
+
+
+def bench_push(args):
+    states = state_pool(args)
+    for capacity in args.capacity:
+        for name, memory, done in memories(capacity):
+            # A full buffer, pushes then overwrite
+            fill(memory, states, capacity, done)
+            report(f'{name}({capacity}).push, full', timeit(
+                lambda num_steps: fill(memory, states, num_steps * 10, done), args.num_steps) / 10,
+                   'push')
+            del memory
+
+
+def bench_sample(args):
+    states = state_pool(args)
+    for capacity in args.capacity:
+        for name, memory, done in memories(capacity):
+            start = time.perf_counter()
+            fill(memory, states, capacity, done)
+            print('{:<50}: {:>10.2f} s'.format(f'{name}({capacity}) filled in',
+                                              time.perf_counter() - start))
+            for batch_size in args.batch_size:
+                def sample(num_steps):
+                    for _ in range(num_steps):
+                        memory.sample(batch_size)
+
+                def tensors(num_steps):
+                    # Batch as train_dqn gets it
+                    for _ in range(num_steps):
+                        sample_batch(memory, batch_size)
+
+                # ReplayMemory.sample on a deque is O(capacity), keep it short
+                num_steps = args.num_steps // 10 if name == 'ReplayMemory' else args.num_steps
+                report(f'{name}({capacity}).sample({batch_size})',
+                       timeit(sample, num_steps), 'batch')
+                if name != 'ReplayBuffer':
+                    report(f'{name}({capacity}) train_dqn tensors({batch_size})',
+                           timeit(tensors, num_steps), 'batch')
+            del memory
+
+
+def bench_prioritized(args):
+    # What a prioritized train step adds: sampling from the tree, the weights and the
+    #     priority update, against the uniform gather
+    states = state_pool(args)
+    for capacity in args.capacity:
+        uniform, prioritized = ArrayReplayBuffer(capacity), PrioritizedReplayBuffer(capacity)
+        for memory in (uniform, prioritized):
+            fill(memory, states, capacity)
+        prioritized.update_priorities(np.arange(capacity), np.random.rand(capacity))
+        report(f'PrioritizedReplayBuffer({capacity}).push', timeit(
+            lambda num_steps: fill(prioritized, states, num_steps * 10), args.num_steps) / 10, 'push')
+
+        for batch_size in args.batch_size:
+            def sample(num_steps):
+                for _ in range(num_steps):
+                    uniform.sample(batch_size)
+
+            def sample_prioritized(num_steps):
+                for _ in range(num_steps):
+                    indices = prioritized.sample_indices(batch_size)
+                    prioritized.gather(indices)
+                    prioritized.weights(indices)
+                    prioritized.update_priorities(indices, np.random.rand(batch_size))
+
+            report(f'ArrayReplayBuffer({capacity}).sample({batch_size})',
+                   timeit(sample, args.num_steps), 'batch')
+            report(f'Prioritized({capacity}) sample+update({batch_size})',
+                   timeit(sample_prioritized, args.num_steps), 'batch')
+        del uniform, prioritized
+
+
+def push_episodes(memory, rows, num_pushes, episode_length, window, done=True):
+    # Rolling windows over rows as RunExchange pushes them, next state is the state
+    #     moved on by a row and a new episode starts at a random row
+    start = 0
+    for i in range(num_pushes):
+        step = i % episode_length
+        if step == 0:
+            start = np.random.randint(len(rows) - episode_length - window)
+        state = rows[start + step:start + step + window]
+        next_state = rows[start + step + 1:start + step + 1 + window]
+        if done:
+            memory.push(state, i % 3, 0.1, next_state, False)
+        else:
+            memory.push(state, i % 3, 0.1, next_state)
+
+
+def bench_frames(args):
+    window = args.window_shape[0]
+    rows = np.random.randn(10000, args.window_shape[1])
+    for capacity in args.capacity:
+        for frames in (False, True):
+            name = f'ArrayReplayBuffer({capacity}, frames={frames})'
+            # 20 x 52 float32 full windows are 8.3GB at 1M, numpy would only find out
+            #     once the pages are touched
+            full_windows = 2 * capacity * np.prod(args.window_shape) * 4
+            if not frames and full_windows > args.max_gb * 2 ** 30:
+                print('{:<50}: skipped, would take {:.1f} GB'.format(name, full_windows / 2 ** 30))
+                continue
+            memory = ArrayReplayBuffer(capacity, frames=frames)
+            start = time.perf_counter()
+            push_episodes(memory, rows, capacity, args.episode_length, window)
+            print('{:<50}: {:>10.2f} us/push, {:>10.1f} MB for {} transitions'.format(
+                name, (time.perf_counter() - start) / capacity * 1e6, memory.nbytes() / 2 ** 20,
+                len(memory)))
+            for batch_size in args.batch_size:
+                def sample(num_steps):
+                    for _ in range(num_steps):
+                        memory.sample(batch_size)
+
+                report(f'{name}.sample({batch_size})', timeit(sample, args.num_steps), 'batch')
+            del memory
+
+
+def bench_mapped(args):
+    # Memory-mapped buffers: opening one costs the same at any size, pages come in on sampling
+    states = state_pool(args)
+    for capacity in args.capacity:
+        with tempfile.TemporaryDirectory(dir=args.tmp_dir) as path:
+            memory = ArrayReplayBuffer(capacity, path=path)
+            start = time.perf_counter()
+            fill(memory, states, capacity)
+            memory.sync()
+            print('{:<50}: {:>10.2f} us/push, {:>10.1f} MB on disk'.format(
+                f'ArrayReplayBuffer({capacity}, path) filled', (time.perf_counter() - start) / capacity
+                * 1e6, sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+                / 2 ** 20))
+            del memory
+
+            start = time.perf_counter()
+            memory = ArrayReplayBuffer(capacity, path=path)
+            print('{:<50}: {:>10.2f} ms, {} transitions'.format(
+                f'ArrayReplayBuffer({capacity}, path) resumed', (time.perf_counter() - start) * 1e3,
+                len(memory)))
+            for batch_size in args.batch_size:
+                def sample(num_steps):
+                    for _ in range(num_steps):
+                        memory.sample(batch_size)
+
+                report(f'ArrayReplayBuffer({capacity}, path).sample({batch_size})',
+                       timeit(sample, args.num_steps), 'batch')
+            del memory
+
+
+def legacy_batch_to_tensor(given_batch, action_batch=False):
+    # A tensor per sample, then torch.cat, what train_dqn used to do
+    dtype = torch.long if action_batch else torch.float32
+    batch = list(map(lambda x: torch.tensor(x, device=device, dtype=dtype
+                                            ).unsqueeze(0), given_batch))
+    return torch.cat(batch, 0)
+
+
+def bench_train(args):
+    # Updates per second of train_dqn and train_ddpg on StockExchange sized windows
+    window, num_features = args.window_shape
+    rows = np.random.randn(10000, num_features)
+    capacity = min(args.capacity)
+    torch.set_num_threads(1)
+
+    policy, target = DuelingDQN(num_features, 3).to(device), DuelingDQN(num_features, 3).to(device)
+    optimizer = torch.optim.RMSprop(policy.parameters())
+    for batch_size in args.batch_size:
+        for name, memory in [('ReplayMemory, per sample tensors', ReplayMemory(capacity)),
+                             ('ReplayMemory', ReplayMemory(capacity)),
+                             ('ArrayReplayBuffer', ArrayReplayBuffer(capacity)),
+                             ('ArrayReplayBuffer, frames', ArrayReplayBuffer(capacity, frames=True)),
+                             ('PrioritizedReplayBuffer', PrioritizedReplayBuffer(capacity))]:
+            push_episodes(memory, rows, capacity, args.episode_length, window,
+                          not isinstance(memory, ReplayMemory))
+            batch_to_tensor = train.batch_to_tensor
+            if name.endswith('per sample tensors'):
+                train.batch_to_tensor = legacy_batch_to_tensor
+
+            def update(num_steps):
+                for _ in range(num_steps):
+                    train_dqn(policy, target, memory, batch_size, optimizer, 0.9, True)
+
+            report(f'train_dqn({batch_size}), {name}', timeit(update, args.num_updates), 'update')
+            train.batch_to_tensor = batch_to_tensor
+            del memory
+
+    ddpg_args = argparse.Namespace(actor_learning_rate=1e-4, critic_learning_rate=1e-3,
+                                   gamma=0.99, tau=1e-4)
+    num_actions = num_features // 4
+    action_space = gym.spaces.Box(-1.0, 1.0, (num_actions, ), np.float32)
+    ddpg = DDPG((window, num_features), args.hidden_dim, num_actions,
+                argparse.Namespace(action_space=action_space), ddpg_args).to(device)
+    for batch_size in args.batch_size:
+        for name, memory in [('ReplayBuffer', ReplayBuffer(capacity)),
+                             ('ArrayReplayBuffer', ArrayReplayBuffer(capacity)),
+                             ('PrioritizedReplayBuffer', PrioritizedReplayBuffer(capacity))]:
+            for i in range(capacity):
+                start = i % (len(rows) - window - 1)
+                memory.push(rows[start:start + window], np.random.uniform(-1, 1, num_actions),
+                            0.1, rows[start + 1:start + 1 + window], False)
+
+            def update(num_steps):
+                for _ in range(num_steps):
+                    train_ddpg(ddpg, memory, batch_size)
+
+            report(f'train_ddpg({batch_size}), {name}', timeit(update, args.num_updates), 'update')
+            del memory
+
+
+def legacy_soft_update(source, target, tau):
+    # What Update.soft_update used to do, two temporaries per parameter
+    for target_param, source_param in zip(target.parameters(), source.parameters()):
+        target_param.data.copy_(target_param.data * (1.0 - tau) + source_param.data * tau)
+
+
+def bench_target(args):
+    # Target network updates of the DDPG Actor / Critic and the DuelingDQN, train_ddpg
+    #     does both soft updates on every step
+    torch.set_num_threads(1)
+    window, num_features = args.window_shape
+    num_actions = num_features // 4
+    for name, make in [('Actor', lambda: Actor((window, num_features), args.hidden_dim, num_actions)),
+                       ('Critic', lambda: Critic((window, num_features), args.hidden_dim,
+                                                 num_actions)),
+                       ('DuelingDQN', lambda: DuelingDQN(num_features, 3))]:
+        source, target = make().to(device), make().to(device)
+        num_parameters = sum(parameter.numel() for parameter in source.parameters())
+
+        def run(update):
+            def steps(num_steps):
+                for _ in range(num_steps):
+                    update()
+                if device.type == 'cuda':
+                    torch.cuda.synchronize()
+            return timeit(steps, args.num_steps)
+
+        label = f'{name}({num_parameters} parameters)'
+        report(f'{label} soft_update, per parameter',
+               run(lambda: legacy_soft_update(source, target, 1e-3)), 'update')
+        report(f'{label} soft_update, foreach lerp',
+               run(lambda: Update.soft_update(source, target, 1e-3)), 'update')
+        report(f'{label} hard_update, load_state_dict',
+               run(lambda: target.load_state_dict(source.state_dict())), 'update')
+        report(f'{label} hard_update, foreach copy',
+               run(lambda: Update.hard_update(source, target)), 'update')
+
+
+def bench_act(args):
+    # One state per env step: the whole window through the recurrent layer, as act and
+    #     select_action used to, against the newest row only
+    torch.set_num_threads(1)
+    window, num_features = args.window_shape
+    num_actions = num_features // 4
+    states = state_pool(argparse.Namespace(state_shape=args.window_shape), 64)
+    policy = DuelingDQN(num_features, 3).to(device)
+    actor = Actor((window, num_features), args.hidden_dim, num_actions).to(device)
+
+    def legacy_act(state):
+        x = torch.tensor(np.array([state]), dtype=torch.float32, device=device)
+        return policy.advantage(policy.forward_feature(x)).detach().argmax().item()
+
+    def legacy_select_action(state):
+        actor.eval()
+        action = actor(torch.FloatTensor(state).unsqueeze(0).to(device)).detach().cpu().numpy()[0]
+        actor.train()
+        return action
+
+    for name, act in [('DuelingDQN.act, whole window', legacy_act),
+                      ('DuelingDQN.act, newest row', lambda state: policy.act(state, 0.0)),
+                      ('Actor.select_action, whole window', legacy_select_action),
+                      ('Actor.select_action, newest row', actor.select_action)]:
+        def steps(num_steps):
+            for i in range(num_steps):
+                act(states[i % len(states)])
+
+        report(name, timeit(steps, args.num_steps), 'action')
+
+
+BENCHMARKS = {
+    'push': bench_push,
+    'sample': bench_sample,
+    'prioritized': bench_prioritized,
+    'frames': bench_frames,
+    'mapped': bench_mapped,
+    'train': bench_train,
+    'target': bench_target,
+    'act': bench_act,
+}
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    for name, bench in BENCHMARKS.items():
+        if args.bench in ('all', name):
+            bench(args)
@@ -8,4 +8,14 @@ register(
 register(
     id='game-stock-exchange-continuous-v0',
     entry_point='gym_exchange.envs:StockExchangeContinuous',
+)
+
+register(
+    id='game-stock-exchange-minute-v0',
+    entry_point='gym_exchange.envs:MinuteExchange',
+)
+
+register(
+    id='game-stock-exchange-minute-continuous-v0',
+    entry_point='gym_exchange.envs:MinuteExchangeContinuous',
 )
\ No newline at end of file
@@ -1,2 +1,7 @@
+from gym_exchange.envs.episode_sampler import EpisodeSampler
 from gym_exchange.envs.stock_exchange import StockExchange
 from gym_exchange.envs.stock_exchange_continuous import StockExchangeContinuous
+from gym_exchange.envs.minute_exchange import MinuteExchange, MinuteExchangeContinuous
+from gym_exchange.envs.trajectory_recorder import TrajectoryRecorder, TrajectoryReader
+from gym_exchange.envs.vec_stock_exchange import VecStockExchange, VecStockExchangeContinuous
+from gym_exchange.envs.subproc_vec_stock_exchange import SubprocVecStockExchange, SubprocVecStockExchangeContinuous
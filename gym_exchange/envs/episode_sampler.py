@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class EpisodeSampler:
+    strategies = ('random', 'stratified')
+    splits = ('train', 'validation')
+
+    def __init__(self, dates, episode_days, strategy='random', validation_date=None,
+                 num_strata=10, max_start=None, seed=None):
+        '''
+        Draws the first day of each episode over the loaded history
+
+        An episode touches episode_days rows, its start is an offset into `dates`.
+        With a validation_date, train episodes end before it and validation episodes
+        start on or after it, so no day is shared between the two.
+
+        :param dates: datetime64 dates of the loaded rows, e.g. TickerPanel.dates
+        :param episode_days: rows an episode touches, warm-up and done step included
+        :param strategy: 'random' draws uniformly, 'stratified' cuts the starts into
+                         num_strata bins and goes through them in shuffled rounds
+        :param validation_date: e.g. '2017-01-01', None keeps every start in train
+        :param num_strata: number of bins for 'stratified'
+        :param max_start: latest start for train, None goes as late as the data allows
+        :param seed: seeds the draws
+        '''
+        assert strategy in self.strategies, f'strategy must be one of {self.strategies}'
+        self.strategy = strategy
+        self.num_strata = num_strata
+        self.random = np.random.RandomState(seed)
+
+        last_start = len(dates) - episode_days
+        assert last_start >= 0, f'{len(dates)} days is not enough for a {episode_days} day episode'
+        if validation_date is None:
+            split = len(dates)
+        else:
+            split = int(np.searchsorted(dates, np.datetime64(validation_date, 'D')))
+
+        # Inclusive (first, last) start per split
+        self.bounds = {'train': (0, min(split - episode_days, last_start)),
+                       'validation': (split, last_start)}
+        if max_start is not None:
+            self.bounds['train'] = (0, min(max_start, self.bounds['train'][1]))
+        self._strata = {split: [] for split in self.splits}
+
+    def num_starts(self, split='train'):
+        first, last = self.bounds[split]
+        return max(0, last - first + 1)
+
+    def _stratum(self, split):
+        # Next bin of the current round, a new shuffled round once all were used
+        if not self._strata[split]:
+            self._strata[split] = list(self.random.permutation(self.num_strata))
+        return self._strata[split].pop()
+
+    def sample(self, split='train', size=None):
+        '''
+        :param split: 'train' or 'validation'
+        :param size: number of starts, None for a single int
+        :return: start offsets into dates
+        '''
+        assert self.num_starts(split) > 0, f'No {split} episodes fit, check validation_date'
+        first, last = self.bounds[split]
+        if self.strategy == 'random':
+            return self.random.randint(first, last + 1, size)
+
+        edges = np.linspace(first, last + 1, self.num_strata + 1)
+        strata = [self._stratum(split) for _ in range(1 if size is None else size)]
+        starts = [self.random.randint(int(edges[s]), max(int(edges[s + 1]), int(edges[s]) + 1))
+                  for s in strata]
+        return starts[0] if size is None else np.array(starts)
+
+    def __repr__(self):
+        return f'EpisodeSampler({self.strategy}, train: {self.bounds["train"]}, ' \
+               f'validation: {self.bounds["validation"]})'
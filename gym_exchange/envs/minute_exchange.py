@@ -0,0 +1,169 @@
+import gym
+import gym.spaces as spaces
+from gym_exchange.gym_engine import EpisodeStats
+from gym_exchange.gym_engine.market_data import CLOSE
+from gym_exchange.gym_engine.minute_data import MINUTE_PATH, MinuteStream
+import numpy as np
+
+
+class MinuteExchange(gym.Env):
+    '''
+    StockExchange on the minute bars of data/daily_data, streamed a few days at a time
+
+    Only the rows of the episode being played and the chunk after them are kept, the
+    next chunks are read in the background by MinuteStream. Episodes follow each other
+    through the stream: the window of a new episode ends where the last one stopped,
+    and once the stream runs out it starts over from the first day.
+
+    Rewards and done follow StockExchange, the warm-up does not. StockExchange fast
+    forwards the days that fill its first window, num_state_space - 1 of them
+    (num_days_in_state - 1 in StockExchangeContinuous), and they count toward
+    num_days_to_iterate. Here the first window is the num_minutes_in_state minutes
+    before the episode, taken straight from the data, so no minute is spent on it:
+    a first step paying nothing, num_minutes_to_iterate steps paying position * close
+    delta, then the step that reports done. Actions are an index per ticker into
+    linspace(action_space_min, action_space_max, num_action_space).
+    '''
+    metadata = {'render.modes': []}
+
+    # File names are lower case, e.g. data/daily_data/20181010_aapl
+    tickers = ['aapl', 'amd', 'msft']
+    minute_path = MINUTE_PATH
+    # yyyymmdd, first day inclusive, last one exclusive, None for all
+    date_starting = None
+    date_ending = None
+    # A trading day is 390 minutes
+    num_minutes_to_iterate = 390
+    num_minutes_in_state = 30
+    # Days read at once, and whether the next ones are read in the background
+    days_per_chunk = 5
+    prefetch = True
+    # Per ticker, must be odd to have a no action index
+    num_action_space = 3
+    action_space_min = -1.0
+    action_space_max = 1.0
+    # For each ticker state: ohlc
+    num_state_per_ticker = 4
+
+    def __init__(self, seed=None):
+        self._seed = seed
+        self.stream = MinuteStream(self.tickers, self.minute_path, self.date_starting,
+                                   self.date_ending, self.days_per_chunk, self.prefetch)
+        self.action_space = self.get_action_space()
+        self.observation_space = spaces.Box(-1.0, 1.0,
+                                            (self.num_minutes_in_state,
+                                             len(self.tickers) * self.num_state_per_ticker),
+                                            dtype=np.float32)
+        # Warm-up window, the steps and the done step
+        self.episode_rows = self.num_minutes_in_state + self.num_minutes_to_iterate + 1
+
+        self.chunks = None
+        self.epoch = -1
+        self._restart()
+        self.current_position = np.zeros(len(self.tickers))
+        self.stats = EpisodeStats(len(self.tickers))
+        self.reset()
+
+    def get_action_space(self):
+        assert self.num_action_space % 2 != 0, 'NUM_ACTION_SPACE MUST BE ODD TO HAVE NO ACTION INDEX'
+        self.position_space = np.linspace(self.action_space_min, self.action_space_max,
+                                          self.num_action_space)
+        return spaces.MultiDiscrete([self.num_action_space] * len(self.tickers))
+
+    def positions(self, actions):
+        return self.position_space[np.asarray(actions)]
+
+    def _restart(self):
+        # From the first day again, the rows left over do not line up with it
+        if self.chunks is not None:
+            self.chunks.close()
+        self.chunks = iter(self.stream)
+        self.epoch += 1
+        # Stream row of buffer row 0
+        self.offset = 0
+        self.features = np.empty((0, len(self.tickers) * self.num_state_per_ticker))
+        self.close_delta = np.empty((0, len(self.tickers)))
+        self.days = np.empty(0, dtype=np.int64)
+        self.today = self.start = self.num_minutes_in_state - 1
+
+    def _extend(self, num_rows):
+        '''
+        Makes sure rows [first, first + num_rows) are loaded, first being where the window
+        of the episode starts. Rows before it are dropped on the way
+
+        :return: False once the stream ran out
+        '''
+        first = self.start - self.num_minutes_in_state + 1
+        while len(self.close_delta) - first < num_rows:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return False
+            _, deltas, days = chunk
+            # Ohlc deltas per ticker, the same row StockExchange windows are made of
+            features = deltas[:, :, :CLOSE + 1].reshape(len(deltas), -1)
+            self.features = np.concatenate([self.features[first:], features])
+            self.close_delta = np.concatenate([self.close_delta[first:], deltas[:, :, CLOSE]])
+            self.days = np.concatenate([self.days[first:], days])
+            self.offset += first
+            self.today -= first
+            self.start -= first
+            first = 0
+        self.features.flags.writeable = False
+        return True
+
+    def reset(self):
+        # The window of the next episode ends where the last one stopped
+        self.start = self.today
+        if not self._extend(self.episode_rows):
+            self._restart()
+            assert self._extend(self.episode_rows), \
+                f'{len(self.stream.dates)} days of minute data is not enough for one episode'
+        self.current_position[:] = 0.0
+        self.stats.reset()
+        self.state = self.get_window()
+        return self.state
+
+    def step(self, actions):
+        if self.today - self.start > self.num_minutes_to_iterate:
+            self.current_position[:] = 0.0
+            info = {'score': 0.0, 'stats': self.stats,
+                    'episode': self.stats.episode_summary(self.tickers)}
+            return self.state, 0.0, True, info
+
+        if self.today == self.start:
+            rewards = np.zeros(len(self.tickers))
+        else:
+            rewards = self.current_position * self.close_delta[self.today]
+        self.current_position[:] = self.positions(actions)
+        self.today += 1
+        self.stats.update(rewards, self.current_position)
+
+        reward = rewards.sum()
+        self.state = self.get_window()
+        # The running EpisodeStats, as StockExchange.step gives it
+        return self.state, reward, False, {'score': reward, 'stats': self.stats}
+
+    def get_window(self):
+        # Rows up to and including today, a read-only view
+        return self.features[self.today - self.num_minutes_in_state + 1:self.today + 1]
+
+    @property
+    def date(self):
+        # yyyymmdd of today
+        return self.stream.dates[self.days[self.today]]
+
+    def close(self):
+        self.chunks.close()
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.stream!r}, epoch: {self.epoch})'
+
+
+class MinuteExchangeContinuous(MinuteExchange):
+    # Actions are the positions themselves
+    def get_action_space(self):
+        return spaces.Box(self.action_space_min, self.action_space_max,
+                          (len(self.tickers), ), np.float32)
+
+    def positions(self, actions):
+        return np.asarray(actions, dtype=np.float64)
@@ -1,12 +1,12 @@
 import gym
 import gym.spaces as spaces
-from gym_exchange.gym_engine import Engine, Portfolio
+from gym_exchange.envs.episode_sampler import EpisodeSampler
+from gym_exchange.gym_engine import RenderRecorder, Engine, Portfolio
 import numpy as np
-import pandas as pd
 
 
 class StockExchange(gym.Env):
-    metadata = {'render.modes': ['human']}
+    metadata = {'render.modes': ['human', 'file']}
 
     # Keep tickers in a list or an iterable...
     tickers = ['aapl', 'amd', 'msft', 'intc', 'd', 'sbux', 'atvi',
@@ -20,7 +20,26 @@ class StockExchange(gym.Env):
     # no_action_index is truly no_action only if it's not a Portfolio
     no_action_index = num_action_space//2
     today = 0
-    render = False
+    # Not `render`, the render() method below would shadow it and always open a figure
+    render_on_init = False
+    # 'human' draws on screen on every render(), 'file' only records and writes figures to
+    #     render_path from a background thread, see RenderRecorder
+    render_mode = 'human'
+    render_path = 'render'
+    render_interval = 10.0
+    render_format = 'png'
+    # Step all tickers at once on a panel, see TickerPanel
+    vectorized = True
+    # Episodes start up to this many days after start_date, drawn on every reset.
+    #     0 always starts at start_date, needs vectorized otherwise
+    random_start_offset = 0
+    # 'random' or 'stratified' episode starts over the whole history, see EpisodeSampler.
+    #     Episodes then come from `split`, 'train' or 'validation' around validation_date
+    episode_sampling = None
+    validation_date = None
+    split = 'train'
+    # MarketStore path, e.g. 'iexfinance/iexbin', to map the data instead of parsing csvs
+    market_store = None
     # set to None when not using Portfolio
     action_space_min = 0.0
     action_space_max = 1.0
@@ -32,49 +51,85 @@ class StockExchange(gym.Env):
         # Could manually throw in options eventually...
         self.portfolio = self.num_action_space > 1
         self._seed = seed
+        self.recorder = RenderRecorder(self.tickers, self.render_path, self.render_interval,
+                                       self.render_format) if self.render_mode == 'file' else None
 
         if self.portfolio:
             assert self.action_space_min is not None
             assert self.action_space_max is not None
             self.env = Portfolio(self.tickers, self.start_date, self.num_days_to_iterate,
-                                 self.today, seed, render=self.render,
+                                 self.today, seed, render=self.render_on_init,
                                  action_space_min=self.action_space_min,
-                                 action_space_max=self.action_space_max)
+                                 action_space_max=self.action_space_max,
+                                 vectorized=self.vectorized, store=self.market_store,
+                                 recorder=self.recorder)
         else:
             assert self.num_action_space > 2, 'NUM_ACTION_SPACE SHOULD BE GREATER THAN 2'
             assert self.num_action_space % 2 != 0, 'NUM_ACTION_SPACE MUST BE ODD TO HAVE NO ACTION INDEX'
             self.env = Engine(self.tickers, self.start_date, self.num_days_to_iterate,
                               self.today, seed,
-                              num_action_space=self.num_action_space, render=self.render)
+                              num_action_space=self.num_action_space, render=self.render_on_init,
+                              vectorized=self.vectorized, store=self.market_store,
+                              recorder=self.recorder)
 
         self.action_space = spaces.Box(self.action_space_min, self.action_space_max, (self.num_action_space,))
         # self.action_space = spaces.Discrete(self.env.moves_available())
-        self.observation_space = spaces.Box(-1.0, 1.0, (self.num_state_space, self.num_action_space), dtype=np.float)
+        self.observation_space = spaces.Box(-1.0, 1.0, (self.num_state_space, self.num_action_space), dtype=np.float32)
+        self.features = self.get_features()
         self.state = self.get_running_state()
+        # Leaves room for the whole episode and its done step
+        assert 0 <= self.random_start_offset <= len(self.features) - self.num_state_space - self.num_days_to_iterate - 1, \
+            f'random_start_offset {self.random_start_offset} runs past the data'
+        self.sampler = self.get_sampler(seed)
         self.reset()
 
     def step(self, actions):
         # I can fix Engine to return state from `self.env.step(action)`
         reward, ended = self.env.step(actions)
-        self.state = self.add_new_state(self.env.get_state())
-        return self.state, reward, ended, {'score': reward}
+        self.state = self.get_window()
+        # The running EpisodeStats itself, nothing is computed unless it is read, e.g.
+        #     info['stats'].portfolio(). It keeps changing, read it before the next step
+        info = {'score': reward, 'stats': self.env.stats}
+        if ended:
+            # Per ticker and portfolio metrics of the whole episode
+            info['episode'] = self.env.stats.episode_summary([ticker.ticker for ticker in self.env.tickers])
+        return self.state, reward, ended, info
+
+    def get_sampler(self, seed=None):
+        if not (self.episode_sampling or self.random_start_offset):
+            return None
+        assert self.env.panel is not None, 'Sampling episode starts needs vectorized=True'
+        return EpisodeSampler(self.env.panel.dates, self.num_days_to_iterate + 2,
+                              strategy=self.episode_sampling or 'random',
+                              validation_date=self.validation_date,
+                              max_start=self.random_start_offset or None, seed=seed)
 
     def reset(self):
-        self.env.reset_game()
+        # Only moves the cursor, the data stays loaded
+        start = 0 if self.sampler is None else self.sampler.sample(self.split)
+        if self.recorder is not None:
+            self.recorder.end_episode()
+        self.env.reset_game(start)
         self._initialize_state()
         return self.state
 
     def render(self, mode='human', close=False):
         self.env.render()
 
+    def close(self):
+        if self.recorder is not None:
+            self.recorder.close()
+
     def _initialize_state(self):
-        for _ in range(self.num_state_space - 1):
-            if self.portfolio:
-                random_moves = np.random.randint(0, self.moves_available())
-                next_state, reward, done, _ = self.step(random_moves)
-            else:
-                next_state, reward, done, _ = self.step([self.no_action_index] * self.num_action_space)
-                assert reward == 0.0, f'Reward is somehow {reward}'
+        # Warm-up: num_state_space - 1 days holding one random portfolio move, or no action
+        #     on every ticker, jumped over in one go. The window then comes straight out of
+        #     the features
+        if self.portfolio:
+            actions = self.env.action_indices(np.random.randint(0, self.moves_available()))
+        else:
+            actions = [self.no_action_index] * self.num_action_space
+        self.env.fast_forward(self.num_state_space - 1, actions)
+        self.state = self.get_window()
 
     def moves_available(self):
         return self.env.moves_available()
@@ -85,23 +140,15 @@ class StockExchange(gym.Env):
     def get_running_state(self):
         return np.zeros((self.num_state_space, self.num_state_per_ticker * self.num_action_space))
 
-    def add_new_state(self, new_states_to_add):
-        assert isinstance(new_states_to_add, list), type(new_states_to_add)
-        # Disregarding the last elem in each state because it's the holdings...
-        # Maybe just get rid of that altogether?
-        new_states = np.array([state[:-1].tolist() for state in new_states_to_add]).flatten()
-
-        running_state_orig = self.state
-        running_state = pd.DataFrame(running_state_orig).shift(-1)
-
-        # Assign new price to index == last_elem - 1
-        running_state.iloc[-1] = new_states.squeeze()
-
-        # Deprecated...
-        # running_state.iloc[-2] = new_state_to_add.item(0)
-        # Assign new position to index == last_elem
-        # running_state.iloc[-1] = new_state_to_add.item(1)
-
-        assert len(running_state_orig) == len(running_state)
-        return np.array(running_state)
-
+    def get_features(self):
+        # Windows are views into this matrix, so it must never change underneath them
+        #     The first num_state_space - 1 rows are the zeros the running state starts with
+        features = self.env.get_features()
+        features = np.vstack([np.zeros((self.num_state_space - 1, features.shape[1])), features])
+        features.flags.writeable = False
+        return features
+
+    def get_window(self):
+        # Rows up to and including today, a read-only view, no copy per step
+        today = self.env.today
+        return self.features[today:today + self.num_state_space]
@@ -0,0 +1,176 @@
+import multiprocessing as mp
+import traceback
+import numpy as np
+from gym_exchange.envs.stock_exchange import StockExchange
+from gym_exchange.envs.stock_exchange_continuous import StockExchangeContinuous
+
+
+def _as_array(raw_array, dtype, shape):
+    return np.frombuffer(raw_array, dtype=dtype).reshape(shape)
+
+
+def _worker(pipe, env_cls, seeds, indices, buffers, worker_seed):
+    '''
+    Steps its share of the envs, writing observations, rewards and dones straight
+    into the shared buffers. Only infos, which are small, go back through the pipe.
+    Every reply is ('ok', data), or ('error', traceback) after which the worker exits.
+    '''
+    # Forked workers inherit the parent's global RNG, which drives the warm-up moves
+    np.random.seed(worker_seed)
+    observations, rewards, dones = [_as_array(*buffer) for buffer in buffers]
+
+    try:
+        envs = [env_cls(seed) for seed in seeds]
+        while True:
+            command, data = pipe.recv()
+            if command == 'step':
+                infos = []
+                for env, i, action in zip(envs, indices, data):
+                    observation, reward, done, info = env.step(action)
+                    # The worker's running EpisodeStats, pickling it every step costs more
+                    #     than the step. info['episode'] still comes with the done step
+                    info.pop('stats', None)
+                    if done:
+                        info['terminal_observation'] = np.array(observation)
+                        observation = env.reset()
+                    observations[i] = observation
+                    rewards[i] = reward
+                    dones[i] = done
+                    infos += [info]
+                pipe.send(('ok', infos))
+            elif command == 'reset':
+                for env, i in zip(envs, indices):
+                    observations[i] = env.reset()
+                pipe.send(('ok', None))
+            elif command == 'close':
+                break
+            else:
+                raise NotImplementedError(command)
+    except KeyboardInterrupt:
+        pass
+    except Exception:
+        # The parent raises it at its next recv, instead of an EOFError
+        pipe.send(('error', traceback.format_exc()))
+    finally:
+        pipe.close()
+
+
+class SubprocVecStockExchange:
+    '''
+    num_envs StockExchange episodes spread over num_workers processes
+
+    Observations, rewards and dones live in shared memory, workers write them in
+    place and the parent only sends actions and receives the small info dicts.
+    step() is step_async() followed by step_wait(), so the caller can do other work,
+    e.g. a learner update, while the workers step.
+
+    One env is built in the parent to learn the observation shape and action space.
+    An exception in a worker closes all of them and is raised again by the reset() or
+    step_wait() waiting on it, as a RuntimeError holding the worker's traceback.
+    '''
+    env_cls = StockExchange
+
+    def __init__(self, num_envs, num_workers=None, seed=None, start_method=None):
+        '''
+        :param num_envs: number of episodes running side by side
+        :param num_workers: processes to spread them over, defaults to the cpu count
+        :param seed: env i gets seed + i, worker w seeds numpy with seed + w
+        :param start_method: multiprocessing start method, platform default if None
+        '''
+        num_workers = min(num_envs, num_workers or mp.cpu_count())
+        self.num_envs = num_envs
+        self.num_workers = num_workers
+
+        probe = self.env_cls(seed)
+        self.observation_shape = probe.get_window().shape
+        self.action_space = probe.action_space
+        self._moves_available = probe.moves_available() if hasattr(probe, 'moves_available') else None
+        del probe
+
+        context = mp.get_context(start_method)
+        buffers = [(context.RawArray('d', num_envs * int(np.prod(self.observation_shape))),
+                    np.float64, (num_envs, ) + self.observation_shape),
+                   (context.RawArray('d', num_envs), np.float64, (num_envs, )),
+                   (context.RawArray('b', num_envs), np.bool_, (num_envs, ))]
+        self.observations, self.rewards, self.dones = [_as_array(*buffer) for buffer in buffers]
+
+        self.worker_indices = np.array_split(np.arange(num_envs), num_workers)
+        self.pipes, self.processes = [], []
+        for w, indices in enumerate(self.worker_indices):
+            seeds = [None if seed is None else seed + i for i in indices]
+            worker_seed = None if seed is None else seed + w
+            parent_pipe, child_pipe = context.Pipe()
+            process = context.Process(target=_worker,
+                                      args=(child_pipe, self.env_cls, seeds, indices,
+                                            buffers, worker_seed),
+                                      daemon=True)
+            process.start()
+            child_pipe.close()
+            self.pipes += [parent_pipe]
+            self.processes += [process]
+
+        self.waiting = False
+        self.closed = False
+
+    def moves_available(self):
+        return self._moves_available
+
+    def _receive(self):
+        # One reply from every worker, so none is left waiting in a pipe when one failed
+        replies = [pipe.recv() for pipe in self.pipes]
+        self.waiting = False
+        for w, (status, data) in enumerate(replies):
+            if status == 'error':
+                self.close()
+                raise RuntimeError(f'Worker {w} failed:\n{data}')
+        return [data for _, data in replies]
+
+    def reset(self):
+        for pipe in self.pipes:
+            pipe.send(('reset', None))
+        self._receive()
+        return self.observations.copy()
+
+    def step_async(self, actions):
+        assert not self.waiting, 'step_wait() must be called before the next step_async()'
+        for pipe, indices in zip(self.pipes, self.worker_indices):
+            pipe.send(('step', [actions[i] for i in indices]))
+        self.waiting = True
+
+    def step_wait(self):
+        '''
+        :return: observations, rewards, dones, infos; copies, the shared buffers are
+                 overwritten by the next step
+        '''
+        infos = [info for worker_infos in self._receive() for info in worker_infos]
+        return self.observations.copy(), self.rewards.copy(), self.dones.copy(), infos
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self.step_wait()
+        for pipe in self.pipes:
+            # A worker that failed is gone already
+            try:
+                pipe.send(('close', None))
+            except BrokenPipeError:
+                pass
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def __len__(self):
+        return self.num_envs
+
+    def __del__(self):
+        if not getattr(self, 'closed', True):
+            self.close()
+
+
+class SubprocVecStockExchangeContinuous(SubprocVecStockExchange):
+    env_cls = StockExchangeContinuous
@@ -0,0 +1,318 @@
+import json
+import os
+import queue
+import threading
+import zipfile
+import gym
+import numpy as np
+
+
+MANIFEST = 'manifest.json'
+EPISODES = 'episodes.jsonl'
+
+
+class TrajectoryRecorder(gym.Wrapper):
+    def __init__(self, env, path, chunk_size=4096, compress=True, info_keys=('score', )):
+        '''
+        Records every transition of env into chunked columnar files, see TrajectoryReader
+
+        step() copies (obs, action, reward, done and the info_keys of info) into
+        preallocated chunk_size rows, a full chunk is handed to a background thread that
+        writes it while the next one fills up. Each chunk is `chunk_<n>.npz`, deflate
+        level 1, or with compress=False a `chunk_<n>` directory of one .npy per column
+        that can be memory-mapped back. info['episode'] of the done steps goes to
+        episodes.jsonl. The writer only blocks step() when it falls a whole chunk behind,
+        nothing is dropped.
+
+        Windows are most of the bytes, and the window of a step is the one before it
+        moved by a row. So when obs has more than one dimension only its newest row is
+        kept per step, plus the whole window where it does not follow on from the one
+        before: after a reset and at the start of a chunk (window_index, window_obs).
+        In the same way the next obs of a step is the obs of the step after it, it is
+        only kept for the last row before a reset and the last row of a chunk
+        (terminal_index, terminal_obs). TrajectoryReader puts obs and next_obs back
+        together.
+
+        :param env: StockExchange like env, old step API: obs, reward, done, info
+        :param path: directory for the files, created if missing, must not hold chunks yet
+        :param chunk_size: rows per chunk
+        :param compress: npz with zlib, or mappable .npy files
+        :param info_keys: numeric info entries to keep as columns
+        '''
+        super().__init__(env)
+        self.path = path
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.info_keys = tuple(info_keys)
+        os.makedirs(path, exist_ok=True)
+        assert not any(name.startswith('chunk_') for name in os.listdir(path)), \
+            f'{path} already holds a recording'
+
+        self.columns = None
+        self.obs_shape = None
+        self.rows = 0
+        self.num_chunks = 0
+        self.chunk_rows = []
+        self.episode = 0
+        self.episode_step = 0
+        self.last_obs = None
+        # Obs of the previous row of the chunk, None when the next one starts a window
+        self.prev_obs = None
+        # Row in the chunk -> its whole window / its next obs, see above
+        self.windows = {}
+        self.terminals = {}
+        self.errors = []
+
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def reset(self, **kwargs):
+        if self.rows:
+            self.terminals.setdefault(self.rows - 1, np.array(self.last_obs))
+        # Cut short before done, the next one is a new episode all the same
+        if self.episode_step:
+            self.episode += 1
+        self.prev_obs = None
+        self.last_obs = self.env.reset(**kwargs)
+        self.episode_step = 0
+        return self.last_obs
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        row = {'obs': self.last_obs, 'action': action, 'reward': reward, 'done': done,
+               'episode': self.episode, 'step': self.episode_step}
+        for key in self.info_keys:
+            row[key] = info.get(key, np.nan)
+        # Before _append, a full chunk keeps it as the next obs of its last row
+        self.last_obs = obs
+        self._append(row)
+
+        if done and 'episode' in info:
+            self.queue_episode(self.episode, info['episode'])
+        self.episode_step += 1
+        if done:
+            self.episode += 1
+            self.episode_step = 0
+        return obs, reward, done, info
+
+    def _allocate(self, row):
+        # Column dtypes and shapes come from the first row
+        if self.columns is None:
+            self.obs_shape = np.shape(row['obs'])
+            self.columns = {name: (np.asarray(value).dtype.str, np.shape(value))
+                            for name, value in row.items()}
+            if self.framed():
+                self.columns['obs'] = (self.columns['obs'][0], self.obs_shape[1:])
+        return {name: np.empty((self.chunk_size, ) + shape, dtype=dtype)
+                for name, (dtype, shape) in self.columns.items()}
+
+    def framed(self):
+        return len(self.obs_shape) > 1
+
+    def _append(self, row):
+        if self.rows == 0:
+            self.chunk = self._allocate(row)
+        obs, rows = row.pop('obs'), self.rows
+        if self.framed():
+            if self.prev_obs is None or not np.array_equal(obs[:-1], self.prev_obs[1:]):
+                self.windows[rows] = np.array(obs)
+            self.prev_obs = obs
+            self.chunk['obs'][rows] = obs[-1]
+        else:
+            self.chunk['obs'][rows] = obs
+        for name, value in row.items():
+            self.chunk[name][rows] = value
+        self.rows += 1
+        if self.rows == self.chunk_size:
+            self.flush()
+
+    @staticmethod
+    def _sparse(rows, name):
+        # {row: obs} as a sorted index and the stacked obs
+        index = sorted(rows)
+        return {f'{name}_index': np.array(index, dtype=np.int64),
+                f'{name}_obs': np.stack([rows[row] for row in index])}
+
+    def flush(self, block=False):
+        '''
+        Hands the rows so far to the writer as a chunk, even if it is not full
+
+        :param block: wait until everything is on disk
+        '''
+        if self.rows:
+            chunk = {name: column[:self.rows] for name, column in self.chunk.items()}
+            self.terminals.setdefault(self.rows - 1, np.array(self.last_obs))
+            chunk.update(self._sparse(self.terminals, 'terminal'))
+            if self.framed():
+                chunk.update(self._sparse(self.windows, 'window'))
+            self._put(('chunk', self.num_chunks, chunk))
+            self.chunk_rows += [self.rows]
+            self.num_chunks += 1
+            self.rows = 0
+            self.windows, self.terminals, self.prev_obs = {}, {}, None
+        if block:
+            self.queue.join()
+            self._raise()
+
+    def queue_episode(self, episode, summary):
+        self._put(('episode', episode, summary))
+
+    def _put(self, item):
+        self._raise()
+        self.queue.put(item)
+
+    def _raise(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def _write_loop(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                kind, index, data = item
+                if kind == 'chunk':
+                    self.write_chunk(index, data)
+                else:
+                    with open(os.path.join(self.path, EPISODES), 'a') as f:
+                        f.write(json.dumps({'episode': index, **data}) + '\n')
+            except Exception as e:
+                self.errors += [e]
+            finally:
+                self.queue.task_done()
+
+    def write_chunk(self, index, chunk):
+        # Written under a temporary name and renamed, a reader never sees half a chunk
+        name = os.path.join(self.path, f'chunk_{index:06d}')
+        if self.compress:
+            # np.savez_compressed with a faster level, most of the ratio for a third of the time
+            with zipfile.ZipFile(name + '.tmp', 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as f:
+                for column, values in chunk.items():
+                    with f.open(f'{column}.npy', 'w', force_zip64=True) as array_file:
+                        np.lib.format.write_array(array_file, np.ascontiguousarray(values))
+            os.replace(name + '.tmp', name + '.npz')
+        else:
+            os.makedirs(name + '.tmp')
+            for column, values in chunk.items():
+                np.save(os.path.join(name + '.tmp', f'{column}.npy'), values)
+            os.replace(name + '.tmp', name)
+        self.write_manifest(index + 1)
+
+    def write_manifest(self, num_chunks):
+        manifest = {'columns': {name: {'dtype': dtype, 'shape': list(shape)}
+                                for name, (dtype, shape) in (self.columns or {}).items()},
+                    'obs_shape': None if self.obs_shape is None else list(self.obs_shape),
+                    'compress': self.compress,
+                    'chunk_rows': self.chunk_rows[:num_chunks]}
+        with open(os.path.join(self.path, MANIFEST + '.tmp'), 'w') as f:
+            json.dump(manifest, f, indent=1)
+        os.replace(os.path.join(self.path, MANIFEST + '.tmp'), os.path.join(self.path, MANIFEST))
+
+    def close(self):
+        if self.thread.is_alive():
+            self.flush()
+            self.queue.put(None)
+            self.thread.join()
+            self._raise()
+            if not self.num_chunks:
+                self.write_manifest(0)
+        return self.env.close()
+
+    def __repr__(self):
+        return f'TrajectoryRecorder({self.path!r}, {sum(self.chunk_rows) + self.rows} rows, ' \
+               f'{self.env!r})'
+
+
+class TrajectoryReader:
+    def __init__(self, path):
+        '''
+        Reads back what TrajectoryRecorder wrote, one chunk at a time or all at once
+
+        Uncompressed chunks are memory-mapped, nothing is read until it is used.
+        Compressed ones are decompressed a column at a time when asked for. obs, when
+        it was kept as rows, and next_obs are rebuilt, they are always new arrays.
+
+        :param path: directory of the recording
+        '''
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self.compress = self.manifest['compress']
+        self.chunk_rows = self.manifest['chunk_rows']
+        self.columns = list(self.manifest['columns']) + ['next_obs']
+        obs_shape = self.manifest['obs_shape']
+        self.window = obs_shape[0] if obs_shape is not None and len(obs_shape) > 1 else None
+
+    def __len__(self):
+        return sum(self.chunk_rows)
+
+    def num_chunks(self):
+        return len(self.chunk_rows)
+
+    def _read(self, index, stored):
+        name = os.path.join(self.path, f'chunk_{index:06d}')
+        if self.compress:
+            with np.load(name + '.npz') as chunk:
+                return {column: chunk[column] for column in stored}
+        return {column: np.load(os.path.join(name, f'{column}.npy'), mmap_mode='r')
+                for column in stored}
+
+    def _windows(self, frames, window_index, window_obs):
+        # Every segment is its first window followed by the newest rows of the next ones,
+        #     the obs of a row is the `window` rows of its segment starting at its offset
+        ends = np.append(window_index[1:], len(frames))
+        segments, starts, offset = [], [], 0
+        for start, end, window in zip(window_index, ends, window_obs):
+            segments += [window, frames[start + 1:end]]
+            starts += [np.arange(offset, offset + end - start)]
+            offset += len(window) + end - start - 1
+        sequence = np.concatenate(segments)
+        return sequence[np.concatenate(starts)[:, np.newaxis] + np.arange(self.window)]
+
+    def chunk(self, index, columns=None):
+        '''
+        :param index: chunk number
+        :param columns: names to read, all by default
+        :return: dict of column -> (rows x ...) array
+        '''
+        columns = self.columns if columns is None else columns
+        stored = [column for column in columns if column != 'next_obs']
+        if 'next_obs' in columns:
+            stored += ['obs', 'terminal_index', 'terminal_obs']
+        if 'obs' in stored and self.window is not None:
+            stored += ['window_index', 'window_obs']
+        arrays = self._read(index, list(dict.fromkeys(stored)))
+
+        if 'obs' in arrays and self.window is not None:
+            arrays['obs'] = self._windows(arrays['obs'], arrays['window_index'], arrays['window_obs'])
+        if 'next_obs' in columns:
+            obs = arrays['obs']
+            next_obs = np.empty(obs.shape, obs.dtype)
+            next_obs[:-1] = obs[1:]
+            next_obs[arrays['terminal_index']] = arrays['terminal_obs']
+            arrays['next_obs'] = next_obs
+        return {column: arrays[column] for column in columns}
+
+    def chunks(self, columns=None):
+        # Streams the chunks in order, at most one is resident when compressed
+        for index in range(self.num_chunks()):
+            yield self.chunk(index, columns)
+
+    def load(self, columns=None):
+        # Every chunk concatenated, e.g. to fill a replay memory for offline training
+        chunks = list(self.chunks(columns))
+        return {column: np.concatenate([chunk[column] for chunk in chunks])
+                for column in (self.columns if columns is None else columns)}
+
+    def episodes(self):
+        # info['episode'] of every finished episode, as recorded
+        file_name = os.path.join(self.path, EPISODES)
+        if not os.path.exists(file_name):
+            return []
+        with open(file_name) as f:
+            return [json.loads(line) for line in f]
+
+    def __repr__(self):
+        return f'TrajectoryReader({self.path!r}, {len(self)} rows in {self.num_chunks()} chunks)'
@@ -0,0 +1,153 @@
+import numpy as np
+from gym_exchange.gym_engine import EpisodeStats
+from gym_exchange.envs.stock_exchange import StockExchange
+from gym_exchange.envs.stock_exchange_continuous import StockExchangeContinuous
+
+
+class VecStockExchange:
+    '''
+    num_envs independent StockExchange episodes stepped in lockstep, in-process
+
+    Market data and the feature matrix are loaded once and shared, each episode only
+    keeps a cursor, its start offset and its positions, all stacked in arrays. step()
+    takes a batch of actions and returns (num_envs, ...) observations, rewards and
+    dones. Finished episodes are reset on the spot, their last observation is kept in
+    info['terminal_observation'] and their metrics in info['episode']. Running metrics of
+    every episode are in `stats`, e.g. stats.summary().
+
+    Episodes follow StockExchange: a warm-up of `window - 1` days that is never
+    returned, then steps until the engine is done, plus the final step that reports
+    done. Configuration (tickers, dates, window, ...) comes from `env_cls`, subclass
+    it the same way as StockExchange.
+    '''
+    env_cls = StockExchange
+
+    def __init__(self, num_envs, seed=None, start_offsets=None):
+        '''
+        :param num_envs: number of episodes running side by side
+        :param seed: seeds start offsets and warm-up moves
+        :param start_offsets: fixed first day per episode, in days after start_date.
+                              None draws a new offset on every reset, from the sampler
+                              of env_cls if it has one, uniformly otherwise
+        '''
+        self.num_envs = num_envs
+        self.random = np.random.RandomState(seed)
+
+        self.exchange = self.env_cls(seed)
+        self.sampler = self.exchange.sampler
+        assert self.exchange.env.panel is not None, 'VecStockExchange needs env_cls.vectorized'
+        self.panel = self.exchange.env.panel
+        self.features = self.exchange.features
+        self.window = self.exchange.observation_space.shape[0]
+        self.num_days_iter = self.exchange.num_days_to_iterate
+        self.action_space = self.exchange.action_space
+
+        # Highest offset that still leaves room for the full episode and its done step
+        self.max_start_offset = len(self.panel.close_delta) - self.num_days_iter - 2
+        assert self.max_start_offset >= 0, f'Not enough days: {len(self.panel.close_delta)}'
+        self.fixed_start = start_offsets is not None
+        self.start = np.zeros(num_envs, dtype=np.int64)
+        if self.fixed_start:
+            self.start[:] = start_offsets
+            assert (0 <= self.start).all() and (self.start <= self.max_start_offset).all(), \
+                f'start_offsets must be within [0, {self.max_start_offset}]'
+
+        self.today = np.zeros(num_envs, dtype=np.int64)
+        self.current_position = np.zeros((num_envs, len(self.panel)))
+        self.stats = EpisodeStats(len(self.panel), batch_shape=(num_envs, ))
+        self.ticker_names = [ticker.ticker for ticker in self.exchange.env.tickers]
+        self.window_index = np.arange(self.window)
+
+    def moves_available(self):
+        return self.exchange.moves_available()
+
+    def positions(self, actions):
+        # (num_envs x tickers) positions for a batch of actions
+        if self.exchange.portfolio:
+            return self.exchange.env.positions(actions)
+        return self.panel.action_space[np.asarray(actions)]
+
+    def warm_up_positions(self, num_envs):
+        # What the warm-up of StockExchange leaves behind: the random portfolio move held
+        #     through it, or no action on every ticker
+        if self.exchange.portfolio:
+            return self.positions(self.random.randint(0, self.moves_available(), num_envs))
+        no_action = self.exchange.no_action_index
+        return self.positions(np.full((num_envs, len(self.panel)), no_action))
+
+    def get_observations(self, indices=slice(None)):
+        # features has window - 1 rows of padding, so the window ending today starts at today
+        return self.features[self.today[indices, np.newaxis] + self.window_index]
+
+    def sample_starts(self, num_envs):
+        if self.sampler is not None:
+            return self.sampler.sample(self.exchange.split, num_envs)
+        return self.random.randint(0, self.max_start_offset + 1, num_envs)
+
+    def reset_envs(self, indices):
+        num_envs = len(self.start[indices])
+        if not self.fixed_start:
+            self.start[indices] = self.sample_starts(num_envs)
+        self.today[indices] = self.start[indices] + self.window - 1
+        self.current_position[indices] = self.warm_up_positions(num_envs)
+        self.stats.reset(indices, self.current_position[indices])
+
+    def reset(self):
+        self.reset_envs(slice(None))
+        return self.get_observations()
+
+    def step(self, actions):
+        '''
+        :param actions: (num_envs, ) action indices for a portfolio, (num_envs x tickers)
+                        action indices otherwise
+        :return: observations, rewards, dones, infos
+        '''
+        dones = self.today - self.start > self.num_days_iter
+        running = ~dones
+
+        ticker_rewards = self.current_position * self.panel.close_delta[self.today]
+        ticker_rewards[dones | (self.today == self.start)] = 0.0
+        rewards = ticker_rewards.sum(axis=1)
+
+        positions = self.positions(actions)
+        self.current_position[running] = positions[running]
+        self.today[running] += 1
+
+        observations = self.get_observations()
+        infos = [{'score': reward} for reward in rewards]
+
+        # Like StockExchange the done step is not part of the stats, finished rows are
+        #     updated too but reset right after
+        indices = np.flatnonzero(dones)
+        for i in indices:
+            infos[i]['episode'] = self.stats.episode_summary(self.ticker_names, i)
+            infos[i]['terminal_observation'] = observations[i].copy()
+        self.stats.update(ticker_rewards, self.current_position)
+
+        if len(indices):
+            self.reset_envs(indices)
+            observations[indices] = self.get_observations(indices)
+
+        return observations, rewards, dones, infos
+
+    def __len__(self):
+        return self.num_envs
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.num_envs}, {self.exchange!r})'
+
+
+class VecStockExchangeContinuous(VecStockExchange):
+    env_cls = StockExchangeContinuous
+
+    def moves_available(self):
+        raise NotImplementedError
+
+    def positions(self, actions):
+        # Continuous actions are the positions themselves
+        actions = np.asarray(actions, dtype=np.float64)
+        return actions.reshape(self.num_envs, len(self.panel))
+
+    def warm_up_positions(self, num_envs):
+        # StockExchangeContinuous warms up with zero actions
+        return np.zeros((num_envs, len(self.panel)))
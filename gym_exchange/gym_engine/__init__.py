@@ -1,6 +1,10 @@
 from gym_exchange.gym_engine.utils import iterable
 from gym_exchange.gym_engine.ticker import Ticker
 from gym_exchange.gym_engine.ticker_continuous import TickerContinuous
+from gym_exchange.gym_engine.episode_stats import EpisodeStats
+from gym_exchange.gym_engine.panel import TickerPanel
+from gym_exchange.gym_engine.render_recorder import RenderRecorder
+from gym_exchange.gym_engine.minute_data import MinuteStream
 from gym_exchange.gym_engine.engine import Engine
 from gym_exchange.gym_engine.engine_continuous import EngineContinuous
 from gym_exchange.gym_engine.portfolio import Portfolio
@@ -1,33 +1,68 @@
 import itertools
 import functools
-import matplotlib.pyplot as plt
 import numpy as np
-from gym_exchange.gym_engine import Ticker
+from gym_exchange.gym_engine import Ticker, TickerPanel
 from gym_exchange.gym_engine import iterable
-
-plt.ion()
+from gym_exchange.gym_engine.episode_stats import EpisodeStats
+from gym_exchange.gym_engine.market_data import CLOSE
 
 
 class Engine:
     def __init__(self, tickers, start_date, num_days_iter,
                  today=None, seed=None, num_action_space=3,
-                 render=False, *args, **kwargs):
+                 render=False, vectorized=False, recorder=None, *args, **kwargs):
         if seed: np.random.seed(seed)
         if not iterable(tickers): tickers = [tickers]
 
         self.tickers = self._get_tickers(tickers, start_date, num_days_iter,
                                          today, num_action_space, *args, **kwargs)
+        # vectorized: step every ticker at once on a (days x tickers x fields) panel
+        #     instead of calling Ticker.step one by one
+        # Running risk/return aggregates of the current game, see EpisodeStats
+        self.stats = EpisodeStats(len(self.tickers))
+        self.panel = TickerPanel(self.tickers, num_days_iter, self.tickers[0].action_space) \
+            if vectorized else None
         self.reset_game()
 
+        # recorder: a RenderRecorder, render() then records instead of drawing
+        self.recorder = recorder
+        self.fig = self.ax_list = None
         if render:
-            # Somehow ax_list should be grouped in two always...
-            # Or is there another way of getting one axis per row and then add?
-            fig_height = 3 * len(self.tickers)
-            self.fig, self.ax_list = plt.subplots(len(tickers), 2, figsize=(10, fig_height))
-
-    def reset_game(self):
+            self._make_figure()
+
+    def _make_figure(self):
+        # matplotlib is only imported once there is something to draw
+        import matplotlib.pyplot as plt
+        plt.ion()
+        # Somehow ax_list should be grouped in two always...
+        # Or is there another way of getting one axis per row and then add?
+        fig_height = 3 * len(self.tickers)
+        self.fig, self.ax_list = plt.subplots(len(self.tickers), 2, figsize=(10, fig_height))
+
+    def reset_game(self, start=0):
+        # start: first day of the game, only the panel can start anywhere but day 0
+        self.stats.reset()
+        if self.panel is not None:
+            self.panel.reset(start)
+            return
+        assert start == 0, 'Starting after day 0 needs vectorized=True'
         list(map(lambda ticker: ticker.reset(), self.tickers))
 
+    def fast_forward(self, num_days, actions):
+        # Same as num_days calls to step(actions), rewards are recorded but not returned
+        if self.panel is not None:
+            self.panel.fast_forward(num_days, actions)
+        else:
+            for _ in range(num_days):
+                self.step(actions)
+        # Stats only cover the game from here on, starting from what is held now
+        self.stats.reset(position=self.current_positions())
+
+    def current_positions(self):
+        if self.panel is not None:
+            return self.panel.current_position
+        return np.array([ticker.current_position for ticker in self.tickers])
+
     def _get_tickers(self, tickers, start_date, num_days_iter,
                      today, num_action_space, *args, **kwargs):
         return [Ticker(ticker, start_date, num_days_iter, today, num_action_space, *args, **kwargs)
@@ -35,16 +70,50 @@ class Engine:
 
     def _render(self, render):
         if render:
-            if len(self.tickers) == 1:
+            import matplotlib.pyplot as plt
+            # The figure is only made once something is actually rendered
+            if self.ax_list is None:
+                self._make_figure()
+            if self.panel is not None:
+                self.panel.render(self.ax_list)
+            elif len(self.tickers) == 1:
                 self.tickers[0].render(self.ax_list)
             else:
                 for axis, ticker in zip(self.ax_list, self.tickers):
                     ticker.render(axis)
+            plt.pause(0.0001)
+
+    def render_history(self):
+        # Days played so far, their close and the accumulated pnl, (days x tickers) copies
+        if self.panel is not None:
+            played = slice(self.panel.start, self.today)
+            close = self.panel.prices[played, :, CLOSE]
+            pnl = self.panel.pnl[played]
+        else:
+            played = slice(0, self.today)
+            close = np.column_stack([ticker.prices[played, CLOSE] for ticker in self.tickers])
+            pnl = np.column_stack([ticker.pnl[played] for ticker in self.tickers])
+        return np.arange(played.start, played.stop), close.copy(), np.cumsum(pnl, axis=0)
 
     def get_state(self, delta_t=0):
+        if self.panel is not None:
+            return list(self.panel.get_state(delta_t))
         # Note: np.arary(...) could also be used
         return list(map(lambda ticker: ticker.get_state(delta_t), self.tickers))
 
+    @property
+    def today(self):
+        # Tickers are always stepped together, so they share the cursor
+        return self.panel.today if self.panel is not None else self.tickers[0].today
+
+    def get_features(self):
+        # days x (tickers * ohlc deltas), one row per day of what get_state reports
+        #     with the holdings dropped, the same row the StockExchange window is made of
+        if self.panel is not None:
+            return self.panel.deltas[:, :, :-1].reshape(len(self.panel.deltas), -1)
+        num_days = min(len(ticker.deltas) for ticker in self.tickers)
+        return np.hstack([ticker.deltas[:num_days, :-1] for ticker in self.tickers])
+
     def moves_available(self):
         raise NotImplementedError
 
@@ -52,16 +121,27 @@ class Engine:
         if not iterable(actions): actions = [actions]
         assert len(self.tickers) == len(actions), f'{len(self.tickers)}, {len(actions)}'
 
+        if self.panel is not None:
+            rewards, done = self.panel.step(actions)
+            if not done:
+                self.stats.update(rewards, self.panel.current_position)
+            return rewards.sum(), done
+
         rewards, dones = zip(*(itertools.starmap(lambda ticker, action: ticker.step(action),
                                                  zip(self.tickers, actions))))
 
         # This is somewhat misleading
         score = functools.reduce(lambda x, y: x + y, rewards, 0.0)
         done = functools.reduce(lambda x, y: x | y, dones, False)
+        if not done:
+            self.stats.update(rewards, self.current_positions())
 
         return score, done
 
     def render(self):
+        if self.recorder is not None:
+            self.recorder.record(self.today, self.render_history)
+            return
         # This is possibly unnecessary b/c of changes
         self._render(True)
 
@@ -0,0 +1,142 @@
+import numpy as np
+
+
+class EpisodeStats:
+    metrics = ('num_steps', 'total_return', 'mean', 'std', 'sharpe', 'max_drawdown',
+               'turnover', 'exposure')
+
+    def __init__(self, num_tickers, batch_shape=(), periods_per_year=252, chunk_size=64):
+        '''
+        Running risk/return aggregates of an episode, O(tickers) work per step
+
+        Columns are the tickers plus one for the whole portfolio, whose return is the sum
+        of the ticker rewards. Returns are the rewards as the engine pays them, position
+        times the close delta, so they add up: drawdown is measured on their cumulative
+        sum. Turnover sums |position change| and exposure is the average |position|.
+
+        update() only copies the step into a buffer of chunk_size rows, the buffer is
+        folded into the aggregates once full or when they are read. Mean and variance of
+        a chunk are merged into the running ones the Welford way (Chan et al.'s pairwise
+        form), so nothing beyond the last chunk is ever kept. A dozen numpy calls per
+        step cost more than stepping the env itself, per chunk they are noise.
+
+        :param num_tickers: number of tickers
+        :param batch_shape: leading shape, e.g. (num_envs, ) to follow several episodes
+        :param periods_per_year: to annualize the Sharpe ratio, 252 trading days
+        :param chunk_size: steps buffered before they are folded in
+        '''
+        self.num_tickers = num_tickers
+        self.batch_shape = tuple(batch_shape)
+        self.annualize = np.sqrt(periods_per_year)
+        shape = self.batch_shape + (num_tickers + 1, )
+        self.num_steps = np.zeros(self.batch_shape + (1, ))
+        # mean, m2, cumulative return, its peak, max drawdown, turnover, summed exposure
+        self.state = np.zeros((7, ) + shape)
+        self.mean, self.m2, self.cumulative, self.peak, self.drawdown, self.turnover, \
+            self.exposure = self.state
+        # Positions held going into the pending steps
+        self.position = np.zeros(self.batch_shape + (num_tickers, ))
+
+        self.rewards = np.empty((chunk_size, ) + self.batch_shape + (num_tickers, ))
+        self.positions = np.empty_like(self.rewards)
+        self.pending = 0
+
+    def reset(self, indices=Ellipsis, position=0.0):
+        '''
+        :param indices: which episodes of the batch, all by default
+        :param position: positions held going in, e.g. what the warm-up left
+        '''
+        # The other episodes of the batch may have pending steps
+        self.flush()
+        self.num_steps[indices] = 0.0
+        self.state[:, indices] = 0.0
+        self.position[indices] = position
+
+    def update(self, rewards, position):
+        '''
+        :param rewards: (batch_shape x tickers) rewards of the step
+        :param position: (batch_shape x tickers) positions held after it
+        '''
+        self.rewards[self.pending] = rewards
+        self.positions[self.pending] = position
+        self.pending += 1
+        if self.pending == len(self.rewards):
+            self.flush()
+
+    def flush(self):
+        # Folds the pending steps into the aggregates
+        num_new = self.pending
+        if not num_new:
+            return
+        self.pending = 0
+        rewards, positions = self.rewards[:num_new], self.positions[:num_new]
+        returns = np.concatenate([rewards, rewards.sum(axis=-1, keepdims=True)], axis=-1)
+
+        # Welford, merging the chunk's mean and m2 into the running ones
+        mean = returns.mean(axis=0)
+        m2 = np.square(returns - mean).sum(axis=0)
+        num_steps = self.num_steps + num_new
+        delta = mean - self.mean
+        self.mean += delta * (num_new / num_steps)
+        self.m2 += m2 + np.square(delta) * (self.num_steps * num_new / num_steps)
+        self.num_steps[...] = num_steps
+
+        cumulative = self.cumulative + np.cumsum(returns, axis=0)
+        peak = np.maximum(self.peak, np.maximum.accumulate(cumulative, axis=0))
+        np.maximum(self.drawdown, (peak - cumulative).max(axis=0), out=self.drawdown)
+        self.peak[...] = peak[-1]
+        self.cumulative[...] = cumulative[-1]
+
+        # Portfolio turnover and exposure are the sums of the ticker ones
+        changes = np.abs(np.diff(positions, axis=0, prepend=self.position[np.newaxis]))
+        self.turnover[..., :-1] += changes.sum(axis=0)
+        self.turnover[..., -1] += changes.sum(axis=(0, -1))
+        exposure = np.abs(positions).sum(axis=0)
+        self.exposure[..., :-1] += exposure
+        self.exposure[..., -1] += exposure.sum(axis=-1)
+        self.position[...] = positions[-1]
+
+    def summary(self, indices=Ellipsis):
+        '''
+        :return: dict of metric -> (batch_shape x (tickers + 1)) arrays, the portfolio last
+        '''
+        self.flush()
+        mean, m2, cumulative, _, drawdown, turnover, exposure = self.state[:, indices]
+        num_steps = self.num_steps[indices]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            std = np.where(num_steps > 1, np.sqrt(m2 / (num_steps - 1)), 0.0)
+            sharpe = np.where(std > 0, mean / std * self.annualize, 0.0)
+            exposure = np.where(num_steps > 0, exposure / num_steps, 0.0)
+        return {'num_steps': np.broadcast_to(num_steps, mean.shape).copy(),
+                'total_return': cumulative.copy(), 'mean': mean.copy(), 'std': std,
+                'sharpe': sharpe, 'max_drawdown': drawdown.copy(), 'turnover': turnover.copy(),
+                'exposure': exposure}
+
+    def portfolio(self, index=Ellipsis):
+        # Portfolio metrics as plain floats
+        self.flush()
+        mean, m2, cumulative, _, drawdown, turnover, exposure = self.state[:, index, -1]
+        num_steps = float(self.num_steps[index, 0])
+        std = np.sqrt(m2 / (num_steps - 1)) if num_steps > 1 else 0.0
+        return {'num_steps': int(num_steps),
+                'total_return': float(cumulative),
+                'mean': float(mean),
+                'std': float(std),
+                'sharpe': float(mean / std * self.annualize) if std > 0 else 0.0,
+                'max_drawdown': float(drawdown),
+                'turnover': float(turnover),
+                'exposure': float(exposure / num_steps) if num_steps else 0.0}
+
+    def episode_summary(self, tickers, index=Ellipsis):
+        '''
+        :param tickers: ticker names
+        :return: {'portfolio': {metric: float}, ticker: {metric: float}, ...}
+        '''
+        # One tolist() per metric, converting every value on its own is what costs here
+        columns = {metric: values.tolist() for metric, values in self.summary(index).items()}
+        columns['num_steps'] = [int(num_steps) for num_steps in columns['num_steps']]
+        return {name: {metric: columns[metric][i] for metric in self.metrics}
+                for i, name in enumerate(list(tickers) + ['portfolio'])}
+
+    def __repr__(self):
+        return f'EpisodeStats({self.num_tickers} tickers, batch: {self.batch_shape})'
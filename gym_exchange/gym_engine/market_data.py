@@ -0,0 +1,131 @@
+from collections import OrderedDict
+import datetime
+import numpy as np
+from gym_exchange.gym_engine.market_store import FIELDS, open_store
+
+
+DELTA_FIELDS = [field + '_delta' for field in FIELDS]
+# Column order of the frame the Ticker used to keep around, `Ticker.df` still exposes it
+COLUMNS = FIELDS + DELTA_FIELDS + ['position', 'pnl']
+CLOSE = FIELDS.index('close')
+# Part of the cache key, change it whenever load_market_data computes something else
+FEATURE_SET = 'ohlcv_pct_change'
+
+
+def load_ticker_df(ticker, start_date):
+    # pandas is only needed to parse the csv files, not once the data is cached
+    import pandas as pd
+    ticker_data = pd.read_csv(f'iexfinance/iexdata/{ticker}')
+    return ticker_data[ticker_data.date >= start_date]
+
+
+def load_test_df(num_days_iter):
+    import pandas as pd
+    date_col = [datetime.date.today() + datetime.timedelta(days=i)
+                for i in range(num_days_iter)]
+    aranged_values = [np.repeat(i, 6) for i in range(1, num_days_iter+1)]
+    temp_df = pd.DataFrame(aranged_values,
+                           columns=['date'] + FIELDS)
+    temp_df.iloc[:, 0] = date_col
+    return temp_df
+
+
+class MarketDataCache:
+    def __init__(self, max_bytes=512 * 2 ** 20):
+        '''
+        Process-wide LRU cache of loaded market data
+
+        Entries are (prices, deltas, dates) keyed by (ticker, start_date, FEATURE_SET).
+        Arrays are read-only, so every Ticker built from the same key shares them.
+
+        :param max_bytes: memory budget, least recently used entries go first
+        '''
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _nbytes(entry):
+        prices, deltas, dates = entry
+        return prices.nbytes + deltas.nbytes + dates.nbytes
+
+    def get(self, key, load):
+        '''
+        :param key: hashable key
+        :param load: called without arguments on a miss, returns the entry
+        '''
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+        self.misses += 1
+        entry = load()
+        for array in entry:
+            array.flags.writeable = False
+
+        nbytes = self._nbytes(entry)
+        if nbytes <= self.max_bytes:
+            self._entries[key] = (entry, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+        return entry
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            _, (_, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __repr__(self):
+        return f'MarketDataCache({len(self)} entries, {self.nbytes} / {self.max_bytes} bytes, ' \
+               f'hits: {self.hits}, misses: {self.misses})'
+
+
+cache = MarketDataCache()
+
+
+def pct_change(prices):
+    # Same numbers as pd.DataFrame.pct_change, with the first row set to 0
+    deltas = np.zeros_like(prices)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deltas[1:] = prices[1:] / prices[:-1] - 1.0
+    return deltas
+
+
+def _load_market_data(ticker, start_date, num_days_iter, test, store):
+    if store is not None and not test:
+        # Mapped straight from the store, nothing is parsed
+        prices, dates = open_store(store).load(ticker, start_date)
+        return prices, pct_change(prices), dates
+
+    ticker_data = load_test_df(num_days_iter) if test else load_ticker_df(ticker, start_date)
+    prices = np.ascontiguousarray(ticker_data[FIELDS].values, dtype=np.float64)
+    dates = np.array(ticker_data['date'].tolist(), dtype='datetime64[D]')
+    return prices, pct_change(prices), dates
+
+
+def load_market_data(ticker, start_date, num_days_iter, test=False, store=None):
+    '''
+    Parses a ticker once into contiguous arrays, later calls are served from `cache`
+
+    :param ticker: upper-cased ticker, file name under `iexfinance/iexdata`
+    :param start_date: first date to keep, e.g. '2013-09-15'
+    :param num_days_iter: only used to build the test data
+    :param test: use the synthetic 1, 2, 3, ... prices instead of the csv
+    :param store: MarketStore, or its path, to map the prices from instead of parsing the csv.
+                  Both hold the same numbers, so they share cache entries
+    :return: prices (days x 5), deltas (days x 5) as read-only float64, dates as datetime64[D]
+    '''
+    key = ('test', num_days_iter, FEATURE_SET) if test else (ticker, start_date, FEATURE_SET)
+    return cache.get(key, lambda: _load_market_data(ticker, start_date, num_days_iter, test, store))
@@ -0,0 +1,116 @@
+import argparse
+import functools
+import json
+import os
+import numpy as np
+
+
+FIELDS = ['open', 'high', 'low', 'close', 'volume']
+MANIFEST = 'manifest.json'
+CSV_PATH = 'iexfinance/iexdata'
+STORE_PATH = 'iexfinance/iexbin'
+
+
+def convert(src=CSV_PATH, dst=STORE_PATH, tickers=None):
+    '''
+    One-time conversion of the daily bar csvs into a MarketStore
+
+    Every symbol becomes `<TICKER>.ohlcv.npy`, (days x 5) float64 in FIELDS order,
+    and `<TICKER>.dates.npy`, datetime64[D]. `manifest.json` keeps the row count
+    and the date range of each symbol. Files that are not daily bars are skipped.
+
+    :param src: directory of csvs, one per symbol, with a date,open,...,volume header
+    :param dst: directory to write the store to, created if missing
+    :param tickers: only convert these symbols, all of src if None
+    :return: the manifest
+    '''
+    # Reading the store back needs numpy only, pandas is just for the conversion
+    import pandas as pd
+    os.makedirs(dst, exist_ok=True)
+    manifest_path = os.path.join(dst, MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    for ticker in sorted(os.listdir(src)) if tickers is None else tickers:
+        with open(os.path.join(src, ticker)) as f:
+            if f.readline().strip().split(',') != ['date'] + FIELDS:
+                continue
+
+        df = pd.read_csv(os.path.join(src, ticker))
+        dates = df.date.values.astype('datetime64[D]')
+        assert (np.diff(dates) > np.timedelta64(0, 'D')).all(), f'{ticker}: dates are not sorted'
+
+        np.save(os.path.join(dst, f'{ticker}.ohlcv.npy'),
+                np.ascontiguousarray(df[FIELDS].values, dtype=np.float64))
+        np.save(os.path.join(dst, f'{ticker}.dates.npy'), dates)
+        manifest[ticker] = {'rows': len(df),
+                            'first_date': str(dates[0]) if len(df) else None,
+                            'last_date': str(dates[-1]) if len(df) else None}
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return manifest
+
+
+class MarketStore:
+    def __init__(self, path=STORE_PATH):
+        '''
+        Reader for a store written by `convert`, files are memory-mapped, never parsed
+
+        :param path: directory holding manifest.json and the .npy files
+        '''
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+
+    @property
+    def tickers(self):
+        return sorted(self.manifest)
+
+    def rows(self, ticker):
+        return self.manifest[ticker]['rows']
+
+    def load(self, ticker, start_date=None):
+        '''
+        :param ticker: upper-cased ticker
+        :param start_date: first date to keep, e.g. '2013-09-15', found by binary search
+        :return: ohlcv (days x 5) and dates, both read-only views of the mapped files
+        '''
+        ohlcv = np.load(os.path.join(self.path, f'{ticker}.ohlcv.npy'), mmap_mode='r')
+        dates = np.load(os.path.join(self.path, f'{ticker}.dates.npy'), mmap_mode='r')
+        first = 0 if start_date is None else np.searchsorted(dates, np.datetime64(start_date, 'D'))
+        # Plain ndarray views, still backed by the mapping
+        return np.asarray(ohlcv[first:]), np.asarray(dates[first:])
+
+    def __contains__(self, ticker):
+        return ticker in self.manifest
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __repr__(self):
+        return f'MarketStore({self.path!r}, {len(self)} tickers)'
+
+
+@functools.lru_cache(maxsize=None)
+def _open_store(path):
+    return MarketStore(path)
+
+
+def open_store(store):
+    '''
+    :param store: a MarketStore or the path of one, the manifest of a path is read once
+    '''
+    return store if isinstance(store, MarketStore) else _open_store(store)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert the daily bar csvs into a MarketStore')
+    parser.add_argument('--src', default=CSV_PATH, type=str)
+    parser.add_argument('--dst', default=STORE_PATH, type=str)
+    parser.add_argument('--tickers', default=None, type=str, nargs='+')
+    args = parser.parse_args()
+    manifest = convert(args.src, args.dst, args.tickers)
+    print(f'{len(manifest)} tickers written to {args.dst}')
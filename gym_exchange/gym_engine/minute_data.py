@@ -0,0 +1,162 @@
+import os
+import queue
+import threading
+import numpy as np
+from gym_exchange.gym_engine.market_data import pct_change
+from gym_exchange.gym_engine.market_store import FIELDS
+
+
+# Written by download_daily_data.py, `<yyyymmdd>_<ticker>`, one day of minute bars each.
+#     daily_data := daily minute data... misnomer
+MINUTE_PATH = 'data/daily_data'
+# The consolidated market bars, the IEX only ones (FIELDS) are used when these are missing
+MARKET_FIELDS = ['marketOpen', 'marketHigh', 'marketLow', 'marketClose', 'marketVolume']
+
+
+def minute_dates(tickers, path=MINUTE_PATH, date_starting=None, date_ending=None):
+    '''
+    :param tickers: ticker names as in the file names, e.g. 'aapl'
+    :param date_starting: first yyyymmdd to keep, inclusive
+    :param date_ending: last yyyymmdd to keep, exclusive
+    :return: sorted yyyymmdd strings of the days every ticker has a file for
+    '''
+    days = {}
+    for file in os.listdir(path):
+        date, _, ticker = file.partition('_')
+        if ticker in tickers:
+            days.setdefault(date, set()).add(ticker)
+    return sorted(date for date, found in days.items()
+                  if len(found) == len(tickers)
+                  and (date_starting is None or date >= date_starting)
+                  and (date_ending is None or date < date_ending))
+
+
+def load_minute_day(tickers, date, path=MINUTE_PATH):
+    '''
+    One day of minute bars, every ticker on the same minutes
+
+    Missing quotes (-1, nan or no price at all) hold the last known price, the ones
+    before the first trade take the first one. Volume is 0 when nothing traded.
+
+    :return: prices (minutes x tickers x 5) float64 in FIELDS order, minute labels
+    '''
+    import pandas as pd
+    frames = []
+    for ticker in tickers:
+        df = pd.read_csv(os.path.join(path, f'{date}_{ticker}'))
+        fields = MARKET_FIELDS if set(MARKET_FIELDS) <= set(df.columns) else FIELDS
+        df = df.set_index('minute')[fields]
+        df.columns = FIELDS
+        frames += [df[~df.index.duplicated()]]
+
+    minutes = sorted(set().union(*(df.index for df in frames)))
+    prices = np.empty((len(minutes), len(tickers), len(FIELDS)))
+    for i, df in enumerate(frames):
+        df = df.reindex(minutes)
+        prices[:, i, -1] = df['volume'].clip(lower=0.0).fillna(0.0).values
+        quotes = df[FIELDS[:-1]]
+        prices[:, i, :-1] = quotes.where(quotes > 0).ffill().bfill().values
+    return prices, minutes
+
+
+class MinuteStream:
+    def __init__(self, tickers, path=MINUTE_PATH, date_starting=None, date_ending=None,
+                 days_per_chunk=5, prefetch=True):
+        '''
+        Minute bars of many days, read a chunk of days at a time
+
+        Iterating gives (prices, deltas, days) chunks: prices and their pct_change
+        (minutes x tickers x 5), and the index into `dates` of every row. Deltas run
+        on across chunks, the first row of a chunk is against the last one of the
+        previous. With prefetch the next chunks are read by a background thread while
+        the current one is used, no more than one waits in the queue: at most three
+        chunks, the one in use, the next and the one being read, are in memory.
+
+        :param tickers: ticker names as in the file names, e.g. 'aapl'
+        :param path: directory of the `<yyyymmdd>_<ticker>` files
+        :param date_starting: first yyyymmdd, inclusive
+        :param date_ending: last yyyymmdd, exclusive
+        :param days_per_chunk: days read at once
+        :param prefetch: read the next chunk in the background
+        '''
+        self.tickers = list(tickers)
+        self.path = path
+        self.days_per_chunk = days_per_chunk
+        self.prefetch = prefetch
+        self.dates = minute_dates(self.tickers, path, date_starting, date_ending)
+        assert self.dates, f'No day has minute data for all of {self.tickers} in {path}'
+
+    def __len__(self):
+        # Number of chunks
+        return -(-len(self.dates) // self.days_per_chunk)
+
+    def load_chunk(self, index, last_prices=None):
+        days = range(index * self.days_per_chunk,
+                      min((index + 1) * self.days_per_chunk, len(self.dates)))
+        loaded = [load_minute_day(self.tickers, self.dates[day], self.path)[0] for day in days]
+        prices = np.concatenate(loaded)
+        day_of_row = np.repeat(np.array(days), [len(day) for day in loaded])
+
+        if last_prices is None:
+            deltas = pct_change(prices)
+        else:
+            deltas = pct_change(np.concatenate([last_prices[np.newaxis], prices]))[1:]
+        for array in (prices, deltas, day_of_row):
+            array.flags.writeable = False
+        return prices, deltas, day_of_row
+
+    def _chunks(self):
+        last_prices = None
+        for index in range(len(self)):
+            chunk = self.load_chunk(index, last_prices)
+            last_prices = chunk[0][-1]
+            yield chunk
+
+    def __iter__(self):
+        if not self.prefetch:
+            return self._chunks()
+        return self._prefetched(self._chunks())
+
+    @staticmethod
+    def _prefetched(chunks):
+        # The thread stays one chunk ahead: it blocks on the full queue until that chunk is taken
+        done = object()
+        chunk_queue = queue.Queue(maxsize=1)
+        stop = threading.Event()
+
+        def put(item):
+            # False once the consumer is gone
+            while not stop.is_set():
+                try:
+                    chunk_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                for chunk in chunks:
+                    if not put(chunk):
+                        return
+                put(done)
+            except Exception as e:
+                put(e)
+
+        thread = threading.Thread(target=read, daemon=True)
+        thread.start()
+        try:
+            while True:
+                chunk = chunk_queue.get()
+                if chunk is done:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            # Also when the consumer stops early, the reader must not hang on the queue
+            stop.set()
+
+    def __repr__(self):
+        return f'MinuteStream({self.tickers}, {self.dates[0]} - {self.dates[-1]}, ' \
+               f'{len(self.dates)} days in chunks of {self.days_per_chunk})'
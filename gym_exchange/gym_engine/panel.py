@@ -0,0 +1,117 @@
+import numpy as np
+from gym_exchange.gym_engine.market_data import CLOSE
+
+
+class TickerPanel:
+    def __init__(self, tickers, num_days_iter, action_space=None):
+        '''
+        Every ticker of an Engine stacked into one (days x tickers x fields) panel
+
+        Follows the same step/get_state/reset/done contract as Ticker, but for all
+        tickers at once, so one step is a handful of array operations no matter
+        how many tickers are in the universe.
+
+        :param tickers: loaded Ticker or TickerContinuous objects
+        :param num_days_iter: number of days to iterate, same as Ticker
+        :param action_space: discrete positions, e.g. np.linspace(-1, 1, 3).
+                             None for continuous, where actions are positions
+        '''
+        num_days = min(len(ticker.prices) for ticker in tickers)
+        self.tickers = [ticker.ticker for ticker in tickers]
+        self.num_days_iter = num_days_iter
+        self.action_space = action_space
+
+        self.dates = tickers[0].dates[:num_days]
+        self.prices = np.stack([ticker.prices[:num_days] for ticker in tickers], axis=1)
+        self.deltas = np.stack([ticker.deltas[:num_days] for ticker in tickers], axis=1)
+        self.close_delta = np.ascontiguousarray(self.deltas[:, :, CLOSE])
+        self.position = np.zeros((num_days, len(tickers)))
+        self.pnl = np.zeros((num_days, len(tickers)))
+
+        self.today = self.start = min(ticker.today for ticker in tickers)
+        self.current_position = np.zeros(len(tickers))
+        self.accumulated_pnl = np.zeros(len(tickers))
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def get_state(self, delta_t=0):
+        # tickers x (open, high, low, close deltas, position), same layout as Ticker.get_state
+        today_market_data_position = self.deltas[self.today+delta_t].copy()
+        today_market_data_position[:, -1] = self.current_position
+        return today_market_data_position
+
+    def step(self, actions):
+        '''
+        :param actions: action index per ticker, or positions if continuous
+        :return: rewards per ticker, done
+        '''
+        if self.done():
+            self.current_position[:] = 0.0
+            return np.zeros(len(self)), True
+
+        if self.today == self.start:
+            rewards = np.zeros(len(self))
+        else:
+            rewards = self.current_position * self.close_delta[self.today]
+        self.pnl[self.today] = rewards
+        self.accumulated_pnl += rewards
+
+        self.current_position[:] = self.get_positions(actions)
+        self.position[self.today] = self.current_position
+
+        self.today += 1
+        return rewards, False
+
+    def get_positions(self, actions):
+        if self.action_space is None:
+            return actions
+        return self.action_space[np.asarray(actions)]
+
+    def fast_forward(self, num_days, actions):
+        '''
+        Same as num_days calls to step(actions), but as a few array operations
+
+        :param num_days: days to move forward, the game must not end on the way
+        :param actions: action index per ticker, or positions if continuous
+        '''
+        assert self.today + num_days - self.start <= self.num_days_iter + 1, \
+            f'Fast forwarding {num_days} days from {self.today} ends the game'
+        if num_days == 0:
+            return
+        days = slice(self.today, self.today + num_days)
+        positions = self.get_positions(actions)
+
+        # Each day earns what was held coming into it: the current position on the first
+        #     day, the new one after that
+        held = np.empty((num_days, len(self)))
+        held[0] = 0.0 if self.today == self.start else self.current_position
+        held[1:] = positions
+        rewards = held * self.close_delta[days]
+        self.pnl[days] = rewards
+        self.accumulated_pnl += rewards.sum(axis=0)
+
+        self.position[days] = positions
+        self.current_position[:] = positions
+        self.today += num_days
+
+    def reset(self, start=0):
+        # Only the rows the last game wrote to need clearing
+        played = slice(self.start, self.today + 1)
+        self.position[played] = self.pnl[played] = 0.0
+        self.today = self.start = start
+        self.current_position[:] = self.accumulated_pnl[:] = 0.0
+
+    def done(self):
+        return self.today - self.start > self.num_days_iter
+
+    def render(self, ax_list):
+        # Mirrors Ticker.render, one row of axes per ticker
+        ax_list = np.reshape(ax_list, (len(self), 2))
+        for i, (axis, ticker) in enumerate(zip(ax_list, self.tickers)):
+            axis[0].set_ylabel(f'Daily price: {ticker}')
+            axis[0].set_xlabel('Time step')
+            axis[0].plot(np.arange(self.today), self.prices[:self.today, i, CLOSE])
+            axis[1].set_ylabel(f'Daily return from Agent')
+            axis[1].set_xlabel('Time step')
+            axis[1].scatter(self.today, self.accumulated_pnl[i])
@@ -1,63 +1,121 @@
-from itertools import count
+from bisect import bisect_left
+from math import comb
 import numpy as np
-import pandas as pd
 from gym_exchange.gym_engine import Engine
 from gym_exchange.gym_engine import iterable
 
 
+class Compositions:
+    def __init__(self, num_parts, total):
+        '''
+        Ranks and unranks the ways of splitting `total` units over `num_parts` parts,
+        in lexicographic order, (0, ..., 0, total) first and (total, 0, ..., 0) last
+
+        Nothing is enumerated, only a (num_parts + 1) x (total + 1) table of binomials
+        is kept: table[k, j] is the number of ways of splitting j units over k parts.
+
+        :param num_parts: number of parts, e.g. tickers
+        :param total: number of units to split, every part gets 0 to total
+        '''
+        assert comb(total + num_parts - 1, num_parts - 1) < 2 ** 63, \
+            f'Too many compositions for int64: {num_parts} parts, {total} units'
+        self.num_parts = num_parts
+        self.total = total
+        self.table = np.array([[comb(j + k - 1, k - 1) if k > 0 else 0 for j in range(total + 1)]
+                               for k in range(num_parts + 1)], dtype=np.int64)
+        # Same table as plain ints, single indices are decoded without numpy overhead
+        self.rows = self.table.tolist()
+
+    def __len__(self):
+        return int(self.table[self.num_parts, self.total])
+
+    def unrank(self, indices):
+        '''
+        :param indices: (n, ) integers in [0, len(self))
+        :return: (n x num_parts) units per part
+        '''
+        indices = np.array(indices, dtype=np.int64, ndmin=1)
+        units = np.empty((len(indices), self.num_parts), dtype=np.int64)
+        remaining = np.full(len(indices), self.total, dtype=np.int64)
+        for i, k in enumerate(range(self.num_parts, 1, -1)):
+            # Part i takes u units, skipping the compositions where it takes less.
+            #     Those number table[k, m] - table[k, m - u], so look for m - u
+            count = self.table[k, remaining]
+            rest = np.searchsorted(self.table[k], count - indices, side='left')
+            units[:, i] = remaining - rest
+            indices = indices - count + self.table[k, rest]
+            remaining = rest
+        units[:, -1] = remaining
+        return units
+
+    def unrank_one(self, index):
+        '''
+        unrank for a single index, the same steps in plain Python
+
+        :param index: integer in [0, len(self))
+        :return: list of units per part
+        '''
+        units, remaining = [], self.total
+        for k in range(self.num_parts, 1, -1):
+            row = self.rows[k]
+            count = row[remaining]
+            rest = bisect_left(row, count - index)
+            units += [remaining - rest]
+            index -= count - row[rest]
+            remaining = rest
+        return units + [remaining]
+
+    def rank(self, units):
+        '''
+        :param units: (n x num_parts) units per part, every row sums to total
+        :return: (n, ) indices, inverse of unrank
+        '''
+        units = np.array(units, dtype=np.int64, ndmin=2)
+        assert (units.sum(axis=1) == self.total).all(), f'{units} must sum to {self.total}'
+        indices = np.zeros(len(units), dtype=np.int64)
+        remaining = np.full(len(units), self.total, dtype=np.int64)
+        for i, k in enumerate(range(self.num_parts, 1, -1)):
+            indices += self.table[k, remaining] - self.table[k, remaining - units[:, i]]
+            remaining = remaining - units[:, i]
+        return indices
+
+
 class Portfolio(Engine):
     def __init__(self, tickers, start_date, num_days_iter,
                  today=None, seed=None, render=False,
-                 action_space_min=0.0, action_space_max=1.0):
+                 action_space_min=0.0, action_space_max=1.0, vectorized=False, store=None,
+                 recorder=None):
         num_action_space = len(tickers)
         super().__init__(tickers, start_date, num_days_iter,
-                         today, seed, num_action_space, render,
+                         today, seed, num_action_space, render, vectorized, recorder,
                          action_space_min=action_space_min,
-                         action_space_max=action_space_max)
+                         action_space_max=action_space_max,
+                         store=store)
         self.action_space = np.linspace(action_space_min, action_space_max, num_action_space)
-        self.position_df = self._get_position_df(tickers, num_action_space, action_space_min, action_space_max)
-
-    # Returns a dataframe of all possible position distributions
-    # positions are divided into increments inversely proportional to the length of tickers
-    def _get_position_df(self, tickers, num_action_spaces,
-                         action_space_min, action_space_max):
-
-        def all_possible_combinations(values, increment, proportion_remaining, idx, ret_list):
-            if idx == len(values) - 1:
-                values[idx] = max(0, proportion_remaining)
-                ret_list.append(list(values))
-                values[idx] = 0
-                return
-            for t in count():
-                add_to_this_idx = t * increment
-                if add_to_this_idx <= proportion_remaining:
-                    values[idx] = add_to_this_idx
-                    all_possible_combinations(values, increment,
-                                              proportion_remaining - add_to_this_idx,
-                                              idx + 1, ret_list)
-                    values[idx] = 0.0
-                else:
-                    break
-
-        ticker_length = len(tickers)
-        inc = (action_space_max - action_space_min) / (num_action_spaces - 1)
-        so_far = [0.0 for _ in range(ticker_length)]
-
-        # Total positions sum to 1
-        ret, remain = [], 1.0
-        all_possible_combinations(so_far, inc, remain, 0, ret)
-        return pd.DataFrame(ret).T
+        # A ticker holding u units is at u / (len(tickers) - 1), that is action_space[u] only
+        #     on the 0 to 1 grid. Other bounds would decode to the wrong allocations
+        assert action_space_min == 0.0 and action_space_max == 1.0, \
+            f'Portfolio positions go from 0 to 1, not {action_space_min} to {action_space_max}'
+        # Every possible position distribution, positions sum to 1 in increments of
+        #     1 / (len(tickers) - 1), i.e. len(tickers) - 1 units over the tickers.
+        #     A ticker holding u units is at action_space[u]
+        self.compositions = Compositions(num_action_space, num_action_space - 1)
 
     def moves_available(self):
-        return self.position_df.shape[1]
+        # C(2 * len(tickers) - 2, len(tickers) - 1), 2,704,156 for 13 tickers
+        return len(self.compositions)
+
+    def action_indices(self, action_index):
+        # Per ticker index into action_space for one portfolio move, integers only
+        return self.compositions.unrank_one(int(action_index))
+
+    def positions(self, action_indices):
+        # Allocations for a batch of action indices, (len(action_indices) x tickers)
+        return self.action_space[self.compositions.unrank(action_indices)]
 
     def step(self, action_index):
         assert not iterable(action_index), f'{action_index}'
         assert 0 <= action_index < self.moves_available(), \
             f'action_index: {action_index}, moves_avail: {self.moves_available()}'
 
-        positions = self.position_df[action_index]
-
-        actions = [np.argwhere(np.isclose(self.action_space, position)).item()
-                   for position in positions]
-        return super(Portfolio, self).step(actions)
\ No newline at end of file
+        return super(Portfolio, self).step(self.action_indices(action_index))
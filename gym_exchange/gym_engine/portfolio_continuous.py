@@ -8,12 +8,14 @@ import gym
 class PortfolioContinuous(EngineContinuous):
     def __init__(self, tickers, start_date, num_days_iter,
                  today=None, seed=None, render=False,
-                 action_space_min=0.0, action_space_max=1.0):
+                 action_space_min=0.0, action_space_max=1.0, vectorized=False, store=None,
+                 recorder=None):
         num_action_space = len(tickers)
         super().__init__(tickers, start_date, num_days_iter,
-                         today, seed, num_action_space, render,
+                         today, seed, num_action_space, render, vectorized, recorder,
                          action_space_min=action_space_min,
-                         action_space_max=action_space_max)
+                         action_space_max=action_space_max,
+                         store=store)
         self.action_space = gym.spaces.Box(action_space_min, action_space_max,
                                            (num_action_space, ), np.float32)
 
@@ -0,0 +1,173 @@
+import io
+import os
+import queue
+import threading
+import time
+import numpy as np
+
+
+class RenderRecorder:
+    formats = ('png', 'html')
+
+    def __init__(self, tickers, path='render', interval=10.0, fmt='png', keep_frames=False):
+        '''
+        Off-screen rendering: figures are drawn and written by a background thread
+
+        render() only hands over a function returning the episode so far, the engine
+        already keeps the history in its arrays. At most every `interval` seconds it is
+        called and the copies go to the writer, which (re)writes `<path>/episode_<n>.<fmt>`.
+        If the writer is still busy the snapshot is dropped, stepping never waits on it.
+        When an episode ends its snapshot is always sent, whatever the interval, and
+        takes the place of a snapshot of the same episode still waiting. It is only
+        dropped while the writer has the previous episode's one waiting. close() waits
+        for the writer and writes the last one. Drawing a figure takes a
+        good fraction of a second and holds the GIL for most of it, the interval is what
+        keeps it to a few percent of the time spent stepping.
+
+        An error writing a figure does not stop the writer, it keeps taking snapshots
+        off the queue. The first one is raised again by flush() and close().
+
+        Figures are drawn with the Agg canvas, no GUI involved, and are kept to two axes
+        whatever the number of tickers: prices relative to the first day, and the
+        accumulated pnl per ticker along with the total.
+
+        :param tickers: ticker names, for the legend
+        :param path: directory for the files, created if missing
+        :param interval: seconds between two snapshots
+        :param fmt: 'png', or 'html' for an svg inside a html page
+        :param keep_frames: also keep every snapshot as `episode_<n>_<today>.<fmt>`
+        '''
+        assert fmt in self.formats, f'fmt must be one of {self.formats}'
+        self.tickers = list(tickers)
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt
+        self.keep_frames = keep_frames
+        os.makedirs(path, exist_ok=True)
+
+        self.episode = 0
+        self.history = None
+        self.last_today = -1
+        self.dropped = 0
+        self.errors = []
+        self.last_sent = time.perf_counter()
+
+        self.queue = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, today, history):
+        '''
+        :param today: engine cursor, going back means a new episode started
+        :param history: called without arguments when a snapshot is due, returns days,
+                        close (days x tickers) and accumulated pnl (days x tickers)
+        '''
+        if today < self.last_today:
+            self.episode += 1
+        self.history = history
+        self.last_today = today
+        if time.perf_counter() - self.last_sent >= self.interval:
+            self._send()
+
+    def _send(self, block=False, final=False):
+        days, close, pnl = self.history()
+        if len(days):
+            snapshot = (self.episode, days, close, pnl)
+            try:
+                self.queue.put(snapshot, block)
+            except queue.Full:
+                if not (final and self._replace(snapshot)):
+                    self.dropped += 1
+        self.last_sent = time.perf_counter()
+
+    def _replace(self, snapshot):
+        # A waiting snapshot of the same episode is older than the final one, swapped in place
+        #     so the writer's task count is unchanged
+        with self.queue.mutex:
+            waiting = self.queue.queue
+            if waiting and waiting[0] is not None and waiting[0][0] == snapshot[0]:
+                waiting[0] = snapshot
+                return True
+        return False
+
+    def end_episode(self, block=False):
+        '''
+        Call before the engine resets, while the history is still there. The final
+        figure is sent whenever the last snapshot was, see __init__
+
+        :param block: wait for the writer rather than dropping the final figure
+        '''
+        if self.history is None:
+            return
+        self._send(block, final=True)
+        self.episode += 1
+        self.history = None
+        self.last_today = -1
+
+    def _write_loop(self):
+        while True:
+            snapshot = self.queue.get()
+            try:
+                if snapshot is None:
+                    return
+                self.write(*snapshot)
+            except Exception as e:
+                self.errors += [e]
+            finally:
+                self.queue.task_done()
+
+    def write(self, episode, days, close, pnl):
+        # Agg only, so it is safe off the main thread and never opens a window
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        price_axis, pnl_axis = fig.subplots(2, 1, sharex=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price_axis.plot(days, close / close[0], linewidth=0.8)
+        price_axis.set_ylabel('Price / first price')
+        pnl_axis.plot(days, pnl, linewidth=0.8)
+        pnl_axis.plot(days, pnl.sum(axis=1), color='black', linewidth=1.5, label='total')
+        pnl_axis.set_ylabel('Return from Agent')
+        pnl_axis.set_xlabel('Time step')
+        if len(self.tickers) <= 20:
+            price_axis.legend(self.tickers, fontsize='x-small', ncol=4)
+
+        names = [f'episode_{episode:04d}']
+        if self.keep_frames:
+            names += [f'episode_{episode:04d}_{days[-1]:06d}']
+        for name in names:
+            file_name = os.path.join(self.path, f'{name}.{self.fmt}')
+            if self.fmt == 'png':
+                fig.savefig(file_name, format='png')
+            else:
+                self._write_html(fig, file_name, f'Episode {episode}, day {days[-1]}')
+
+    @staticmethod
+    def _write_html(fig, file_name, title):
+        svg = io.StringIO()
+        fig.savefig(svg, format='svg')
+        with open(file_name, 'w') as f:
+            f.write(f'<html><head><title>{title}</title></head><body>'
+                    f'<h3>{title}</h3>{svg.getvalue()}</body></html>')
+
+    def _raise(self):
+        if self.errors:
+            raise self.errors[0]
+
+    def flush(self):
+        # Blocks until everything queued so far is written
+        self.queue.join()
+        self._raise()
+
+    def close(self):
+        if not self.thread.is_alive():
+            return
+        self.end_episode(block=True)
+        self.queue.put(None)
+        self.thread.join()
+        self._raise()
+
+    def __repr__(self):
+        return f'RenderRecorder({self.path!r}, episode: {self.episode}, dropped: {self.dropped})'
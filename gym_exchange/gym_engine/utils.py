@@ -1,7 +1,7 @@
-import collections
+import collections.abc
 import six
 
 
 def iterable(arg):
-    return (isinstance(arg, collections.Iterable) and not
+    return (isinstance(arg, collections.abc.Iterable) and not
             isinstance(arg, six.string_types))
\ No newline at end of file
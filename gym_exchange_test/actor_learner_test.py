@@ -0,0 +1,119 @@
+import argparse
+import logging
+import tempfile
+import gym
+import numpy as np
+import torch
+import unittest
+from reinforcement import ArrayReplayBuffer, DuelingDQN
+from reinforcement.actor_learner import ActorLearner, DQNActor, SharedWeights
+from reinforcement.models_ddpg import DDPG
+import reinforcement.run_exchange as run_exchange
+from reinforcement.run_exchange import RunExchange, RunExchangeContinuous
+
+
+class WindowEnv(gym.Env):
+    # Rolling windows over a random walk, episodes of random length, old step API
+    window, num_features, num_actions = 5, 4, 3
+
+    def __init__(self, seed=None):
+        self.random = np.random.RandomState(seed)
+
+    def reset(self):
+        self.rows = self.random.randn(self.window + 20, self.num_features)
+        self.length = self.random.randint(5, 20)
+        self.today = 0
+        return self.rows[:self.window]
+
+    def step(self, action):
+        self.today += 1
+        reward = float(np.sum(action)) * 0.01
+        return self.rows[self.today:self.today + self.window], reward, \
+            self.today == self.length, {}
+
+
+class FailingEnv(WindowEnv):
+    def step(self, action):
+        raise ValueError('broken env')
+
+
+class TestActorLearner(unittest.TestCase):
+
+    def setUp(self):
+        # No logs folder in the working directory
+        self.log_path = tempfile.TemporaryDirectory()
+        self.default_log_path, run_exchange.LOG_PATH = run_exchange.LOG_PATH, self.log_path.name
+        torch.manual_seed(0)
+
+    def tearDown(self):
+        for handler in list(run_exchange.logger.handlers):
+            if isinstance(handler, logging.FileHandler):
+                run_exchange.logger.removeHandler(handler)
+                handler.close()
+        run_exchange.LOG_PATH = self.default_log_path
+        self.log_path.cleanup()
+
+    def test_shared_weights(self):
+        import multiprocessing
+        policy, copy = DuelingDQN(4, 3), DuelingDQN(4, 3)
+        weights = SharedWeights(policy, multiprocessing.get_context())
+        version = weights.pull(copy)
+        for name, value in copy.state_dict().items():
+            self.assertTrue(torch.equal(value, policy.state_dict()[name]))
+
+        with torch.no_grad():
+            for parameter in policy.parameters():
+                parameter.add_(1.0)
+        # Nothing published yet, the copy keeps what it has
+        self.assertEqual(weights.pull(copy, version), version)
+        self.assertFalse(torch.equal(copy.value[0].bias, policy.value[0].bias))
+        weights.publish(policy)
+        self.assertEqual(weights.pull(copy, version), version + 1)
+        self.assertTrue(torch.equal(copy.value[0].bias, policy.value[0].bias))
+
+    def test_dqn(self):
+        policy, target = DuelingDQN(WindowEnv.num_features, 3), DuelingDQN(WindowEnv.num_features, 3)
+        memory = ArrayReplayBuffer(1000)
+        runner = RunExchange(None, memory, policy, target, torch.optim.RMSprop(policy.parameters()),
+                             WindowEnv.window, batch_size=2, n_train=12, update_every=3,
+                             log_every=4)
+        throughput = runner.train_exchange_dqn_async(WindowEnv, num_actors=2, publish_every=5,
+                                                     sync_every=10, seed=0)
+        # Every episode played once, all of their transitions pushed
+        self.assertEqual(len(runner.rewards), 12)
+        self.assertGreaterEqual(len(memory), 12 * 5)
+        self.assertGreater(throughput['actor_steps_per_sec'], 0)
+        self.assertEqual(len(throughput['per_actor_steps_per_sec']), 2)
+        self.assertGreater(throughput['learner_updates_per_sec'], 0)
+
+    def test_ddpg(self):
+        # Spawned, the actors get the weights through pickled shared memory
+        args = argparse.Namespace(actor_learning_rate=1e-4, critic_learning_rate=1e-3, gamma=0.9,
+                                  tau=1e-3)
+        action_space = gym.spaces.Box(-1.0, 1.0, (2, ), np.float32)
+        ddpg = DDPG((WindowEnv.window, WindowEnv.num_features), 16, 2,
+                    argparse.Namespace(action_space=action_space), args)
+        memory = ArrayReplayBuffer(1000)
+        runner = RunExchangeContinuous(None, memory, ddpg, WindowEnv.window, batch_size=4,
+                                       n_train=8, log_every=4)
+        throughput = runner.train_exchange_ddpg_async(WindowEnv, num_actors=1, seed=0,
+                                                      start_method='spawn')
+        self.assertEqual(len(runner.rewards), 8)
+        self.assertGreaterEqual(len(memory), 8 * 5)
+        _, actions, _, _, dones = memory.gather(np.arange(len(memory)))
+        self.assertEqual(actions.shape[1], 2)
+        self.assertTrue((np.abs(actions) <= 1.0).all())
+        self.assertEqual(dones.sum(), 8)
+        self.assertGreater(throughput['learner_updates_per_sec'], 0)
+
+    def test_actor_error(self):
+        actor_learner = ActorLearner(DuelingDQN(WindowEnv.num_features, 3), FailingEnv,
+                                     DQNActor(1.0, 0.1, 10), 1, 10, seed=0)
+        with self.assertRaisesRegex(RuntimeError, 'broken env'):
+            while actor_learner.running:
+                actor_learner.receive(ArrayReplayBuffer(10), block=True)
+        self.assertEqual(actor_learner.running, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+from math import comb
+import numpy as np
+import unittest
+from gym_exchange.gym_engine import Engine, EngineContinuous, Portfolio
+from gym_exchange.gym_engine.portfolio import Compositions
+
+
+class TestEngineVectorized(unittest.TestCase):
+
+    def setUp(self):
+        self.tickers = ['aapl', 'amd', 'msft']
+        self.num_iter = 30
+        self.num_actions = 3
+
+    def run_engine(self, engine, actions):
+        rewards, dones, states = [], [], []
+        for action in actions:
+            reward, done = engine.step(action)
+            rewards += [reward]
+            dones += [done]
+            states += [np.array(engine.get_state())]
+        return np.array(rewards), dones, np.array(states)
+
+    def assert_engines_agree(self, engine_cls, actions):
+        engines = [engine_cls(self.tickers, '2015-01-01', self.num_iter,
+                              num_action_space=self.num_actions, vectorized=vectorized)
+                   for vectorized in (False, True)]
+        (r_loop, d_loop, s_loop), (r_vec, d_vec, s_vec) = \
+            [self.run_engine(engine, actions) for engine in engines]
+
+        self.assertTrue(np.allclose(r_loop, r_vec))
+        self.assertEqual(d_loop, d_vec)
+        self.assertTrue(np.allclose(s_loop, s_vec))
+
+    def test_discrete(self):
+        # Runs past num_iter to check the done flag as well
+        actions = np.random.randint(0, self.num_actions, (self.num_iter + 3, len(self.tickers)))
+        self.assert_engines_agree(Engine, actions)
+
+    def test_continuous(self):
+        actions = np.random.uniform(-1.0, 1.0, (self.num_iter + 3, len(self.tickers)))
+        self.assert_engines_agree(EngineContinuous, actions)
+
+    def test_reset(self):
+        engine = Engine(self.tickers, '2015-01-01', self.num_iter, vectorized=True)
+        for _ in range(5):
+            engine.step([2] * len(self.tickers))
+        engine.reset_game()
+        self.assertEqual(engine.panel.today, 0)
+        self.assertEqual(np.abs(engine.panel.pnl).sum(), 0.0)
+        self.assertEqual(np.array(engine.get_state())[:, -1].sum(), 0.0)
+
+    def test_fast_forward(self):
+        engines = [Engine(self.tickers, '2015-01-01', self.num_iter, vectorized=True)
+                   for _ in range(2)]
+        for start in (0, 7):
+            for engine in engines:
+                engine.reset_game(start)
+                engine.step([0, 1, 2])
+
+            engines[0].fast_forward(5, [2, 0, 1])
+            for _ in range(5):
+                engines[1].step([2, 0, 1])
+
+            panels = [engine.panel for engine in engines]
+            self.assertEqual(panels[0].today, panels[1].today)
+            for field in ('position', 'pnl', 'current_position', 'accumulated_pnl'):
+                self.assertTrue(np.allclose(getattr(panels[0], field), getattr(panels[1], field)))
+            self.assertEqual(engines[0].step([1, 1, 1]), engines[1].step([1, 1, 1]))
+
+
+class TestEpisodeStats(unittest.TestCase):
+
+    def test_agrees_history(self):
+        for vectorized in (False, True):
+            engine = EngineContinuous(['aapl', 'amd', 'msft'], '2015-01-01', 30, vectorized=vectorized)
+            engine.fast_forward(3, [0.5, -0.5, 0.0])
+            positions, rewards = [engine.current_positions().copy()], []
+            done = False
+            while not done:
+                before = self.accumulated_pnl(engine)
+                _, done = engine.step(np.random.uniform(-1.0, 1.0, 3))
+                if not done:
+                    rewards += [self.accumulated_pnl(engine) - before]
+                    positions += [engine.current_positions().copy()]
+            rewards, positions = np.array(rewards), np.array(positions)
+
+            # Portfolio last
+            returns = np.column_stack([rewards, rewards.sum(axis=1)])
+            cumulative = np.vstack([np.zeros(4), np.cumsum(returns, axis=0)])
+            changes = np.abs(np.diff(positions, axis=0))
+            exposure = np.abs(positions[1:])
+            expected = {'num_steps': len(returns),
+                        'total_return': cumulative[-1],
+                        'mean': returns.mean(axis=0),
+                        'std': returns.std(axis=0, ddof=1),
+                        'max_drawdown': (np.maximum.accumulate(cumulative) - cumulative).max(axis=0),
+                        'turnover': np.append(changes.sum(axis=0), changes.sum()),
+                        'exposure': np.append(exposure.mean(axis=0), exposure.sum(axis=1).mean())}
+            summary = engine.stats.summary()
+            for metric, value in expected.items():
+                self.assertTrue(np.allclose(summary[metric], value), metric)
+            self.assertTrue(np.allclose(summary['sharpe'],
+                                        expected['mean'] / expected['std'] * np.sqrt(252)))
+
+    @staticmethod
+    def accumulated_pnl(engine):
+        if engine.panel is not None:
+            return engine.panel.accumulated_pnl.copy()
+        return np.array([ticker.accumulated_pnl for ticker in engine.tickers])
+
+
+def float_enumeration(num_tickers):
+    # How Portfolio listed its moves before Compositions, increments of 1 / (tickers - 1)
+    increment, moves = 1.0 / (num_tickers - 1), []
+
+    def add(values, remaining):
+        if len(values) == num_tickers - 1:
+            moves.append(values + [max(0, remaining)])
+            return
+        t = 0
+        while t * increment <= remaining:
+            add(values + [t * increment], remaining - t * increment)
+            t += 1
+
+    add([], 1.0)
+    return np.array(moves)
+
+
+class TestPortfolioActions(unittest.TestCase):
+
+    def test_compositions(self):
+        compositions = Compositions(4, 3)
+        self.assertEqual(len(compositions), comb(6, 3))
+
+        units = compositions.unrank(np.arange(len(compositions)))
+        self.assertEqual(units[0].tolist(), [0, 0, 0, 3])
+        self.assertEqual(units[-1].tolist(), [3, 0, 0, 0])
+        self.assertTrue((units.sum(axis=1) == 3).all())
+        # Lexicographic order, so every composition shows up once
+        self.assertEqual(sorted(map(tuple, units)), list(map(tuple, units)))
+        self.assertEqual(len(set(map(tuple, units))), len(units))
+        self.assertTrue(np.array_equal(compositions.rank(units), np.arange(len(compositions))))
+
+    def test_large_portfolio(self):
+        # The 13 ticker StockExchange, far too many moves to enumerate
+        compositions = Compositions(13, 12)
+        self.assertEqual(len(compositions), 2704156)
+        indices = np.random.randint(0, len(compositions), 1000)
+        self.assertTrue(np.array_equal(compositions.rank(compositions.unrank(indices)), indices))
+
+    def test_float_enumeration(self):
+        # The same moves in the same order as before, where rounding did not drop any
+        tickers = ['aapl', 'amd', 'msft', 'intc', 'd', 'sbux', 'atvi']
+        for num_tickers in (3, 4, 5, 7):
+            portfolio = Portfolio(tickers[:num_tickers], '2015-01-01', 30)
+            moves = float_enumeration(num_tickers)
+            self.assertEqual(len(moves), portfolio.moves_available())
+            ranks = np.unique(np.r_[0, len(moves) - 1, np.random.randint(0, len(moves), 10)])
+            self.assertTrue(np.allclose(portfolio.positions(ranks), moves[ranks]))
+            for rank in ranks:
+                self.assertTrue(np.allclose(portfolio.action_space[portfolio.action_indices(rank)],
+                                            moves[rank]))
+
+    def test_bounds(self):
+        # Allocations are decoded on the 0 to 1 grid only
+        with self.assertRaisesRegex(AssertionError, 'from 0 to 1'):
+            Portfolio(['aapl', 'amd', 'msft'], '2015-01-01', 30, action_space_min=-1.0)
+
+    def test_step(self):
+        tickers = ['aapl', 'amd', 'msft']
+        portfolio = Portfolio(tickers, '2015-01-01', 30)
+        engine = Engine(tickers, '2015-01-01', 30, num_action_space=len(tickers),
+                        action_space_min=0.0, action_space_max=1.0)
+        for action_index in np.random.randint(0, portfolio.moves_available(), 10):
+            positions = portfolio.positions([action_index])[0]
+            self.assertAlmostEqual(positions.sum(), 1.0)
+            self.assertEqual(portfolio.step(action_index),
+                             engine.step(portfolio.action_indices(action_index)))
+            self.assertTrue(np.array_equal(np.array(portfolio.get_state())[:, -1], positions))
+
+
+if __name__ == '__main__':
+    unittest.main()
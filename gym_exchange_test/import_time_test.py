@@ -0,0 +1,81 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Only needed for plotting, csv parsing or resampling, none of them on import
+DEFERRED = ['matplotlib', 'pandas', 'imblearn', 'sklearn']
+
+IMPORT_SCRIPT = '''
+import json, os, sys, time, warnings
+warnings.simplefilter('ignore')
+start = time.perf_counter()
+{baseline}
+baseline = time.perf_counter() - start
+try:
+    import {module}
+    error = None
+except ImportError as e:
+    error = e.name
+print(json.dumps({{'baseline': baseline, 'seconds': time.perf_counter() - start,
+                  'error': error, 'loaded': [name for name in {deferred} if name in sys.modules],
+                  'files': os.listdir('.')}}))
+'''
+
+
+def time_import(module, baseline=''):
+    '''
+    Imports module in a fresh interpreter, run in an empty directory
+
+    :param baseline: imports timed first, e.g. what the package can not do without
+    :return: dict of baseline and total seconds, the name of a missing module if
+        the import failed, the deferred modules loaded and the files left in the directory
+    '''
+    with tempfile.TemporaryDirectory() as cwd:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT.format(
+            module=module, baseline=baseline, deferred=DEFERRED)],
+            cwd=cwd, env=env, stdout=subprocess.PIPE, check=True).stdout
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+class TestImportTime(unittest.TestCase):
+    # Seconds an import may take on top of its baseline, generous for a busy machine.
+    #     Before deferring, matplotlib and pandas alone added well over a second
+    budget = 0.5
+
+    def assert_fast_import(self, module, baseline, needs):
+        missing = [name for name in needs if importlib.util.find_spec(name) is None]
+        if missing:
+            self.skipTest(f'{missing} not installed')
+        result = time_import(module, baseline)
+        if result['error'] is not None:
+            self.skipTest(f'{result["error"]} not installed')
+        self.assertEqual(result['loaded'], [], f'import {module} loads them')
+        self.assertEqual(result['files'], [], f'import {module} writes to the working directory')
+        extra = result['seconds'] - result['baseline']
+        self.assertLess(extra, self.budget,
+                        f'import {module}: {result["seconds"]:.3f}s, '
+                        f'{result["baseline"]:.3f}s of it for {baseline!r}')
+
+    def test_gym_exchange(self):
+        self.assert_fast_import('gym_exchange', 'import gym, numpy', ['gym'])
+
+    def test_gym_exchange_envs(self):
+        self.assert_fast_import('gym_exchange.envs', 'import gym, numpy', ['gym'])
+
+    def test_reinforcement(self):
+        # torch is most of it and can not be helped, no logs folder nor figure on import
+        self.assert_fast_import('reinforcement', 'import gym, torch', ['gym', 'torch'])
+
+    def test_supervised(self):
+        self.assert_fast_import('supervised.dataset', 'import torch', ['torch'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import numpy as np
+import tempfile
+import unittest
+from gym_exchange.gym_engine.market_data import _load_market_data
+from gym_exchange.gym_engine.market_store import MarketStore, convert
+
+
+class TestMarketStore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        cls.tickers = ['AAPL', 'AMD', '10K_data.csv']
+        convert(dst=cls.tempdir.name, tickers=cls.tickers)
+        cls.store = MarketStore(cls.tempdir.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+
+    def test_manifest(self):
+        # 10K_data.csv is not daily bars
+        self.assertEqual(self.store.tickers, ['AAPL', 'AMD'])
+        with open('iexfinance/iexdata/AAPL') as f:
+            self.assertEqual(self.store.rows('AAPL'), sum(1 for _ in f) - 1)
+
+    def test_agrees_csv(self):
+        for start_date in ['2013-09-15', '2015-01-01', '2015-01-02', '2030-01-01']:
+            csv = _load_market_data('AAPL', start_date, 10, test=False, store=None)
+            mapped = _load_market_data('AAPL', start_date, 10, test=False, store=self.store)
+            for expected, array in zip(csv, mapped):
+                self.assertTrue(np.array_equal(expected, array))
+
+    def test_mapped(self):
+        ohlcv, dates = self.store.load('AMD', '2016-01-01')
+        self.assertFalse(ohlcv.flags.writeable)
+        self.assertFalse(ohlcv.flags.owndata)
+        self.assertGreaterEqual(dates[0], np.datetime64('2016-01-01'))
+        self.assertLess(self.store.load('AMD')[1][-len(dates) - 1], np.datetime64('2016-01-01'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import unittest
+from gym_exchange.envs import MinuteExchange, MinuteExchangeContinuous
+from gym_exchange.gym_engine.market_data import CLOSE
+from gym_exchange.gym_engine.minute_data import MinuteStream, load_minute_day
+
+
+def write_minute_files(path, tickers, dates, num_minutes, seed=0):
+    # Same columns as the IEX 1d chart download_daily_data.py saves, -1 for missing quotes
+    random = np.random.RandomState(seed)
+    minutes = [f'{9 + (30 + m) // 60:02d}:{(30 + m) % 60:02d}' for m in range(num_minutes)]
+    for date in dates:
+        for ticker in tickers:
+            close = 100.0 * np.exp(np.cumsum(random.normal(0.0, 1e-3, num_minutes)))
+            df = pd.DataFrame({'date': date, 'minute': minutes, 'label': minutes,
+                               'high': close * 1.001, 'low': close * 0.999,
+                               'average': close, 'volume': 100, 'marketHigh': close * 1.001,
+                               'marketLow': close * 0.999, 'marketAverage': close,
+                               'marketVolume': random.randint(0, 1000, num_minutes),
+                               'open': close, 'close': close,
+                               'marketOpen': close, 'marketClose': close})
+            missing = random.rand(num_minutes) < 0.05
+            df.loc[missing, ['marketOpen', 'marketHigh', 'marketLow', 'marketClose']] = -1.0
+            # Not every minute is there for every ticker
+            df = df.drop(index=random.choice(num_minutes, 2, replace=False))
+            df.to_csv(os.path.join(path, f'{date}_{ticker}'))
+
+
+class TestMinuteData(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+        cls.tickers = ['aapl', 'amd']
+        cls.dates = ['20181008', '20181009', '20181010', '20181011', '20181012']
+        write_minute_files(cls.tempdir.name, cls.tickers, cls.dates, 40)
+        # A day missing one ticker is left out
+        write_minute_files(cls.tempdir.name, ['aapl'], ['20181015'], 40)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+
+    def test_load_day(self):
+        prices, minutes = load_minute_day(self.tickers, '20181008', self.tempdir.name)
+        self.assertEqual(prices.shape, (len(minutes), 2, 5))
+        self.assertEqual(minutes, sorted(minutes))
+        self.assertTrue((prices[:, :, :-1] > 0).all())
+
+    def test_chunks_agree(self):
+        whole = MinuteStream(self.tickers, self.tempdir.name, days_per_chunk=len(self.dates),
+                             prefetch=False)
+        self.assertEqual(whole.dates, self.dates)
+        [(prices, deltas, days)] = list(whole)
+        for prefetch in (False, True):
+            chunked = list(MinuteStream(self.tickers, self.tempdir.name, days_per_chunk=2,
+                                        prefetch=prefetch))
+            self.assertEqual(len(chunked), 3)
+            for expected, arrays in zip((prices, deltas, days), zip(*chunked)):
+                self.assertTrue(np.allclose(expected, np.concatenate(arrays)))
+
+    def test_date_range(self):
+        stream = MinuteStream(self.tickers, self.tempdir.name, '20181009', '20181012')
+        self.assertEqual(stream.dates, self.dates[1:4])
+
+
+class TestMinuteExchange(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tempdir = tempfile.TemporaryDirectory()
+
+        class SmallMinuteExchange(MinuteExchangeContinuous):
+            tickers = ['aapl', 'amd', 'msft']
+            minute_path = cls.tempdir.name
+            num_minutes_to_iterate = 50
+            num_minutes_in_state = 5
+            days_per_chunk = 1
+
+        cls.env_cls = SmallMinuteExchange
+        write_minute_files(cls.tempdir.name, SmallMinuteExchange.tickers,
+                           ['20181008', '20181009', '20181010', '20181011'], 45)
+        [(_, cls.deltas, _)] = list(MinuteStream(SmallMinuteExchange.tickers, cls.tempdir.name,
+                                                  days_per_chunk=4, prefetch=False))
+        cls.features = cls.deltas[:, :, :CLOSE + 1].reshape(len(cls.deltas), -1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tempdir.cleanup()
+
+    def test_agrees_whole_data(self):
+        env = self.env_cls()
+        rows_per_chunk = 45
+        window = env.num_minutes_in_state
+        # About 180 rows, episodes take 51 each after a 4 row warm-up: the fourth starts over
+        for episode in range(4):
+            state = env.reset() if episode else env.state
+            self.assertEqual(env.epoch, episode // 3)
+            self.assertLessEqual(len(env.close_delta), env.episode_rows + rows_per_chunk)
+            row = env.offset + env.today
+            self.assertTrue(np.array_equal(state, self.features[row - window + 1:row + 1]))
+
+            position, done, total = np.zeros(3), False, 0.0
+            while not done:
+                action = np.random.uniform(-1.0, 1.0, 3)
+                row = env.offset + env.today
+                state, reward, done, info = env.step(action)
+                self.assertIs(info['stats'], env.stats)
+                if not done:
+                    expected = 0.0 if row == env.offset + env.start \
+                        else (position * self.deltas[row, :, CLOSE]).sum()
+                    self.assertTrue(np.isclose(reward, expected))
+                    self.assertTrue(np.array_equal(state, self.features[row - window + 2:row + 2]))
+                    position, total = action, total + reward
+            self.assertTrue(np.isclose(info['episode']['portfolio']['total_return'], total))
+            self.assertEqual(info['episode']['portfolio']['num_steps'], env.num_minutes_to_iterate + 1)
+        env.close()
+
+    def test_discrete(self):
+        class SmallDiscrete(MinuteExchange):
+            tickers = self.env_cls.tickers
+            minute_path = self.env_cls.minute_path
+            num_minutes_to_iterate = 30
+            num_minutes_in_state = 5
+
+        env = SmallDiscrete()
+        self.assertEqual(env.observation_space.shape, env.state.shape)
+        env.step([0, 1, 2])
+        self.assertTrue(np.array_equal(env.current_position, [-1.0, 0.0, 1.0]))
+        env.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
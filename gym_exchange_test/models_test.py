@@ -0,0 +1,143 @@
+import argparse
+import gym
+import numpy as np
+import torch
+import unittest
+from reinforcement import DuelingDQN
+from reinforcement.models_ddpg import DDPG
+from reinforcement.models_ddpg import Critic
+from reinforcement.utils import OUNoise, Update
+from gym_exchange.envs import StockExchangeContinuous, VecStockExchangeContinuous
+
+
+class SmallExchange(StockExchangeContinuous):
+    tickers = ['aapl', 'amd', 'msft']
+    num_action_space = len(tickers)
+    num_days_to_iterate = 10
+    num_days_in_state = 5
+
+
+class SmallVecExchange(VecStockExchangeContinuous):
+    env_cls = SmallExchange
+
+
+class TestBatchedActions(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(0)
+        self.states = np.random.RandomState(0).randn(16, 5, 4)
+
+    def test_act_batch(self):
+        policy = DuelingDQN(4, 3)
+        greedy = policy.act_batch(self.states, 0.0)
+        self.assertEqual(greedy.shape, (16, ))
+        self.assertEqual([policy.act(state, 0.0) for state in self.states], list(greedy))
+        self.assertTrue(np.array_equal(policy.act_batch(torch.tensor(self.states), 0.0), greedy))
+
+        # One epsilon per state, only the ones at 1 may differ from greedy
+        epsilon = np.tile([0.0, 1.0], 8)
+        actions = np.stack([policy.act_batch(self.states, epsilon, np.random.RandomState(seed))
+                            for seed in range(50)])
+        self.assertTrue((actions[:, ::2] == greedy[::2]).all())
+        self.assertEqual(set(actions[:, 1::2].ravel()), {0, 1, 2})
+
+    def test_select_actions(self):
+        args = argparse.Namespace(actor_learning_rate=1e-4, critic_learning_rate=1e-3, gamma=0.9,
+                                  tau=1e-3)
+        action_space = gym.spaces.Box(-1.0, 1.0, (2, ), np.float32)
+        ddpg = DDPG((5, 4), 16, 2, argparse.Namespace(action_space=action_space), args)
+        actions = ddpg.select_actions(self.states)
+        self.assertEqual(actions.shape, (16, 2))
+        for state, action in zip(self.states, actions):
+            # forward sees a state at a time the same
+            expected = ddpg.actor(torch.tensor(state[np.newaxis], dtype=torch.float32))
+            self.assertTrue(np.allclose(expected.detach().numpy()[0], action, atol=1e-6))
+        # No mode switching and nothing to backpropagate through
+        self.assertTrue(ddpg.actor.training)
+
+        noise = ddpg.noise.vectorized(16)
+        noisy = ddpg.select_actions(self.states, t=np.arange(16), noise=noise)
+        self.assertEqual(noise.state.shape, (16, 2))
+        self.assertFalse(np.allclose(noisy, actions))
+        self.assertTrue((np.abs(noisy) <= 1.0).all())
+
+    def test_vectorized_noise(self):
+        # Every episode follows the process a single one would
+        space = gym.spaces.Box(-1.0, 1.0, (3, ), np.float32)
+        single, batch = OUNoise(space, min_sigma=0.1, decay_period=10), \
+            OUNoise(space, min_sigma=0.1, decay_period=10, num_envs=1)
+        for t in range(5):
+            np.random.seed(t)
+            expected = single.get_noise(t)
+            np.random.seed(t)
+            self.assertTrue(np.array_equal(batch.get_noise([t])[0], expected))
+
+        noise = single.vectorized(4)
+        for _ in range(3):
+            noise.get_noise(np.arange(4))
+        noise.reset([1, 3])
+        self.assertTrue((noise.state[[1, 3]] == 0).all())
+        self.assertTrue((noise.state[[0, 2]] != 0).all())
+        self.assertEqual(single.state.shape, (3, ))
+
+    def test_vec_env(self):
+        # One forward pass per step for all episodes
+        vec_env = SmallVecExchange(4, seed=0)
+        ddpg = DDPG(SmallExchange().observation_space.shape, 16, SmallExchange.num_action_space,
+                    argparse.Namespace(action_space=vec_env.action_space),
+                    argparse.Namespace(actor_learning_rate=1e-4, critic_learning_rate=1e-3))
+        noise = ddpg.noise.vectorized(len(vec_env))
+        states, steps = vec_env.reset(), np.zeros(len(vec_env))
+        for _ in range(SmallExchange.num_days_to_iterate + 2):
+            actions = ddpg.select_actions(states, steps, noise)
+            states, rewards, dones, _ = vec_env.step(actions)
+            steps = np.where(dones, 0, steps + 1)
+            noise.reset(dones)
+        self.assertEqual(states.shape, (4, ) + SmallExchange().observation_space.shape)
+
+    def test_newest_row(self):
+        # Acting on the newest row agrees with the whole window along a real episode
+        env = SmallExchange(0)
+        window, num_features = env.observation_space.shape
+        policy = DuelingDQN(num_features, 3)
+        actor = DDPG((window, num_features), 16, env.num_action_space,
+                     argparse.Namespace(action_space=env.action_space),
+                     argparse.Namespace(actor_learning_rate=1e-4, critic_learning_rate=1e-3)).actor
+        state, done = env.reset(), False
+        while not done:
+            x = torch.tensor(state[np.newaxis], dtype=torch.float32)
+            with torch.no_grad():
+                feature = policy.forward_feature(x)
+                self.assertTrue(torch.allclose(policy.forward_feature_batch(x), feature, atol=1e-6))
+                self.assertEqual(policy.act(state, 0.0), policy.advantage(feature).argmax().item())
+                self.assertTrue(np.allclose(actor.select_action(state), actor(x).numpy()[0],
+                                            atol=1e-6))
+            state, _, done, _ = env.step(actor.select_action(state))
+
+
+class TestUpdate(unittest.TestCase):
+
+    def test_soft_and_hard_update(self):
+        torch.manual_seed(0)
+        for foreach in (True, False):
+            source, target = Critic((5, 4), 16, 2), Critic((5, 4), 16, 2)
+            before = [parameter.clone() for parameter in target.parameters()]
+            pointers = [parameter.data_ptr() for parameter in target.parameters()]
+            default, Update.foreach = Update.foreach, foreach
+            try:
+                Update.soft_update(source, target, 0.1)
+                # In place, the optimizer and anything else holding them sees the update
+                self.assertEqual([parameter.data_ptr() for parameter in target.parameters()],
+                                 pointers)
+                for old, new, parameter in zip(before, target.parameters(), source.parameters()):
+                    self.assertTrue(torch.allclose(new, old * 0.9 + parameter * 0.1, atol=1e-7))
+
+                Update.hard_update(source, target)
+                for name, value in target.state_dict().items():
+                    self.assertTrue(torch.equal(value, source.state_dict()[name]))
+            finally:
+                Update.foreach = default
+
+
+if __name__ == '__main__':
+    unittest.main()
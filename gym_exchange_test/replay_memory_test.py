@@ -0,0 +1,267 @@
+import argparse
+import gym
+import json
+import numpy as np
+import os
+import tempfile
+import torch
+import unittest
+from reinforcement import ArrayReplayBuffer, ReplayMemory, DuelingDQN, PrioritizedReplayBuffer, \
+    SumTree, LinearSchedule
+from reinforcement.models_ddpg import DDPG
+from reinforcement.train import train_dqn, train_ddpg
+
+
+class TestArrayReplayBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.state_shape = (5, 4)
+        self.buffer = ArrayReplayBuffer(100, seed=0)
+
+    def state(self, i):
+        # Every transition recognizable from its states
+        return np.full(self.state_shape, float(i))
+
+    def push(self, start, stop):
+        for i in range(start, stop):
+            self.buffer.push(self.state(i), i % 3, float(i), self.state(i + 1), i % 7 == 0)
+
+    def test_ring(self):
+        self.assertEqual(len(self.buffer), 0)
+        self.push(0, 60)
+        self.assertEqual(len(self.buffer), 60)
+        # Wraps around, the 50 oldest are overwritten
+        self.push(60, 150)
+        self.assertEqual(len(self.buffer), 100)
+        self.assertEqual(sorted(self.buffer.rewards), list(range(50, 150)))
+
+    def test_sample(self):
+        self.push(0, 150)
+        state, action, reward, next_state, done = self.buffer.sample(32)
+        self.assertEqual(state.shape, (32, ) + self.state_shape)
+        self.assertEqual(state.dtype, np.float32)
+        self.assertTrue(state.flags.c_contiguous)
+        self.assertEqual(action.dtype, np.int64)
+        # Every field of a row comes from the same transition
+        self.assertTrue(np.array_equal(state[:, 0, 0], reward))
+        self.assertTrue(np.array_equal(next_state[:, 0, 0], reward + 1))
+        self.assertTrue(np.array_equal(action, reward.astype(np.int64) % 3))
+        self.assertTrue(np.array_equal(done, reward.astype(np.int64) % 7 == 0))
+        self.assertTrue((reward >= 50).all())
+
+        tensors = self.buffer.sample_tensors(8, device='cpu')
+        self.assertEqual([tensor.dtype for tensor in tensors],
+                         [torch.float32, torch.int64, torch.float32, torch.float32, torch.float32])
+
+    def test_continuous_actions(self):
+        buffer = ArrayReplayBuffer(10)
+        buffer.push(self.state(0), np.array([0.5, -0.5]), 1.0, self.state(1), False)
+        _, action, _, _, _ = buffer.sample(4)
+        self.assertEqual(action.shape, (4, 2))
+        self.assertEqual(action.dtype, np.float32)
+
+    def test_train_dqn(self):
+        # Same contract as ReplayMemory, (state, action, reward, next_state) pushes
+        torch.manual_seed(0)
+        policy, target = DuelingDQN(4, 3), DuelingDQN(4, 3)
+        optimizer = torch.optim.RMSprop(policy.parameters())
+        memory = ReplayMemory(1000)
+        for i in range(150):
+            args = (self.state(i) / 150, i % 3, float(i) / 150, self.state(i + 1) / 150)
+            memory.push(*args)
+            self.buffer.push(*args)
+        self.assertIsNone(train_dqn(policy, target, self.buffer, 8, optimizer, 0.9, True))
+        self.push(0, 150)
+        loss = train_dqn(policy, target, self.buffer, 2, optimizer, 0.9, True)
+        self.assertTrue(torch.isfinite(loss))
+        loss = train_dqn(policy, target, memory, 2, optimizer, 0.9, True)
+        self.assertTrue(torch.isfinite(loss))
+
+    def test_frames(self):
+        # Rolling windows of episodes of random length, the last step of an episode
+        #     gives its window back as next state the way StockExchange does when done
+        random = np.random.RandomState(0)
+        window = self.state_shape[0]
+        for buffer_cls in (ArrayReplayBuffer, PrioritizedReplayBuffer):
+            plain = buffer_cls(60, seed=0)
+            framed = buffer_cls(60, seed=0, frames=True, frame_capacity=70)
+            step = 0
+            for _ in range(30):
+                rows = random.randn(window + 10, self.state_shape[1])
+                num_steps = random.randint(1, 11)
+                for i in range(num_steps):
+                    state = rows[i:i + window]
+                    next_state = state if i == num_steps - 1 else rows[i + 1:i + 1 + window]
+                    for buffer in (plain, framed):
+                        buffer.push(state, i % 3, float(step), next_state, i == num_steps - 1)
+                    step += 1
+            # Short episodes take more rows, older transitions had to go
+            self.assertLess(len(framed), len(plain))
+            self.assertLess(framed.nbytes(), plain.nbytes())
+            # Sampled rewards number the transitions, the same one in the plain buffer
+            #     must give the same arrays
+            framed_batch = framed.sample(100)
+            self.assertTrue((framed_batch[2] >= step - len(framed)).all())
+            index_of = {reward: index for index, reward in enumerate(plain.rewards)}
+            plain_batch = plain.gather([index_of[reward] for reward in framed_batch[2]])
+            for framed_array, plain_array in zip(framed_batch, plain_batch):
+                self.assertTrue(np.array_equal(framed_array, plain_array))
+
+    def test_resume(self):
+        # Stopped after a sync and made again on the same path: the same as never stopping
+        random = np.random.RandomState(0)
+        rows = random.randn(200, self.state_shape[1])
+        for buffer_cls in (ArrayReplayBuffer, PrioritizedReplayBuffer):
+            for frames in (False, True):
+                with tempfile.TemporaryDirectory() as path:
+                    def make():
+                        return buffer_cls(50, seed=0, frames=frames, path=path)
+                    in_ram, mapped = buffer_cls(50, seed=0, frames=frames), make()
+                    for i in range(120):
+                        if i == 70:
+                            mapped.sync()
+                            mapped = make()
+                            self.assertEqual(len(mapped), 50)
+                        for buffer in (in_ram, mapped):
+                            buffer.push(rows[i:i + 5], i % 3, float(i), rows[i + 1:i + 6], i % 9 == 0)
+                    self.assertIn('header.json', os.listdir(path))
+                    self.assertEqual((mapped.position, len(mapped)), (in_ram.position, len(in_ram)))
+                    for in_ram_array, mapped_array in zip(in_ram.gather(np.arange(50)),
+                                                          mapped.gather(np.arange(50))):
+                        self.assertTrue(np.array_equal(in_ram_array, mapped_array))
+                    if buffer_cls is PrioritizedReplayBuffer:
+                        in_ram.flush()
+                        mapped.flush()
+                        self.assertTrue(np.array_equal(in_ram.tree.tree, mapped.tree.tree))
+
+    def test_resume_mismatch(self):
+        # A buffer written for another env config must not be read as this one
+        for buffer_cls in (ArrayReplayBuffer, PrioritizedReplayBuffer):
+            with tempfile.TemporaryDirectory() as path:
+                buffer = buffer_cls(20, path=path)
+                for i in range(5):
+                    buffer.push(self.state(i), i % 3, float(i), self.state(i + 1), False)
+                buffer.sync()
+                with open(os.path.join(path, 'header.json')) as f:
+                    header = json.load(f)
+                self.assertEqual(header['state_shape'], list(self.state_shape))
+                self.assertEqual(header['action_dtype'], np.dtype(np.int64).str)
+
+                # Another window, another number of tickers, float actions
+                resumed = buffer_cls(20, path=path)
+                with self.assertRaisesRegex(ValueError, 'another env config'):
+                    resumed.push(np.zeros((6, 4)), 0, 0.0, np.zeros((6, 4)), False)
+                resumed = buffer_cls(20, path=path)
+                with self.assertRaisesRegex(ValueError, 'another env config'):
+                    resumed.push(np.zeros((5, 7)), 0, 0.0, np.zeros((5, 7)), False)
+                resumed = buffer_cls(20, path=path)
+                with self.assertRaisesRegex(ValueError, 'another env config'):
+                    resumed.push(self.state(0), np.float32([0.5]), 0.0, self.state(1), False)
+                self.assertEqual(len(resumed), 5)
+                with self.assertRaisesRegex(ValueError, 'float64'):
+                    buffer_cls(20, state_dtype=np.float64, path=path)
+                with self.assertRaisesRegex(ValueError, '20 transitions'):
+                    buffer_cls(30, path=path)
+
+                # The same layout goes on from where it stopped
+                resumed = buffer_cls(20, path=path)
+                resumed.push(self.state(5), 2, 5.0, self.state(6), False)
+                self.assertEqual(len(resumed), 6)
+
+
+class TestPrioritizedReplayBuffer(unittest.TestCase):
+
+    def test_sum_tree(self):
+        random = np.random.RandomState(0)
+        for capacity in (1, 5, 64, 100):
+            tree = SumTree(capacity)
+            values = np.zeros(capacity)
+            for _ in range(5):
+                indices = random.randint(0, capacity, 7)
+                values[indices] = random.rand(7)
+                # Repeated indices keep the last value, as numpy's assignment does
+                tree.update(indices, values[indices])
+            self.assertTrue(np.isclose(tree.total(), values.sum()))
+            prefix = random.rand(50) * values.sum()
+            expected = np.searchsorted(np.cumsum(values), prefix, side='right')
+            self.assertTrue(np.array_equal(tree.find(prefix), expected))
+            # Past the end by rounding still lands on a value that is not 0
+            self.assertGreater(values[tree.find([values.sum() * (1 + 1e-12)])[0]], 0)
+
+    def test_proportional(self):
+        buffer = PrioritizedReplayBuffer(8, alpha=1.0, beta=LinearSchedule(0.5, 1.0, 10), seed=0)
+        for i in range(8):
+            buffer.push(np.zeros(3), 0, float(i), np.zeros(3), False)
+        priorities = np.arange(1.0, 9.0)
+        buffer.update_priorities(np.arange(8), priorities - buffer.epsilon)
+        counts = np.bincount(np.concatenate([buffer.sample_indices(64) for _ in range(500)]),
+                             minlength=8)
+        self.assertTrue(np.allclose(counts / counts.sum(), priorities / priorities.sum(), atol=0.01))
+        self.assertEqual(buffer.num_samples, 500)
+
+        # beta is 1 by now, the weights undo the sampling bias exactly
+        indices = np.array([0, 3, 7])
+        self.assertTrue(np.allclose(buffer.weights(indices), 1.0 / priorities[indices]))
+        # New transitions come in with the highest priority so far
+        buffer.push(np.zeros(3), 0, 8.0, np.zeros(3), False)
+        buffer.flush()
+        self.assertTrue(np.isclose(buffer.tree[0], 8.0))
+
+    def test_stale_updates(self):
+        # Pushed over between sampling and the update, the new transition keeps its priority
+        buffer = PrioritizedReplayBuffer(4, alpha=1.0, seed=0)
+        for i in range(4):
+            buffer.push(np.zeros(3), 0, float(i), np.zeros(3), False)
+        indices = np.unique(buffer.sample_indices(64))
+        self.assertEqual(list(indices), [0, 1, 2, 3])
+        buffer.push(np.ones(3), 0, 4.0, np.ones(3), False)
+        buffer.update_priorities(indices, np.full(4, 0.5))
+        buffer.flush()
+        self.assertTrue(np.allclose(buffer.tree[indices], [1.0, 0.5, 0.5, 0.5], atol=1e-5))
+        # Sampled again, it is current
+        indices = np.unique(buffer.sample_indices(64))
+        buffer.update_priorities(indices, np.full(4, 2.0))
+        self.assertTrue(np.allclose(buffer.tree[indices], 2.0, atol=1e-5))
+
+        # Dropped by the frame store, it stays at 0
+        buffer = PrioritizedReplayBuffer(8, seed=0, frames=True, frame_capacity=11)
+        rows = np.random.RandomState(0).randn(20, 4)
+        for i in range(3):
+            buffer.push(rows[i:i + 5], 0, 0.0, rows[i + 1:i + 6], False)
+        indices = buffer.sample_indices(16)
+        for i in range(3, 8):
+            buffer.push(rows[i:i + 5], 0, 0.0, rows[i + 1:i + 6], False)
+        buffer.update_priorities(indices, np.ones(16))
+        buffer.flush()
+        kept = (buffer.position - buffer.size + np.arange(buffer.size)) % buffer.capacity
+        dropped = np.setdiff1d(indices, kept)
+        self.assertTrue(len(dropped))
+        self.assertTrue((buffer.tree[dropped] == 0).all())
+
+    def test_train(self):
+        torch.manual_seed(0)
+        states = np.random.RandomState(0).randn(200, 5, 4)
+        buffer = PrioritizedReplayBuffer(200, seed=0)
+        for i in range(199):
+            buffer.push(states[i], i % 3, 0.01 * (i % 5), states[i + 1], i % 50 == 49)
+        policy, target = DuelingDQN(4, 3), DuelingDQN(4, 3)
+        optimizer = torch.optim.RMSprop(policy.parameters())
+        loss = train_dqn(policy, target, buffer, 4, optimizer, 0.9, True)
+        self.assertTrue(torch.isfinite(loss))
+        # Sampled ones got their |TD error|, the rest still have the initial priority of 1
+        self.assertIn((buffer.tree[np.arange(199)] != 1.0).sum(), range(1, 5))
+
+        args = argparse.Namespace(actor_learning_rate=1e-4, critic_learning_rate=1e-3, gamma=0.9,
+                                  tau=1e-3)
+        action_space = gym.spaces.Box(-1.0, 1.0, (2, ), np.float32)
+        ddpg = DDPG((5, 4), 16, 2, argparse.Namespace(action_space=action_space), args)
+        buffer = PrioritizedReplayBuffer(200, seed=0)
+        for i in range(199):
+            buffer.push(states[i], np.float32([0.1, -0.1]), 0.01, states[i + 1], False)
+        value_loss, policy_loss = train_ddpg(ddpg, buffer, 16)
+        self.assertTrue(torch.isfinite(value_loss) and torch.isfinite(policy_loss))
+        self.assertIn((buffer.tree[np.arange(199)] != 1.0).sum(), range(1, 17))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,312 @@
+import numpy as np
+import os
+import tempfile
+import unittest
+from gym_exchange.envs import StockExchangeContinuous, VecStockExchangeContinuous, \
+    SubprocVecStockExchangeContinuous, EpisodeSampler
+from gym_exchange.gym_engine import RenderRecorder
+
+
+class SmallExchange(StockExchangeContinuous):
+    tickers = ['aapl', 'amd', 'msft']
+    num_action_space = len(tickers)
+    num_days_to_iterate = 40
+    num_days_in_state = 5
+
+
+class TestStockExchangeWindow(unittest.TestCase):
+
+    def setUp(self):
+        self.env = SmallExchange()
+
+    def rolled(self, window):
+        # What the running state used to do: shift up, append the newest holdings-free row
+        new_row = np.concatenate([state[:-1] for state in self.env.env.get_state()])
+        window = np.roll(window, -1, axis=0)
+        window[-1] = new_row
+        return window
+
+    def test_window_agrees_rolling_state(self):
+        # Start from a clean engine, without the warm-up steps of reset()
+        expected = np.zeros_like(self.env.get_running_state())
+        self.env.env.reset_game()
+        state = self.env.get_window()
+        self.assertTrue(np.array_equal(state, expected))
+
+        done = False
+        while not done:
+            action = np.random.uniform(-1.0, 1.0, self.env.num_action_space)
+            state, _, done, _ = self.env.step(action)
+            if not done:
+                expected = self.rolled(expected)
+            # Once done, the cursor stops and so does the window
+            self.assertTrue(np.array_equal(state, expected))
+
+    def test_window_is_a_read_only_view(self):
+        state = self.env.reset()
+        self.assertFalse(state.flags.writeable)
+        self.assertFalse(state.flags.owndata)
+        next_state, _, _, _ = self.env.step(np.zeros(self.env.num_action_space))
+        self.assertTrue(np.array_equal(state[1:], next_state[:-1]))
+
+    def test_random_start_offset(self):
+        class OffsetExchange(SmallExchange):
+            random_start_offset = 30
+
+        env = OffsetExchange()
+        for _ in range(5):
+            state = env.reset()
+            start = env.env.panel.start
+            self.assertLessEqual(start, OffsetExchange.random_start_offset)
+            self.assertEqual(env.env.today, start + env.num_days_in_state - 1)
+            self.assertTrue(np.array_equal(state, env.features[start + np.arange(env.num_days_in_state)
+                                                               + env.num_days_in_state - 1]))
+
+        num_steps, done = 0, False
+        while not done:
+            _, _, done, _ = env.step(np.zeros(env.num_action_space))
+            num_steps += 1
+        self.assertEqual(env.env.today - start, OffsetExchange.num_days_to_iterate + 1)
+
+    def test_file_render(self):
+        with tempfile.TemporaryDirectory() as path:
+            class RecordedExchange(SmallExchange):
+                render_mode = 'file'
+                render_path = path
+                render_interval = 0.0
+
+            env = RecordedExchange()
+            for _ in range(2):
+                env.reset()
+                done = False
+                while not done:
+                    _, _, done, _ = env.step(np.zeros(env.num_action_space))
+                    env.render()
+            _, _, pnl = env.recorder.history()
+            self.assertTrue(np.allclose(pnl[-1], env.env.panel.accumulated_pnl))
+            env.close()
+
+            self.assertIsNone(env.env.fig)
+            self.assertEqual(sorted(os.listdir(path)), ['episode_0000.png', 'episode_0001.png'])
+
+    def test_file_render_every_episode(self):
+        # With the default interval, episodes far shorter than it still get their figure
+        with tempfile.TemporaryDirectory() as path:
+            class RecordedExchange(SmallExchange):
+                render_mode = 'file'
+                render_path = path
+
+            env = RecordedExchange()
+            self.assertEqual(env.recorder.interval, 10.0)
+            for episode in range(3):
+                env.reset()
+                # Written before close(), when the episode ended
+                env.recorder.flush()
+                self.assertEqual(len(os.listdir(path)), episode)
+                done = False
+                while not done:
+                    _, _, done, _ = env.step(np.zeros(env.num_action_space))
+                    env.render()
+            env.close()
+            self.assertEqual(sorted(os.listdir(path)),
+                             ['episode_0000.png', 'episode_0001.png', 'episode_0002.png'])
+            self.assertEqual(env.recorder.dropped, 0)
+
+
+class SampledExchange(SmallExchange):
+    episode_sampling = 'stratified'
+    validation_date = '2016-01-01'
+
+
+class SampledVecExchange(VecStockExchangeContinuous):
+    env_cls = SampledExchange
+
+
+class TestEpisodeSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = np.arange('2014-01-01', '2014-12-31', dtype='datetime64[D]')
+        self.episode_days = 30
+
+    def test_split(self):
+        sampler = EpisodeSampler(self.dates, self.episode_days, validation_date='2014-10-01', seed=0)
+        train = sampler.sample('train', 1000)
+        validation = sampler.sample('validation', 1000)
+        self.assertLess(self.dates[train.max() + self.episode_days - 1], np.datetime64('2014-10-01'))
+        self.assertGreaterEqual(self.dates[validation.min()], np.datetime64('2014-10-01'))
+        self.assertLessEqual(validation.max() + self.episode_days, len(self.dates))
+
+    def test_stratified(self):
+        sampler = EpisodeSampler(self.dates, self.episode_days, strategy='stratified',
+                                 num_strata=10, seed=0)
+        # One round visits every bin once
+        starts = sampler.sample(size=10)
+        bins = np.linspace(0, sampler.num_starts(), 11)
+        self.assertEqual(sorted(np.digitize(starts, bins) - 1), list(range(10)))
+
+    def test_env(self):
+        env = SampledExchange(seed=0)
+        last_train = np.datetime64('2016-01-01')
+        for split in ('train', 'validation'):
+            env.split = split
+            for _ in range(20):
+                env.reset()
+                start = env.env.panel.start
+                last_day = env.env.panel.dates[start + env.num_days_to_iterate + 1]
+                if split == 'train':
+                    self.assertLess(last_day, last_train)
+                else:
+                    self.assertGreaterEqual(env.env.panel.dates[start], last_train)
+
+        vec_env = SampledVecExchange(16, seed=0)
+        vec_env.reset()
+        self.assertTrue((env.env.panel.dates[vec_env.start + SampledExchange.num_days_to_iterate + 1]
+                         < last_train).all())
+
+
+class SmallVecExchange(VecStockExchangeContinuous):
+    env_cls = SmallExchange
+
+
+class FailingRecorder(RenderRecorder):
+    def write(self, episode, days, close, pnl):
+        raise OSError('disk full')
+
+
+class TestRenderRecorder(unittest.TestCase):
+
+    def test_write_error(self):
+        # The writer outlives the error, flush and close raise it, nothing blocks
+        with tempfile.TemporaryDirectory() as path:
+            recorder = FailingRecorder(['aapl', 'amd'], path, interval=0.0)
+            history = lambda: (np.arange(3), np.ones((3, 2)), np.zeros((3, 2)))
+            for today in range(3):
+                recorder.record(today, history)
+            recorder.end_episode(block=True)
+            with self.assertRaisesRegex(OSError, 'disk full'):
+                recorder.flush()
+            # More than the queue holds, each waits on the writer
+            for _ in range(3):
+                recorder.record(0, history)
+                recorder.end_episode(block=True)
+            self.assertTrue(recorder.thread.is_alive())
+            with self.assertRaisesRegex(OSError, 'disk full'):
+                recorder.close()
+            self.assertFalse(recorder.thread.is_alive())
+            self.assertEqual(os.listdir(path), [])
+
+
+class TestRunningStats(unittest.TestCase):
+
+    def test_info_stats(self):
+        # Every step hands out the running stats, they agree with the rewards so far
+        env = SmallExchange()
+        env.reset()
+        rewards, done = [], False
+        while not done:
+            _, reward, done, info = env.step(np.random.uniform(-1.0, 1.0, env.num_action_space))
+            self.assertIs(info['stats'], env.env.stats)
+            portfolio = info['stats'].portfolio()
+            if not done:
+                rewards += [reward]
+                self.assertEqual(portfolio['num_steps'], len(rewards))
+                self.assertTrue(np.isclose(portfolio['total_return'], np.sum(rewards)))
+                self.assertTrue(np.isclose(portfolio['mean'], np.mean(rewards)))
+                if len(rewards) > 1:
+                    self.assertTrue(np.isclose(portfolio['std'], np.std(rewards, ddof=1)))
+        # The done step is not part of them, and the summary is what they read by then
+        for metric, value in info['episode']['portfolio'].items():
+            self.assertTrue(np.isclose(portfolio[metric], value))
+
+
+class TestVecStockExchange(unittest.TestCase):
+
+    def test_agrees_single_env(self):
+        env = SmallExchange()
+        vec_env = SmallVecExchange(2, start_offsets=[0, 0])
+
+        state, states = env.reset(), vec_env.reset()
+        self.assertTrue(np.array_equal(states[0], state))
+
+        done = False
+        while not done:
+            action = np.random.uniform(-1.0, 1.0, env.num_action_space)
+            state, reward, done, info = env.step(action)
+            states, rewards, dones, infos = vec_env.step(np.stack([action, action]))
+
+            self.assertTrue(np.allclose(rewards, reward))
+            self.assertTrue((dones == done).all())
+            if not done:
+                self.assertTrue(np.array_equal(states[1], state))
+            else:
+                self.assertTrue(np.array_equal(infos[1]['terminal_observation'], state))
+                for name, metrics in info['episode'].items():
+                    for metric, value in metrics.items():
+                        self.assertTrue(np.isclose(infos[1]['episode'][name][metric], value))
+
+        # Episodes were reset on the spot
+        self.assertTrue(np.array_equal(states[0], env.reset()))
+
+    def test_random_offsets(self):
+        vec_env = SmallVecExchange(8, seed=0)
+        states = vec_env.reset()
+        self.assertEqual(states.shape, (8, ) + SmallExchange().get_window().shape)
+        self.assertTrue((vec_env.start <= vec_env.max_start_offset).all())
+        for i, start in enumerate(vec_env.start):
+            today = start + vec_env.window - 1
+            self.assertTrue(np.array_equal(states[i], vec_env.features[today:today + vec_env.window]))
+
+
+class SmallSubprocVecExchange(SubprocVecStockExchangeContinuous):
+    env_cls = SmallExchange
+
+
+class FailingExchange(SmallExchange):
+    def step(self, actions):
+        raise ValueError('broken env')
+
+
+class FailingSubprocVecExchange(SubprocVecStockExchangeContinuous):
+    env_cls = FailingExchange
+
+
+class TestSubprocVecStockExchange(unittest.TestCase):
+
+    def test_agrees_single_envs(self):
+        num_envs = 3
+        envs = [SmallExchange() for _ in range(num_envs)]
+        vec_env = SmallSubprocVecExchange(num_envs, num_workers=2)
+        try:
+            states = vec_env.reset()
+            for env, state in zip(envs, states):
+                self.assertTrue(np.array_equal(env.reset(), state))
+
+            # Long enough to go through an automatic reset
+            for _ in range(SmallExchange.num_days_to_iterate + 5):
+                actions = np.random.uniform(-1.0, 1.0, (num_envs, SmallExchange.num_action_space))
+                vec_env.step_async(actions)
+                expected = []
+                for env, action in zip(envs, actions):
+                    state, reward, done, _ = env.step(action)
+                    expected += [(env.reset() if done else state, reward, done)]
+                states, rewards, dones, _ = vec_env.step_wait()
+
+                for (state, reward, done), i in zip(expected, range(num_envs)):
+                    self.assertTrue(np.array_equal(states[i], state))
+                    self.assertEqual(rewards[i], reward)
+                    self.assertEqual(dones[i], done)
+        finally:
+            vec_env.close()
+
+    def test_worker_error(self):
+        # The worker's traceback comes back with the exception, all workers are closed
+        vec_env = FailingSubprocVecExchange(2, num_workers=2)
+        vec_env.reset()
+        with self.assertRaisesRegex(RuntimeError, r'(?s)Worker 0 failed:.*ValueError: broken env'):
+            vec_env.step(np.zeros((2, SmallExchange.num_action_space)))
+        self.assertTrue(vec_env.closed)
+        self.assertFalse(any(process.is_alive() for process in vec_env.processes))
+
+
+if __name__ == '__main__':
+    unittest.main()
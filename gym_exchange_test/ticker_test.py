@@ -1,6 +1,7 @@
 import numpy as np
 import unittest
-from gym_exchange.gym_engine import Ticker
+from gym_exchange.gym_engine import Ticker, TickerContinuous
+from gym_exchange.gym_engine.market_data import MarketDataCache, load_market_data, cache
 
 
 class TestTicker(unittest.TestCase):
@@ -71,6 +72,40 @@ class TestTicker(unittest.TestCase):
                          np.sum(list(map(lambda x: self.ticker.action_space[x], self.get_actions()))))
         self.ticker.reset()
 
+    # get_state reads the arrays directly, df is only assembled for inspection
+    def test_state_agrees_df(self):
+        self.get_rewards()
+        state = self.ticker.get_state()
+        expected = np.array(self.ticker.df.iloc[self.ticker.today, -7:-2])
+        expected[-1] = self.ticker.current_position
+        self.assertTrue(np.array_equal(state, expected))
+        self.ticker.reset()
+
+
+class TestMarketDataCache(unittest.TestCase):
+
+    def test_tickers_share_arrays(self):
+        first = Ticker('aapl', '2015-01-01', 10)
+        second = TickerContinuous('aapl', '2015-01-01', 10)
+        self.assertIs(first.deltas, second.deltas)
+        self.assertFalse(first.deltas.flags.writeable)
+        self.assertIn(('AAPL', '2015-01-01', 'ohlcv_pct_change'), cache)
+
+    def test_lru_eviction(self):
+        entry = load_market_data('AMD', '2015-01-01', 10)
+        nbytes = MarketDataCache._nbytes(entry)
+        lru = MarketDataCache(max_bytes=2 * nbytes)
+
+        lru.get('a', lambda: entry)
+        lru.get('b', lambda: entry)
+        lru.get('a', lambda: entry)
+        lru.get('c', lambda: entry)
+
+        self.assertEqual(len(lru), 2)
+        self.assertNotIn('b', lru)
+        self.assertEqual((lru.hits, lru.misses), (1, 3))
+        self.assertLessEqual(lru.nbytes, lru.max_bytes)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,69 @@
+import numpy as np
+import tempfile
+import unittest
+from gym_exchange.envs import StockExchangeContinuous, TrajectoryRecorder, TrajectoryReader
+
+
+class SmallExchange(StockExchangeContinuous):
+    tickers = ['aapl', 'amd', 'msft']
+    num_action_space = len(tickers)
+    num_days_to_iterate = 40
+    num_days_in_state = 5
+
+
+class TestTrajectoryRecorder(unittest.TestCase):
+
+    def record(self, path, num_steps, **kwargs):
+        env = TrajectoryRecorder(SmallExchange(), path, chunk_size=16, **kwargs)
+        expected = []
+        state = env.reset()
+        for i in range(num_steps):
+            action = np.random.uniform(-1.0, 1.0, 3)
+            next_state, reward, done, _ = env.step(action)
+            expected += [(state.copy(), action, reward, done, next_state.copy())]
+            # Also cut an episode short
+            state = env.reset() if done or i == 90 else next_state
+        env.close()
+        return expected
+
+    def test_round_trip(self):
+        for compress in (True, False):
+            with tempfile.TemporaryDirectory() as path:
+                expected = self.record(path, 100, compress=compress)
+                reader = TrajectoryReader(path)
+                self.assertEqual(len(reader), 100)
+                # 16 rows per chunk, the last one holds what was left at close()
+                self.assertEqual(reader.chunk_rows, [16] * 6 + [4])
+
+                data = reader.load()
+                for i, (state, action, reward, done, next_state) in enumerate(expected):
+                    self.assertTrue(np.array_equal(data['obs'][i], state))
+                    self.assertTrue(np.array_equal(data['action'][i], action))
+                    self.assertEqual(data['reward'][i], reward)
+                    self.assertEqual(data['done'][i], done)
+                    self.assertTrue(np.array_equal(data['next_obs'][i], next_state))
+                self.assertTrue(np.array_equal(data['reward'], data['score']))
+
+                # Two episodes that ran to done, the third is cut short by the reset
+                #     after row 90 and the rows after it are a fourth
+                first, second = np.flatnonzero(data['done']) + 1
+                self.assertEqual(data['episode'][-1], 3)
+                self.assertTrue((data['episode'][first:second] == 1).all())
+                self.assertTrue((data['episode'][second:91] == 2).all())
+                self.assertTrue((data['episode'][91:] == 3).all())
+                self.assertTrue(np.array_equal(data['step'][second:91], np.arange(91 - second)))
+                self.assertTrue(np.array_equal(data['step'][91:], np.arange(100 - 91)))
+                self.assertEqual([episode['episode'] for episode in reader.episodes()], [0, 1])
+                if not compress:
+                    self.assertIsInstance(reader.chunk(0)['reward'], np.memmap)
+
+    def test_stream_columns(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.record(path, 40)
+            rewards = [chunk['reward'] for chunk in TrajectoryReader(path).chunks(['reward'])]
+            self.assertEqual(sum(map(len, rewards)), 40)
+            self.assertEqual(list(TrajectoryReader(path).chunk(0, ['done'])), ['done'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,8 @@
 from reinforcement.models_dqn import DuelingDQN
 from reinforcement.environment import device
-from reinforcement.replay_memory import ReplayBuffer, ReplayMemory, ReplayMemoryWithDone, Transition, TransitionDone
+from reinforcement.replay_memory import ArrayReplayBuffer, ReplayBuffer, ReplayMemory, ReplayMemoryWithDone, Transition, TransitionDone
+from reinforcement.replay_memory import PrioritizedReplayBuffer, SumTree, LinearSchedule
 from reinforcement.train import train_dqn
 from reinforcement.run_exchange import RunExchange
+from reinforcement.actor_learner import ActorLearner
 from reinforcement.utils import NormalizedActions
@@ -0,0 +1,257 @@
+from collections import Counter
+from copy import deepcopy
+from itertools import count
+import queue
+import time
+import traceback
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+from reinforcement.utils import decayed_epsilon
+
+
+class SharedWeights:
+    def __init__(self, module, context):
+        '''
+        A cpu copy of module in shared memory that the learner publishes to and the
+        actors copy from. The lock keeps an actor from copying half a publish.
+
+        :param module: the learner's model, on any device
+        :param context: multiprocessing context the actors are started from
+        '''
+        self.module = deepcopy(module).cpu().share_memory()
+        self.lock = context.Lock()
+        self.version = context.Value('q', 0, lock=False)
+
+    def publish(self, module):
+        with self.lock:
+            # load_state_dict copies into the shared tensors, they stay shared
+            self.module.load_state_dict(module.state_dict())
+            self.version.value += 1
+
+    def pull(self, module, version=-1):
+        '''
+        Copies the published weights into module if they changed since version
+
+        :return: the version module now has
+        '''
+        if self.version.value == version:
+            return version
+        with self.lock:
+            module.load_state_dict(self.module.state_dict())
+            return self.version.value
+
+
+class DQNActor:
+    '''
+    Epsilon greedy on the policy, as RunExchange.train_exchange_dqn acts. epsilon
+    decays with the episode number over all actors
+    '''
+    def __init__(self, max_epsilon, min_epsilon, n_train):
+        self.max_epsilon = max_epsilon
+        self.min_epsilon = min_epsilon
+        self.n_train = n_train
+
+    def begin_episode(self, i_episode):
+        self.epsilon = decayed_epsilon(i_episode, self.max_epsilon, self.min_epsilon, self.n_train)
+        self.actions = Counter()
+
+    def act(self, model, state, step):
+        action = model.act_batch(np.asarray(state)[np.newaxis], self.epsilon)[0].item()
+        self.actions[action] += 1
+        return action
+
+    def transition(self, state, action, reward, next_state, done):
+        # RunExchange pushes no done
+        return state, action, reward, next_state
+
+    def summary(self):
+        return {'epsilon': self.epsilon, 'actions': self.actions}
+
+
+class DDPGActor:
+    '''
+    The actor network plus OU noise, as DDPG.select_action acts
+    '''
+    def __init__(self, noise):
+        self.noise = noise
+
+    def begin_episode(self, i_episode):
+        self.noise.reset()
+        self.actions = []
+
+    def act(self, model, state, step):
+        action = model.select_actions(np.asarray(state)[np.newaxis])[0]
+        action = np.clip(action + self.noise.get_noise(step), -1.0, 1.0)
+        self.actions += [action]
+        return action
+
+    def transition(self, state, action, reward, next_state, done):
+        return state, action, reward, next_state, done
+
+    def summary(self):
+        return {'action_avg': np.average(self.actions), 'action_std': np.std(self.actions)}
+
+
+def _actor(rank, env_cls, seed, agent, weights, transitions_queue, stop, steps, episodes,
+           n_train, send_every, sync_every):
+    '''
+    Plays episodes until n_train of them were started over all actors, sending its
+    transitions send_every at a time and an ('episode', rank, (i_episode, reward,
+    summary)) when one ends. Pulls the published weights every sync_every steps.
+    '''
+    # One sample at a time, more threads only fight the learner for the cores
+    torch.set_num_threads(1)
+    # Forked actors inherit the parent's global RNG, which drives epsilon and the noise
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+    try:
+        env = env_cls(seed)
+        model = deepcopy(weights.module)
+        model.eval()
+        version = weights.pull(model)
+        transitions = []
+        while not stop.is_set():
+            with episodes.get_lock():
+                episodes.value += 1
+                i_episode = episodes.value
+            if i_episode > n_train:
+                break
+
+            agent.begin_episode(i_episode)
+            state = env.reset()
+            episode_reward = 0.0
+            for step in count(1):
+                if steps[rank] % sync_every == 0:
+                    version = weights.pull(model, version)
+                action = agent.act(model, state, step)
+                next_state, reward, done, _ = env.step(action)
+                transitions += [agent.transition(state, action, reward, next_state, done)]
+                state = next_state
+                episode_reward += reward
+                steps[rank] += 1
+
+                if len(transitions) == send_every or done:
+                    transitions_queue.put(('transitions', rank, transitions))
+                    transitions = []
+                if done:
+                    transitions_queue.put(('episode', rank,
+                                           (i_episode, episode_reward, agent.summary())))
+                    break
+                if stop.is_set():
+                    break
+        transitions_queue.put(('done', rank, None))
+    except KeyboardInterrupt:
+        transitions_queue.put(('done', rank, None))
+    except Exception:
+        transitions_queue.put(('error', rank, traceback.format_exc()))
+
+
+class ActorLearner:
+    '''
+    num_actors processes playing env_cls episodes with a copy of model, and the learner,
+    the process that makes this, taking in their transitions
+
+    The actors send transitions through a queue, receive() pushes them into the
+    learner's replay memory. So any replay memory works and only the learner touches
+    it. The learner publishes its weights with publish(), actors pick them up every
+    sync_every steps. Actor steps and learner updates are counted apart, see
+    throughput().
+    '''
+    def __init__(self, model, env_cls, agent, num_actors, n_train, seed=None, send_every=64,
+                 sync_every=100, start_method=None):
+        '''
+        :param model: what the actors act with, DuelingDQN or the DDPG actor
+        :param env_cls: built in every actor as env_cls(seed + rank), old step API
+        :param agent: DQNActor or DDPGActor
+        :param num_actors: processes stepping envs
+        :param n_train: episodes over all actors
+        :param seed: actor rank gets seed + rank, random if None
+        :param send_every: transitions an actor batches per message
+        :param sync_every: actor steps between weight pulls
+        :param start_method: multiprocessing start method, platform default if None
+        '''
+        context = mp.get_context(start_method)
+        seed = np.random.randint(2 ** 31 - num_actors) if seed is None else seed
+        self.num_actors = num_actors
+        self.weights = SharedWeights(model, context)
+        # Bounded, actors wait when the learner can not keep up with taking transitions in
+        self.queue = context.Queue(maxsize=16 * num_actors)
+        self.stop = context.Event()
+        self.steps = context.Array('q', num_actors, lock=False)
+        self.episodes = context.Value('q', 0)
+        self.processes = []
+        for rank in range(num_actors):
+            process = context.Process(target=_actor,
+                                      args=(rank, env_cls, seed + rank, agent, self.weights,
+                                            self.queue, self.stop, self.steps, self.episodes,
+                                            n_train, send_every, sync_every),
+                                      daemon=True)
+            process.start()
+            self.processes += [process]
+
+        self.running = num_actors
+        self.num_pushes = 0
+        self.num_updates = 0
+        self.start_time = time.perf_counter()
+        self.last = (self.start_time, 0, 0)
+
+    def receive(self, replay_memory, block=False, timeout=0.1):
+        '''
+        Pushes the transitions the actors sent so far into replay_memory
+
+        :param block: wait up to timeout for a message when there is none yet
+        :return: (i_episode, reward, summary) of the episodes that ended
+        '''
+        episodes = []
+        while self.running:
+            try:
+                kind, rank, data = self.queue.get(block, timeout)
+            except queue.Empty:
+                break
+            block = False
+            if kind == 'transitions':
+                for transition in data:
+                    replay_memory.push(*transition)
+                self.num_pushes += len(data)
+            elif kind == 'episode':
+                episodes += [data]
+            elif kind == 'done':
+                self.running -= 1
+            else:
+                self.close()
+                raise RuntimeError(f'Actor {rank} failed:\n{data}')
+        return episodes
+
+    def publish(self, model):
+        self.weights.publish(model)
+
+    def throughput(self, since_start=False):
+        '''
+        :param since_start: rates over the whole run rather than since the last call
+        :return: dict of actor steps/sec in total and per actor, learner updates/sec
+        '''
+        now, steps = time.perf_counter(), np.array(self.steps[:])
+        start, start_steps, start_updates = (self.start_time, 0, 0) if since_start else self.last
+        elapsed = max(now - start, 1e-9)
+        self.last = (now, steps, self.num_updates)
+        return {'actor_steps_per_sec': float((steps - start_steps).sum() / elapsed),
+                'per_actor_steps_per_sec': ((steps - start_steps) / elapsed).tolist(),
+                'learner_updates_per_sec': (self.num_updates - start_updates) / elapsed}
+
+    def close(self):
+        # Actors blocked on a full queue, or whose queue is not flushed yet, never exit
+        self.stop.set()
+        while any(process.is_alive() for process in self.processes):
+            try:
+                self.queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for process in self.processes:
+            process.join()
+        self.running = 0
+
+    def __repr__(self):
+        return f'ActorLearner({self.num_actors} actors, {self.num_pushes} transitions, ' \
+               f'{self.num_updates} updates)'
@@ -2,7 +2,6 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
-from reinforcement import device
 from gym_exchange.gym_engine import iterable
 
 
@@ -48,10 +47,29 @@ class Actor(nn.Module):
         x = self.s2(x)
         return F.tanh(self.out(x))
 
+    def forward_states(self, x):
+        # forward of every state on its own. The LSTM is not batch_first, a (1 x window x
+        #     features) state is one step over a batch of window rows from a zero state and
+        #     only the newest row is kept, so the newest rows of N states go through as one
+        #     step over a batch of N. Acting step by step then costs one row, not window
+        #     rows, and there is no hidden state to carry, see DuelingDQN.forward_feature_batch
+        if self.s0:
+            x = self.s0(x[:, -1, :].unsqueeze(0))[0][0]
+        else:
+            x = self.s1(x)
+        x = self.s2(x)
+        return F.tanh(self.out(x))
+
     def select_action(self, state):
-        state = torch.FloatTensor(state).unsqueeze(0).to(device)
-        action = self.forward(state).detach()
-        return action.cpu().numpy()[0]
+        return self.select_actions(np.asarray(state)[np.newaxis])[0]
+
+    def select_actions(self, states):
+        # (N x ...) states to (N x actions), one forward pass. LayerNorm acts the same
+        #     in train() and eval(), no switching needed
+        with torch.inference_mode():
+            states = torch.as_tensor(np.asarray(states, dtype=np.float32),
+                                     device=next(self.parameters()).device)
+            return self.forward_states(states).cpu().numpy()
 
 
 class Critic(nn.Module):
@@ -116,13 +134,25 @@ class DDPG(nn.Module):
         self.value_loss_fn = nn.MSELoss()
 
     def select_action(self, state, t=0):
-        self.actor.eval()
-        # should detach from here...
         action = self.actor.select_action(state)
         action += self.get_noise(t)
-        self.actor.train()
         return np.clip(action, -1.0, 1.0)
 
+    def select_actions(self, states, t=0, noise=None):
+        '''
+        select_action for a batch of states, e.g. of a VecStockExchangeContinuous
+
+        :param states: (N x ...) array
+        :param t: step for the noise decay, one for all or one per episode
+        :param noise: OUNoise for the N episodes, see OUNoise.vectorized. None adds no
+            noise, e.g. to evaluate
+        :return: (N x actions) float32 actions in [-1, 1]
+        '''
+        actions = self.actor.select_actions(states)
+        if noise is not None:
+            actions += noise.get_noise(t)
+        return np.clip(actions, -1.0, 1.0)
+
     def reset_noise(self):
         self.noise.reset()
 
@@ -133,27 +163,41 @@ class DDPG(nn.Module):
         action = self.actor(state)
         return -self.critic(state, action).mean()
 
-    def get_value_loss(self, state, action, reward, next_state, done):
+    def get_expected_and_pred_value(self, state, action, reward, next_state, done):
         next_action = self.actor_target(next_state).detach()
         target_value = self.critic_target(next_state, next_action).detach()
 
         expected_value = reward + (1.0 - done) * target_value * self.args.gamma
 
         pred_value = self.critic(state, action)
+        return expected_value, pred_value
+
+    def get_value_loss(self, state, action, reward, next_state, done):
+        expected_value, pred_value = self.get_expected_and_pred_value(
+            state, action, reward, next_state, done)
 
         value_loss = self.value_loss_fn(pred_value, expected_value)
         return value_loss
 
+    def get_td_errors(self, state, action, reward, next_state, done):
+        # Per transition, for prioritized replay: the value loss is their weighted squares
+        expected_value, pred_value = self.get_expected_and_pred_value(
+            state, action, reward, next_state, done)
+        return expected_value - pred_value
+
     def forward(self, x):
         raise NotImplementedError
 
     def update(self, value_loss, policy_loss):
+        # Both backward passes before either step: policy_loss goes through the critic,
+        #     stepping it first changes weights that backward still needs. Only the actor
+        #     takes gradients from policy_loss
         self.optim_critic.zero_grad()
         value_loss.backward()
-        self.optim_critic.step()
-
         self.optim_actor.zero_grad()
-        policy_loss.backward()
+        policy_loss.backward(inputs=list(self.actor.parameters()))
+
+        self.optim_critic.step()
         self.optim_actor.step()
 
         Update.soft_update(self.critic, self.critic_target, self.args.tau)
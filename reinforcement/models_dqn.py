@@ -44,6 +44,20 @@ class DuelingDQN(nn.Module):
         x, h1 = self.feature(x)
         return x[:, -1, :]
 
+    def forward_feature_batch(self, x):
+        '''
+        forward_feature of every state on its own, as act sees it, from the newest rows alone
+
+        The GRU is not batch_first, a (1 x window x features) state is one step over a
+        batch of window rows from a zero hidden state and only the newest row is kept.
+        So the older rows never count and there is no hidden state to carry from one env
+        step to the next: the newest rows of N states go through as one step over a batch
+        of N, one row per state instead of window of them. Carrying the hidden state over
+        env steps would feed the heads features the policy was never trained on.
+        '''
+        x, h1 = self.feature(x[:, -1, :].unsqueeze(0))
+        return x[0]
+
     def forward(self, x):
         x = self.forward_feature(x)
         value = self.value(x)
@@ -55,15 +69,41 @@ class DuelingDQN(nn.Module):
 
     def act(self, x, epsilon):
         if not torch.is_tensor(x):
-            x = torch.tensor([x], dtype=torch.float32, device=device)
+            x = torch.as_tensor(np.asarray(x, dtype=np.float32)[np.newaxis], device=device)
 
         assert x.dim() == 3, 'Somehow, x.shape is: {}'.format(x.shape)
 
         if np.random.rand() > epsilon:
-            x = self.forward_feature(x).detach()
-            # print(self.advantage(x).detach().sort(dim=1, descending=True))
-            x = self.advantage(x).detach().argmax().item()
+            # Only the newest row goes through the GRU, the same as forward_feature(x)
+            with torch.inference_mode():
+                x = self.forward_feature_batch(x)
+                # print(self.advantage(x).sort(dim=1, descending=True))
+                x = self.advantage(x).argmax().item()
             return x
         else:
             return np.random.randint(self.n_action_space)
 
+    def act_batch(self, x, epsilon, random=np.random):
+        '''
+        act for a batch of states, e.g. of a VecStockExchange: one forward pass for all
+        of them and the epsilon-greedy draws at once. Runs under inference_mode without
+        eval(), there is no dropout nor batch norm to switch.
+
+        :param x: (N x window x features) array or tensor
+        :param epsilon: one for all states or one per state
+        :param random: numpy RandomState the draws come from, the global one by default
+        :return: (N, ) int64 actions
+        '''
+        num_states = len(x)
+        # Random action where the draw is at most epsilon, as in act
+        explore = random.random_sample(num_states) <= epsilon
+        actions = random.randint(0, self.n_action_space, num_states)
+        greedy = ~explore
+        if greedy.any():
+            x = x[torch.from_numpy(greedy)] if torch.is_tensor(x) else np.asarray(x)[greedy]
+            with torch.inference_mode():
+                x = torch.as_tensor(x, dtype=torch.float32, device=next(self.parameters()).device)
+                advantage = self.advantage(self.forward_feature_batch(x))
+                actions[greedy] = advantage.argmax(1).cpu().numpy()
+        return actions
+
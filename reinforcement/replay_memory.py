@@ -1,6 +1,10 @@
 from collections import deque, namedtuple
+import json
 import numpy as np
+import os
 import random
+import torch
+from reinforcement.environment import device
 
 
 Transition = namedtuple('Transition',
@@ -9,6 +13,9 @@ Transition = namedtuple('Transition',
 TransitionDone = namedtuple('TransitionDone',
                             ('state', 'action', 'reward', 'next_state', 'done'))
 
+# Position, size and the like of a memory-mapped ArrayReplayBuffer
+HEADER = 'header.json'
+
 
 # ReplayBuffer is faster
 # We should deprecate this...
@@ -64,4 +71,529 @@ class ReplayBuffer:
         return state, action, reward, next_state, done
 
     def __len__(self):
-        return len(self.buffer)
\ No newline at end of file
+        return len(self.buffer)
+
+
+class FrameStore:
+    def __init__(self, rows, window, num_rows=0):
+        '''
+        Ring of the rows rolling windows are made of, each row stored once
+
+        A window is the `window` rows ending at a row number, numbers count every row
+        ever appended so they never wrap. The ones older than the last capacity rows
+        are overwritten, first_valid() tells where that is.
+
+        :param rows: (capacity x row shape) array to keep the rows in, may be a memmap
+        :param window: rows per window
+        :param num_rows: rows appended so far, when rows already holds some
+        '''
+        self.capacity = len(rows)
+        assert self.capacity > 2 * window, f'{self.capacity} rows can not hold windows of {window}'
+        self.window = window
+        self.rows = rows
+        self.num_rows = num_rows
+        self.offsets = np.arange(1 - window, 1)
+        # The window ending at the last row appended, as stored
+        self.last_window = self.windows(num_rows - 1) if num_rows >= window else None
+
+    def first_valid(self):
+        return self.num_rows - self.capacity
+
+    def append(self, rows):
+        if len(rows) == 1:
+            self.rows[self.num_rows % self.capacity] = rows[0]
+        else:
+            self.rows[np.arange(self.num_rows, self.num_rows + len(rows)) % self.capacity] = rows
+        self.num_rows += len(rows)
+        return self.num_rows - 1
+
+    def windows(self, ends, out=None):
+        # (... x window x row_shape) windows ending at ends, one gather
+        return np.take(self.rows, (np.asarray(ends)[..., np.newaxis] + self.offsets) % self.capacity,
+                       axis=0, out=out)
+
+    def push(self, state, next_state):
+        '''
+        Appends the rows of state and next_state that are not stored yet: none of state
+        when it is the last window stored, the newest row of next_state when it is state
+        moved on by one
+
+        :return: end rows of state and next_state
+        '''
+        # Compared as stored, np.array_equal's checks cost more than the comparison here
+        state = np.asarray(state, dtype=self.rows.dtype)
+        # A copy, kept as last_window after the caller may have changed its array
+        next_state = np.array(next_state, dtype=self.rows.dtype)
+        if self.last_window is not None and (self.last_window == state).all():
+            state_end = self.num_rows - 1
+        else:
+            state_end = self.append(state)
+
+        if (next_state[:-1] == state[1:]).all():
+            next_end = self.append(next_state[-1:])
+        elif (next_state == state).all():
+            next_end = state_end
+        else:
+            next_end = self.append(next_state)
+        self.last_window = next_state
+        return state_end, next_end
+
+    def nbytes(self):
+        return self.rows.nbytes
+
+
+class ArrayReplayBuffer:
+    fields = ('states', 'actions', 'rewards', 'next_states', 'dones')
+
+    def __init__(self, capacity, state_dtype=np.float32, seed=None, frames=False,
+                 frame_capacity=None, path=None, pin_memory=False):
+        '''
+        Ring buffer of transitions in preallocated arrays, one per field
+
+        The arrays are allocated at capacity on the first push, their shapes and dtypes
+        taken from it: states in state_dtype, float actions as float32, integer ones as
+        int64, rewards float32, done bool. push() writes in place, sample() gathers the
+        whole batch with one fancy index per field, no Python object per transition.
+
+        Batches are drawn with replacement, random.sample's without replacement is O(n)
+        per batch. Repeats are rare for batches much smaller than the buffer.
+
+        With frames the states are rolling windows, (window x ...) arrays where the next
+        state is the state moved on by a row. Their rows then go to a FrameStore once
+        each and a transition only keeps where its two windows end, the windows are
+        gathered back at sample time. A (20 x 52) window goes from 2 x 20 rows per
+        transition to a little over one. Every episode start stores a whole window, and
+        transitions whose rows were overwritten in the frame ring are dropped, oldest
+        first, so fewer than capacity may be kept when episodes are short.
+
+        :param capacity: transitions kept, the oldest are overwritten
+        :param state_dtype: dtype states are stored in, float32 halves the float64 windows
+        :param seed: for the sampling
+        :param frames: store rolling window states as deduplicated rows
+        :param frame_capacity: rows in the frame ring, capacity and a quarter by default
+        :param path: directory to memory-map the arrays from, see below
+        :param pin_memory: gather CUDA batches through reused page-locked tensors
+
+        With a path every array is a `<name>.npy` file there, mapped rather than held in
+        RAM: the capacity can be larger than memory, pages are read when sampled. Files
+        are created sparse, nothing is written up front. sync() flushes them and writes
+        the header, position, size and the like, to header.json. A buffer made on a
+        path that holds a header picks up from there, a run can stop and resume with its
+        replay. Pushes after the last sync() are on disk but not counted in the header.
+        The header keeps the state and action shapes and dtypes, resuming with another
+        state_dtype or pushing states or actions of another shape raises a ValueError.
+        '''
+        self.capacity = capacity
+        self.state_dtype = state_dtype
+        self.random = np.random.default_rng(seed)
+        self.frames = frames
+        self.frame_capacity = frame_capacity or capacity + capacity // 4
+        self.path = path
+        self.position = 0
+        self.size = 0
+        self.states = self.actions = self.rewards = self.next_states = self.dones = None
+        self.frame_store = None
+        # Shapes and dtypes of what is pushed, set by the first push or the header
+        self.layout = None
+        # Of a resumed buffer, the first push must agree with it
+        self.resumed_layout = None
+        self.pin_memory = pin_memory
+        # Page-locked batch tensors and the event of the last copy out of them
+        self.staging = self.staged = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            if os.path.exists(os.path.join(path, HEADER)):
+                self._resume()
+
+    def _array(self, name, shape, dtype):
+        # In RAM, or a new memory-mapped file of path
+        if self.path is None:
+            return np.empty(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(self.path, f'{name}.npy'), 'w+', dtype, shape)
+
+    def _layout(self, state, action):
+        # What the arrays are made for, as it goes in the header
+        action = np.asarray(action)
+        action_dtype = np.float32 if np.issubdtype(action.dtype, np.floating) else np.int64
+        return {'state_shape': list(np.shape(state)), 'state_dtype': np.dtype(self.state_dtype).str,
+                'action_shape': list(action.shape), 'action_dtype': np.dtype(action_dtype).str}
+
+    def _check_layout(self, layout):
+        if layout != self.resumed_layout:
+            raise ValueError(f'{self.path} holds a buffer of {self.resumed_layout}, '
+                             f'not {layout}. Was it written for another env config?')
+        self.resumed_layout = None
+
+    def _allocate(self, state, action):
+        action = np.asarray(action)
+        self.layout = self._layout(state, action)
+        action_dtype = np.dtype(self.layout['action_dtype'])
+        if self.frames:
+            # End rows of the state and next state windows in the frame store
+            window, *row_shape = np.shape(state)
+            self.frame_store = FrameStore(self._array('frames', (self.frame_capacity, *row_shape),
+                                                      self.state_dtype), window)
+            state_shape, state_dtype = (self.capacity, ), np.int64
+        else:
+            state_shape, state_dtype = (self.capacity, ) + np.shape(state), self.state_dtype
+        self.states = self._array('states', state_shape, state_dtype)
+        self.next_states = self._array('next_states', state_shape, state_dtype)
+        self.actions = self._array('actions', (self.capacity, ) + action.shape, action_dtype)
+        self.rewards = self._array('rewards', (self.capacity, ), np.float32)
+        self.dones = self._array('dones', (self.capacity, ), bool)
+
+    def _header(self):
+        header = {'capacity': self.capacity, 'position': self.position, 'size': self.size,
+                  'frames': self.frames, 'allocated': self.states is not None}
+        if self.layout is not None:
+            header.update(self.layout)
+        if self.frame_store is not None:
+            header.update(window=self.frame_store.window, num_rows=self.frame_store.num_rows)
+        return header
+
+    def _resume(self):
+        with open(os.path.join(self.path, HEADER)) as f:
+            header = json.load(f)
+        if (header['capacity'], header['frames']) != (self.capacity, self.frames):
+            raise ValueError(f'{self.path} holds a buffer of {header["capacity"]} transitions, '
+                             f'frames: {header["frames"]}, not {self.capacity}, frames: {self.frames}')
+        self.position, self.size = header['position'], header['size']
+        if header['allocated']:
+            if 'state_shape' not in header:
+                raise ValueError(f'{self.path} has no state and action shapes in its header, '
+                                 f'it can not be checked, remove it to start over')
+            self.layout = {name: header[name] for name in
+                           ('state_shape', 'state_dtype', 'action_shape', 'action_dtype')}
+            stored_dtype = np.dtype(self.layout['state_dtype'])
+            if stored_dtype != np.dtype(self.state_dtype):
+                raise ValueError(f'{self.path} holds states of {stored_dtype}, '
+                                 f'not {np.dtype(self.state_dtype)}')
+            self.resumed_layout = self.layout
+            for name in self.fields:
+                setattr(self, name, np.load(os.path.join(self.path, f'{name}.npy'), mmap_mode='r+'))
+            if self.frames:
+                self.frame_store = FrameStore(np.load(os.path.join(self.path, 'frames.npy'),
+                                                      mmap_mode='r+'),
+                                              header['window'], header['num_rows'])
+        return header
+
+    def _arrays(self):
+        arrays = [getattr(self, name) for name in self.fields]
+        if self.frame_store is not None:
+            arrays += [self.frame_store.rows]
+        return arrays
+
+    def sync(self):
+        # Flushes the mapped arrays, then the header says what is in them
+        if self.path is None:
+            return
+        for array in self._arrays():
+            if isinstance(array, np.memmap):
+                array.flush()
+        with open(os.path.join(self.path, HEADER + '.tmp'), 'w') as f:
+            json.dump(self._header(), f, indent=1)
+        os.replace(os.path.join(self.path, HEADER + '.tmp'), os.path.join(self.path, HEADER))
+
+    def push(self, state, action, reward, next_state, done=False):
+        # done is optional, RunExchange pushes (state, action, reward, next_state)
+        if self.states is None:
+            self._allocate(state, action)
+        elif self.resumed_layout is not None:
+            self._check_layout(self._layout(state, action))
+        if self.frames:
+            state, next_state = self.frame_store.push(state, next_state)
+            self._drop_overwritten()
+        i = self.position
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.position = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _drop_overwritten(self):
+        # Oldest transitions first, the state window starts before the next state one
+        first_valid = self.frame_store.first_valid() + self.frame_store.window - 1
+        while self.size:
+            oldest = (self.position - self.size) % self.capacity
+            if self.states[oldest] >= first_valid:
+                return
+            self.size -= 1
+            self._evict(oldest)
+
+    def _evict(self, index):
+        # Called for every transition dropped before it is overwritten
+        pass
+
+    def sample_indices(self, batch_size):
+        # The last size transitions pushed
+        return (self.position - self.size + self.random.integers(0, self.size, batch_size)) \
+            % self.capacity
+
+    def gather(self, indices, out=None):
+        '''
+        :param out: arrays to gather into, one per field, e.g. staging buffers
+        :return: state, action, reward, next_state, done, contiguous (batch x ...) arrays
+        '''
+        out = [None] * 5 if out is None else out
+        if self.frames:
+            return (self.frame_store.windows(self.states[indices], out[0]),
+                    np.take(self.actions, indices, axis=0, out=out[1]),
+                    np.take(self.rewards, indices, out=out[2]),
+                    self.frame_store.windows(self.next_states[indices], out[3]),
+                    np.take(self.dones, indices, out=out[4]))
+        return tuple(np.take(array, indices, axis=0, out=array_out) for array, array_out in
+                     zip((self.states, self.actions, self.rewards, self.next_states, self.dones), out))
+
+    def sample(self, batch_size):
+        # Same as ReplayBuffer.sample, what train_ddpg expects
+        return self.gather(self.sample_indices(batch_size))
+
+    def sample_tensors(self, batch_size, device=device):
+        return self.gather_tensors(self.sample_indices(batch_size), device)
+
+    def gather_tensors(self, indices, device=device):
+        '''
+        Every field is gathered into one contiguous array and becomes a tensor with a
+        zero-copy from_numpy, on the CPU that is the whole cost. With pin_memory and a
+        CUDA device the fields are gathered straight into page-locked staging tensors
+        kept from one batch to the next, and copied over without blocking.
+
+        :param device: torch device to put the batch on
+        :return: state, action, reward, next_state, done tensors. Float states, rewards and
+            done, actions long or float as stored
+        '''
+        if self.pin_memory and torch.device(device).type == 'cuda':
+            batch = [tensor.to(device, non_blocking=True) for tensor in self._stage(indices)]
+            self.staged.record()
+        else:
+            batch = [torch.from_numpy(array).to(device) for array in self.gather(indices)]
+        state, action, reward, next_state, done = batch
+        return (state.to(dtype=torch.float32), action, reward,
+                next_state.to(dtype=torch.float32), done.to(dtype=torch.float32))
+
+    def _stage(self, indices):
+        # The copies out of the staging tensors must be done before they are written again
+        if self.staging is None or len(self.staging[0]) != len(indices):
+            shapes = [(len(indices), self.frame_store.window) + self.frame_store.rows.shape[1:]
+                      if self.frames and name in ('states', 'next_states')
+                      else (len(indices), ) + getattr(self, name).shape[1:] for name in self.fields]
+            dtypes = [self.state_dtype if self.frames and name in ('states', 'next_states')
+                      else getattr(self, name).dtype for name in self.fields]
+            self.staging = [torch.from_numpy(np.empty(shape, dtype)).pin_memory()
+                            for shape, dtype in zip(shapes, dtypes)]
+            self.staged = torch.cuda.Event()
+        else:
+            self.staged.synchronize()
+        self.gather(indices, [tensor.numpy() for tensor in self.staging])
+        return self.staging
+
+    def nbytes(self):
+        if self.states is None:
+            return 0
+        return sum(array.nbytes for array in
+                   (self.states, self.actions, self.rewards, self.next_states, self.dones)) \
+            + (self.frame_store.nbytes() if self.frames else 0)
+
+    def __repr__(self):
+        return 'ArrayReplayBuffer: {} / {} transitions, {:.1f} MB'.format(
+            self.size, self.capacity, self.nbytes() / 2 ** 20)
+
+    def __len__(self):
+        return self.size
+
+
+class LinearSchedule:
+    # start going linearly to end over num_steps, then end, e.g. for beta.
+    #     A class rather than a closure so buffers using it can be pickled
+    def __init__(self, start, end, num_steps):
+        self.start = start
+        self.end = end
+        self.num_steps = num_steps
+
+    def __call__(self, step):
+        return self.start + (self.end - self.start) * min(1.0, step / self.num_steps)
+
+    def __repr__(self):
+        return 'LinearSchedule({} -> {} in {} steps)'.format(self.start, self.end, self.num_steps)
+
+
+class SumTree:
+    def __init__(self, capacity):
+        '''
+        Binary tree of sums over capacity values, in one array
+
+        Node 1 is the root, node i has children 2i and 2i + 1, the values are the leaves
+        from num_leaves on. Both update and find walk one level at a time for the whole
+        batch, O(log n) numpy calls no matter the batch size.
+
+        :param capacity: number of values
+        '''
+        self.capacity = capacity
+        self.num_leaves = max(2, 1 << (capacity - 1).bit_length())
+        self.tree = np.zeros(2 * self.num_leaves)
+
+    def total(self):
+        return self.tree[1]
+
+    def __getitem__(self, indices):
+        return self.tree[np.asarray(indices) + self.num_leaves]
+
+    def update(self, indices, values):
+        nodes = np.asarray(indices, dtype=np.int64) + self.num_leaves
+        self.tree[nodes] = values
+        # All leaves are on the same level, so are their parents. Repeated nodes
+        #     just get the same sum twice
+        while True:
+            nodes = nodes // 2
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+            if nodes[0] == 1:
+                return
+
+    def find(self, values):
+        '''
+        :param values: prefix sums in [0, total)
+        :return: index of the value each prefix sum falls in, never one that is 0
+        '''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.num_leaves:
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            # Rounding can leave a value past the last non-zero leaf, it stays left then
+            right = (values >= left_sum) & (self.tree[left + 1] > 0)
+            values -= np.where(right, left_sum, 0.0)
+            nodes = left + right
+        return nodes - self.num_leaves
+
+
+class PrioritizedReplayBuffer(ArrayReplayBuffer):
+    def __init__(self, capacity, alpha=0.6, beta=0.4, epsilon=1e-6, state_dtype=np.float32,
+                 seed=None, frames=False, frame_capacity=None, path=None, pin_memory=False):
+        '''
+        ArrayReplayBuffer sampling transitions in proportion to priority ** alpha
+
+        Schaul et al., Prioritized Experience Replay. The priority of a transition is its
+        last |TD error| + epsilon, new ones get the largest priority so far so they are
+        sampled at least once. Batches are stratified: one draw from each of batch_size
+        equal slices of the total. weights() are the importance-sampling corrections
+        (len * P(i)) ** -beta, divided by the largest of the batch.
+
+        alpha and beta are numbers or functions of the number of batches sampled so far,
+        e.g. LinearSchedule(0.4, 1.0, 100000) to anneal beta to 1. Priorities already in
+        the tree keep the alpha they were set with until they are updated.
+
+        Pushes only note the index, the tree is brought up to date in one batch at the
+        next sample, walking it per push would cost more than the push.
+
+        Every slot counts how often it was written or dropped. update_priorities() skips
+        the sampled indices whose count changed since they were sampled, their TD error
+        belongs to a transition that is gone.
+
+        :param alpha: how much priorities count, 0 is uniform
+        :param beta: how much of the sampling bias is corrected, 1 is all of it
+        :param epsilon: added to |TD error|, every transition can still be sampled
+        :param frames: store rolling window states as deduplicated rows, see ArrayReplayBuffer
+        :param path: directory to memory-map the arrays and priorities from, see ArrayReplayBuffer
+        '''
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+        self.num_samples = 0
+        # Pushed since the last flush, and dropped by a frame buffer since then
+        self.pending = set()
+        self.evicted = set()
+        # Per slot, writes and drops so far, and how many there were at its last sample
+        self.generation = np.zeros(capacity, np.int64)
+        self.sampled_generation = np.full(capacity, -1, np.int64)
+        # Last, a buffer resumed from path overrides the above
+        super().__init__(capacity, state_dtype, seed, frames, frame_capacity, path, pin_memory)
+        if path is not None and not isinstance(self.tree.tree, np.memmap):
+            self.tree.tree = self._array('priorities', self.tree.tree.shape, np.float64)
+
+    def _header(self):
+        return dict(super()._header(), max_priority=self.max_priority,
+                    num_samples=self.num_samples)
+
+    def _resume(self):
+        header = super()._resume()
+        self.max_priority, self.num_samples = header['max_priority'], header['num_samples']
+        self.tree.tree = np.load(os.path.join(self.path, 'priorities.npy'), mmap_mode='r+')
+        return header
+
+    def _arrays(self):
+        return super()._arrays() + [self.tree.tree]
+
+    def sync(self):
+        # Pending pushes into the tree first
+        self.flush()
+        super().sync()
+
+    def _value(self, option):
+        return option(self.num_samples) if callable(option) else option
+
+    def push(self, state, action, reward, next_state, done=False):
+        index = self.position
+        super().push(state, action, reward, next_state, done)
+        self.pending.add(index)
+        self.generation[index] += 1
+
+    def _evict(self, index):
+        self.pending.discard(index)
+        self.evicted.add(index)
+        self.generation[index] += 1
+
+    def flush(self):
+        # Dropped ones go to 0 first, they may have been pushed again since
+        if self.evicted:
+            self.tree.update(list(self.evicted), 0.0)
+            self.evicted = set()
+        if self.pending:
+            self.tree.update(list(self.pending), self.max_priority ** self._value(self.alpha))
+            self.pending = set()
+
+    def sample_indices(self, batch_size):
+        self.flush()
+        self.num_samples += 1
+        total = self.tree.total()
+        values = (np.arange(batch_size) + self.random.random(batch_size)) * (total / batch_size)
+        # find never lands on a 0 leaf, one past size or dropped
+        indices = self.tree.find(np.minimum(values, total))
+        self.sampled_generation[indices] = self.generation[indices]
+        return indices
+
+    def weights(self, indices):
+        # Importance-sampling weights of the sampled indices, float32
+        probabilities = self.tree[indices] / self.tree.total()
+        weights = (self.size * probabilities) ** -self._value(self.beta)
+        return (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, indices, td_errors):
+        '''
+        Indices written or dropped since sample_indices gave them are skipped, e.g. when
+        transitions were pushed between sampling and the update
+
+        :param indices: what sample_indices gave
+        :param td_errors: their TD errors, any sign, array or tensor
+        '''
+        if hasattr(td_errors, 'detach'):
+            td_errors = td_errors.detach().cpu().numpy()
+        self.flush()
+        indices, priorities = np.asarray(indices), np.abs(np.ravel(td_errors)) + self.epsilon
+        # Never sampled ones, set directly, are taken as they are
+        sampled = self.sampled_generation[indices]
+        current = (sampled < 0) | (sampled == self.generation[indices])
+        if not current.all():
+            indices, priorities = indices[current], priorities[current]
+            if not len(indices):
+                return
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(indices, priorities ** self._value(self.alpha))
+
+    def __repr__(self):
+        return 'PrioritizedReplayBuffer: {} / {} transitions, {:.1f} MB, alpha: {}, beta: {}'.format(
+            self.size, self.capacity, self.nbytes() / 2 ** 20, self._value(self.alpha),
+            self._value(self.beta))
@@ -3,27 +3,48 @@ import datetime
 from collections import Counter
 from itertools import count
 import logging
-import matplotlib.pyplot as plt
 import numpy as np
 import os
-import pandas as pd
+from reinforcement.actor_learner import ActorLearner, DQNActor, DDPGActor
 from reinforcement.train import train_dqn, train_ddpg
-import math
+from reinforcement.utils import Update, decayed_epsilon
 
-try:
-    os.makedirs('logs')
-except OSError:
-    print('--- log folder exists')
 
-FILE_NAME = 'logs/training_{}.log'.format('_'.join(str(datetime.datetime.now()).split(' ')))
+LOG_PATH = 'logs'
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-file_handler = logging.FileHandler(FILE_NAME)
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+
+def add_file_handler():
+    '''
+    Starts logging to logs/training_<now>.log, once per process
+
+    Done by the runners when they are made rather than on import, importing
+    reinforcement creates no folder and opens no file.
+
+    :return: the handler
+    '''
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler):
+            return handler
+    os.makedirs(LOG_PATH, exist_ok=True)
+    file_name = os.path.join(LOG_PATH, 'training_{}.log'.format(
+        '_'.join(str(datetime.datetime.now()).split(' '))))
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = logging.FileHandler(file_name)
+    file_handler.setFormatter(formatter)
+    logger.addHandler(file_handler)
+    return file_handler
+
+
+def log_throughput(throughput):
+    # Of ActorLearner, acting and learning are counted apart
+    logger.info('Actor Steps/sec            : {:.1f} ({})'.format(
+        throughput['actor_steps_per_sec'],
+        ', '.join('{:.1f}'.format(steps) for steps in throughput['per_actor_steps_per_sec'])))
+    logger.info('Learner Updates/sec        : {:.1f}'.format(throughput['learner_updates_per_sec']))
 
 
 # Refactor name...
@@ -50,10 +71,13 @@ class RunExchange:
         self.losses = []
         self.mode = mode
 
+        add_file_handler()
         self.fig, self.axis = self.get_figure_and_axis()
 
     @classmethod
     def get_figure_and_axis(cls):
+        # matplotlib only comes in with the first runner
+        import matplotlib.pyplot as plt
         plt.style.use(['ggplot'])  # 'fivethirtyeight'])
         plt.ion()
         return plt.subplots(2, 1)
@@ -82,29 +106,28 @@ class RunExchange:
 
         return episode_rewards, actions
 
+    def log_dqn(self, i_episode, episode_loss_avg, episode_reward, action_counters):
+        logger.info('---------------------')
+        logger.info('Ending {} episodes, epsilon: {:.5f}'.format(i_episode, self.epsilon))
+        logger.info('Episode Loss               : {:.5f}'.format(episode_loss_avg))
+        logger.info('Episode Rewards            : {:.5f}'.format(episode_reward))
+        logger.info('Actions Counted:           : {}'.format(action_counters))
+
+        self.axis[0].plot(self.rewards)
+        # self.axis[0].scatter(len(self.rewards), self.rewards[-1])
+        # sns.distplot(self.rewards, ax=self.axis[1])
+
+        self.axis[1].plot(self.losses)
+        # self.axis[2].scatter(len(self.losses), self.losses[-1])
+        # sns.distplot(self.losses, ax=self.axis[3])
+        import matplotlib.pyplot as plt
+        plt.pause(0.001)
+
     # Refactor the name...
     def train_exchange_dqn(self):
 
         def adjust_epsilon():
-            MULTIPLIER = 3.0
-            self.epsilon = self.min_epsilon + (self.max_epsilon - self.min_epsilon) * \
-                           math.exp(-1.0 * i_episode * MULTIPLIER / self.n_train)
-
-        def log_(episode_loss_avg, episode_reward, action_counters):
-            logger.info('---------------------')
-            logger.info('Ending {} episodes, epsilon: {:.5f}'.format(i_episode, self.epsilon))
-            logger.info('Episode Loss               : {:.5f}'.format(episode_loss_avg))
-            logger.info('Episode Rewards            : {:.5f}'.format(episode_reward))
-            logger.info('Actions Counted:           : {}'.format(action_counters))
-
-            self.axis[0].plot(self.rewards)
-            # self.axis[0].scatter(len(self.rewards), self.rewards[-1])
-            # sns.distplot(self.rewards, ax=self.axis[1])
-
-            self.axis[1].plot(self.losses)
-            # self.axis[2].scatter(len(self.losses), self.losses[-1])
-            # sns.distplot(self.losses, ax=self.axis[3])
-            plt.pause(0.001)
+            self.epsilon = decayed_epsilon(i_episode, self.max_epsilon, self.min_epsilon, self.n_train)
 
         if self.mode == 'test':
             self.epsilon = self.min_epsilon = 1e-7
@@ -144,15 +167,67 @@ class RunExchange:
                     self.losses += [np.mean(episode_loss)]
 
                     if i_episode % self.log_every == 0:
-                        log_(np.mean(episode_loss), episode_reward, actions)
+                        self.log_dqn(i_episode, np.mean(episode_loss), episode_reward, actions)
 
                     if i_episode % self.update_every == 0:
-                        self.target.load_state_dict(self.policy.state_dict())
+                        Update.hard_update(self.policy, self.target)
 
                     del episode_loss
 
                     break
 
+    def train_exchange_dqn_async(self, env_cls, num_actors=1, publish_every=10, sync_every=100,
+                                 seed=None, start_method=None):
+        '''
+        train_exchange_dqn with acting and learning apart, see ActorLearner
+
+        num_actors processes play the n_train episodes with a copy of the policy, this
+        one only pushes their transitions and runs train_dqn, publishing the policy every
+        publish_every updates. Neither waits on the other. The target is updated every
+        update_every episodes as before, logs add actor steps/sec and learner updates/sec.
+
+        :param env_cls: made in every actor as env_cls(seed + rank), e.g. type(env.unwrapped)
+        :param sync_every: actor steps between picking up the published policy
+        :return: actor and learner throughput over the whole run, see ActorLearner.throughput
+        '''
+        assert self.mode == 'train', 'Nothing to learn from in test mode'
+        actor_learner = ActorLearner(self.policy, env_cls,
+                                     DQNActor(self.max_epsilon, self.min_epsilon, self.n_train),
+                                     num_actors, self.n_train, seed, sync_every=sync_every,
+                                     start_method=start_method)
+        episode_loss = []
+        waiting = True
+        try:
+            while actor_learner.running:
+                # Episodes end in any order over the actors, counted as they come in
+                for i_episode, episode_reward, summary in actor_learner.receive(
+                        self.replay_memory, block=waiting):
+                    self.epsilon = summary['epsilon']
+                    self.rewards += [episode_reward]
+                    self.losses += [np.mean(episode_loss) if episode_loss else np.nan]
+                    if len(self.rewards) % self.log_every == 0:
+                        self.log_dqn(i_episode, self.losses[-1], episode_reward, summary['actions'])
+                        log_throughput(actor_learner.throughput())
+                    if len(self.rewards) % self.update_every == 0:
+                        Update.hard_update(self.policy, self.target)
+                    episode_loss = []
+
+                loss = train_dqn(self.policy, self.target, self.replay_memory,
+                                 self.batch_size, self.optimizer, self.gamma,
+                                 self.double_dqn)
+                # Not enough transitions yet, wait for some rather than spin
+                waiting = loss is None
+                if loss is not None:
+                    episode_loss += [loss.item()]
+                    actor_learner.num_updates += 1
+                    if actor_learner.num_updates % publish_every == 0:
+                        actor_learner.publish(self.policy)
+        finally:
+            actor_learner.close()
+        throughput = actor_learner.throughput(since_start=True)
+        log_throughput(throughput)
+        return throughput
+
 
 # Refactor name...
 class RunExchangeContinuous:
@@ -172,37 +247,41 @@ class RunExchangeContinuous:
         self.policy_losses = []
         self.mode = mode
 
+        add_file_handler()
         self.fig, self.axis = self.get_figure_and_axis()
 
     @classmethod
     def get_figure_and_axis(cls):
+        # matplotlib only comes in with the first runner
+        import matplotlib.pyplot as plt
         plt.style.use(['ggplot'])  # 'fivethirtyeight'])
         plt.ion()
         return plt.subplots(3, 1)
 
+    def log_ddpg(self, i_episode, episode_value_loss, episode_policy_loss, episode_reward,
+                 action_avg, action_std):
+        logger.info('---------------------')
+        logger.info('Ending {}th episodes,              '.format(i_episode))
+        logger.info('Episode Value Loss         : {:.5f}'.format(episode_value_loss))
+        logger.info('Episode Policy Loss        : {:.5f}'.format(episode_policy_loss))
+        logger.info('Episode Rewards            : {:.5f}'.format(episode_reward))
+        logger.info('Episode Action Average     : {:.5f}'.format(action_avg))
+        logger.info('Episode Action Stdev       : {:.5f}'.format(action_std))
+
+        self.axis[0].plot(self.rewards)
+        # self.axis[0].scatter(len(self.rewards), self.rewards[-1])
+        # sns.distplot(self.rewards, ax=self.axis[1])
+
+        self.axis[1].plot(self.value_losses)
+        self.axis[2].plot(self.policy_losses)
+        # self.axis[2].scatter(len(self.losses), self.losses[-1])
+        # sns.distplot(self.losses, ax=self.axis[3])
+        import matplotlib.pyplot as plt
+        plt.pause(1e-4)
+
     # Refactor
     def train_exchange_ddpg(self):
 
-        def log_(episode_value_loss, episode_policy_loss, episode_reward,
-                 action_avg, action_std):
-            logger.info('---------------------')
-            logger.info('Ending {}th episodes,              '.format(i_episode))
-            logger.info('Episode Value Loss         : {:.5f}'.format(episode_value_loss))
-            logger.info('Episode Policy Loss        : {:.5f}'.format(episode_policy_loss))
-            logger.info('Episode Rewards            : {:.5f}'.format(episode_reward))
-            logger.info('Episode Action Average     : {:.5f}'.format(action_avg))
-            logger.info('Episode Action Stdev       : {:.5f}'.format(action_std))
-
-            self.axis[0].plot(self.rewards)
-            # self.axis[0].scatter(len(self.rewards), self.rewards[-1])
-            # sns.distplot(self.rewards, ax=self.axis[1])
-
-            self.axis[1].plot(self.value_losses)
-            self.axis[2].plot(self.policy_losses)
-            # self.axis[2].scatter(len(self.losses), self.losses[-1])
-            # sns.distplot(self.losses, ax=self.axis[3])
-            plt.pause(1e-4)
-
         for i_episode in range(1, self.n_train + 1):
             state = self.env.reset()
             self.ddpg_agent.reset_noise()
@@ -232,11 +311,54 @@ class RunExchangeContinuous:
                     actions_avg = np.average(actions)
                     actions_std = np.std(actions)
                     if i_episode % self.log_every == 0:
-                        log_(episode_value_loss, episode_policy_loss,
-                             episode_reward, actions_avg, actions_std)
+                        self.log_ddpg(i_episode, episode_value_loss, episode_policy_loss,
+                                      episode_reward, actions_avg, actions_std)
 
                     self.rewards += [episode_reward]
                     self.value_losses += [episode_value_loss]
                     self.policy_losses += [episode_policy_loss]
                     break
 
+    def train_exchange_ddpg_async(self, env_cls, num_actors=1, publish_every=10, sync_every=100,
+                                  seed=None, start_method=None):
+        '''
+        train_exchange_ddpg with acting and learning apart, see ActorLearner and
+        RunExchange.train_exchange_dqn_async. Actors act with a copy of the DDPG actor
+        network plus their own OU noise.
+
+        :return: actor and learner throughput over the whole run, see ActorLearner.throughput
+        '''
+        assert self.mode == 'train', 'Nothing to learn from in test mode'
+        actor_learner = ActorLearner(self.ddpg_agent.actor, env_cls,
+                                     DDPGActor(deepcopy(self.ddpg_agent.noise)), num_actors,
+                                     self.n_train, seed, sync_every=sync_every,
+                                     start_method=start_method)
+        episode_value_loss = episode_policy_loss = 0.0
+        waiting = True
+        try:
+            while actor_learner.running:
+                for i_episode, episode_reward, summary in actor_learner.receive(
+                        self.replay_memory, block=waiting):
+                    self.rewards += [episode_reward]
+                    self.value_losses += [episode_value_loss]
+                    self.policy_losses += [episode_policy_loss]
+                    if len(self.rewards) % self.log_every == 0:
+                        self.log_ddpg(i_episode, episode_value_loss, episode_policy_loss,
+                                      episode_reward, summary['action_avg'], summary['action_std'])
+                        log_throughput(actor_learner.throughput())
+                    episode_value_loss = episode_policy_loss = 0.0
+
+                temp_result = train_ddpg(self.ddpg_agent, self.replay_memory, self.batch_size)
+                waiting = temp_result is None
+                if temp_result is not None:
+                    value_loss, policy_loss = temp_result
+                    episode_value_loss += value_loss.item()
+                    episode_policy_loss += policy_loss.item()
+                    actor_learner.num_updates += 1
+                    if actor_learner.num_updates % publish_every == 0:
+                        actor_learner.publish(self.ddpg_agent.actor)
+        finally:
+            actor_learner.close()
+        throughput = actor_learner.throughput(since_start=True)
+        log_throughput(throughput)
+        return throughput
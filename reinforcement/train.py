@@ -2,7 +2,8 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
-from reinforcement.replay_memory import Transition, TransitionDone
+from reinforcement.replay_memory import ArrayReplayBuffer, PrioritizedReplayBuffer, ReplayBuffer, \
+    Transition, TransitionDone
 from reinforcement.environment import device
 
 
@@ -16,10 +17,30 @@ def load_game_from_replay_memory(replay_memory, batch_size, done_flag=False):
 
 
 def batch_to_tensor(given_batch, action_batch=False):
-    dtype = torch.long if action_batch else torch.float32
-    batch = list(map(lambda x: torch.tensor(x, device=device, dtype=dtype
-                                            ).unsqueeze(0), given_batch))
-    return torch.cat(batch, 0)
+    # The whole batch into one array, then a zero-copy from_numpy. A tensor per sample
+    #     and torch.cat cost more than the DuelingDQN forward pass on the CPU
+    dtype = np.int64 if action_batch else np.float32
+    return torch.from_numpy(np.asarray(given_batch, dtype=dtype)).to(device)
+
+
+def sample_batch(replay_memory, batch_size):
+    '''
+    :return: (state, action, reward, next_state, done) tensors on device, done is None
+        for memories that do not keep it. Then the sampled indices and their importance-
+        sampling weights for a PrioritizedReplayBuffer, both None otherwise
+    '''
+    if isinstance(replay_memory, ArrayReplayBuffer):
+        indices = replay_memory.sample_indices(batch_size)
+        batch = replay_memory.gather_tensors(indices)
+        if isinstance(replay_memory, PrioritizedReplayBuffer):
+            return batch, indices, torch.from_numpy(replay_memory.weights(indices)).to(device)
+        return batch, None, None
+    if isinstance(replay_memory, ReplayBuffer):
+        # Already np.stack'ed, float actions for train_ddpg
+        return tuple(map(batch_to_tensor, replay_memory.sample(batch_size))), None, None
+    batch = load_game_from_replay_memory(replay_memory, batch_size)
+    return (batch_to_tensor(batch.state), batch_to_tensor(batch.action, action_batch=True),
+            batch_to_tensor(batch.reward), batch_to_tensor(batch.next_state), None), None, None
 
 
 def train_dqn(policy_q, target_q, replay_memory, batch_size,
@@ -29,12 +50,9 @@ def train_dqn(policy_q, target_q, replay_memory, batch_size,
     if len(replay_memory) < batch_size * 30:
         return
 
-    batch = load_game_from_replay_memory(replay_memory, batch_size)
-
-    state_batch = batch_to_tensor(batch.state)
-    action_batch = batch_to_tensor(batch.action, action_batch=True)
-    reward_batch = batch_to_tensor(batch.reward).unsqueeze(1)
-    next_state_batch = batch_to_tensor(batch.next_state)
+    (state_batch, action_batch, reward_batch, next_state_batch, _), indices, weights = \
+        sample_batch(replay_memory, batch_size)
+    reward_batch = reward_batch.unsqueeze(1)
 
     state_action_values = policy_q(state_batch).gather(1, action_batch.unsqueeze(1))
 
@@ -47,7 +65,13 @@ def train_dqn(policy_q, target_q, replay_memory, batch_size,
 
     expected_state_action_values = next_state_values * gamma + reward_batch
 
-    loss = F.smooth_l1_loss(state_action_values, expected_state_action_values)
+    if weights is not None:
+        # Importance-sampling weighted, the TD errors become the new priorities
+        loss = (weights.unsqueeze(1) * F.smooth_l1_loss(
+            state_action_values, expected_state_action_values, reduction='none')).mean()
+        replay_memory.update_priorities(indices, expected_state_action_values - state_action_values)
+    else:
+        loss = F.smooth_l1_loss(state_action_values, expected_state_action_values)
 
     optimizer.zero_grad()
     loss.backward()
@@ -63,15 +87,17 @@ def train_ddpg(ddpg_agent, replay_buffer, batch_size):
     if len(replay_buffer) < batch_size * 10:
         return
 
-    state, action, reward, next_state, done = replay_buffer.sample(batch_size)
-
-    state = torch.FloatTensor(state).to(device)
-    action = torch.FloatTensor(action).to(device)
-    reward = torch.FloatTensor(reward).unsqueeze(1).to(device)
-    next_state = torch.FloatTensor(next_state).to(device)
-    done = torch.FloatTensor(np.float32(done)).unsqueeze(1).to(device)
+    (state, action, reward, next_state, done), indices, weights = \
+        sample_batch(replay_buffer, batch_size)
+    reward = reward.unsqueeze(1)
+    done = done.unsqueeze(1)
 
-    value_loss = ddpg_agent.get_value_loss(state, action, reward, next_state, done)
+    if weights is not None:
+        td_errors = ddpg_agent.get_td_errors(state, action, reward, next_state, done)
+        value_loss = (weights.unsqueeze(1) * td_errors.pow(2)).mean()
+        replay_buffer.update_priorities(indices, td_errors)
+    else:
+        value_loss = ddpg_agent.get_value_loss(state, action, reward, next_state, done)
     policy_loss = ddpg_agent.get_policy_loss(state)
 
     # This can't be the best way...
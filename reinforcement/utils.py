@@ -1,12 +1,19 @@
+from copy import copy
 import gym
+import math
 import numpy as np
+import torch
 
 
 # Modified, originally from
 # https://github.com/vitchyr/rlkit/blob/master/rlkit/exploration_strategies/ou_strategy.py
 class OUNoise:
     def __init__(self, gym_env_action_space, mu=0.0, theta=0.15,
-                 max_sigma=0.3, min_sigma=0.3, decay_period=100000):
+                 max_sigma=0.3, min_sigma=0.3, decay_period=100000, num_envs=None):
+        '''
+        :param num_envs: one independent process per episode when given, the noise is
+            then (num_envs x action_dim)
+        '''
         self.mu = mu
         self.theta = theta
         self.sigma = max_sigma
@@ -23,33 +30,72 @@ class OUNoise:
         # Something to think about ...
         self.low = gym_env_action_space.low
         self.high = gym_env_action_space.high
+        self.num_envs = num_envs
         self.reset()
 
-    def reset(self):
-        self.state = np.ones(self.action_dim) * self.mu
+    def vectorized(self, num_envs):
+        # The same process for num_envs episodes side by side, e.g. for DDPG.select_actions
+        noise = copy(self)
+        noise.num_envs = num_envs
+        noise.reset()
+        return noise
+
+    def reset(self, indices=None):
+        '''
+        :param indices: episodes to restart when vectorized, e.g. the done ones, all if None
+        '''
+        if indices is None:
+            shape = (self.action_dim, ) if self.num_envs is None else (self.num_envs, self.action_dim)
+            self.state = np.ones(shape) * self.mu
+        else:
+            self.state[indices] = self.mu
 
     def get_noise(self, t=0):
-        # update sigma
+        # update sigma, t can be one per episode when vectorized
         self.sigma = self.max_sigma - (self.max_sigma - self.min_sigma) \
-                     * min(1.0, t / self.decay_period)
+                     * np.minimum(1.0, np.asarray(t) / self.decay_period)
+        sigma = self.sigma if self.num_envs is None else np.reshape(self.sigma, (-1, 1))
         x = self.state
         dx = self.theta * (self.mu - x) \
-             + self.sigma * np.random.randn(self.action_dim)
+             + sigma * np.random.randn(*x.shape)
 
         # self.state == noise
         self.state = x + dx
         return np.float32(self.state)
 
 
+def decayed_epsilon(i_episode, max_epsilon, min_epsilon, n_train, multiplier=3.0):
+    # Exponential decay from max_epsilon towards min_epsilon over n_train episodes
+    return min_epsilon + (max_epsilon - min_epsilon) * math.exp(-1.0 * i_episode * multiplier / n_train)
+
+
 class Update:
+    # Multi-tensor in place ops: a few kernels for all the parameters, no temporaries.
+    #     Older torch without them goes a tensor at a time, still in place
+    foreach = hasattr(torch, '_foreach_lerp_') and hasattr(torch, '_foreach_copy_')
+
     @classmethod
+    @torch.no_grad()
     def soft_update(cls, source, target, tau):
-        for target_param, source_param in zip(target.parameters(), source.parameters()):
-            target_param.data.copy_(target_param.data * (1.0 - tau)
-                                    + source_param.data * tau)
+        # target * (1 - tau) + source * tau, as target + tau * (source - target)
+        targets, sources = list(target.parameters()), list(source.parameters())
+        if cls.foreach:
+            torch._foreach_lerp_(targets, sources, tau)
+        else:
+            for target_param, source_param in zip(targets, sources):
+                target_param.lerp_(source_param, tau)
+
     @classmethod
+    @torch.no_grad()
     def hard_update(cls, source, target):
-        target.load_state_dict(source.state_dict())
+        # What load_state_dict(source.state_dict()) does, without building the dicts
+        targets = list(target.parameters()) + list(target.buffers())
+        sources = list(source.parameters()) + list(source.buffers())
+        if cls.foreach:
+            torch._foreach_copy_(targets, sources)
+        else:
+            for target_tensor, source_tensor in zip(targets, sources):
+                target_tensor.copy_(source_tensor)
 
 
 class NormalizedActions(gym.ActionWrapper):
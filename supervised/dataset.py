@@ -5,6 +5,7 @@ import pickle
 from torch.utils.data import Dataset
 from supervised.environment import *
 from supervised.utils import iterable
+from gym_exchange.gym_engine.market_store import open_store, FIELDS
 
 
 def digitize(y):
@@ -15,29 +16,34 @@ def digitize(y):
 
 # EVENTUALLY, PORTFOLIO BE THE ONLY INTERFACE
 class TickerData(Dataset):
-    def __init__(self, ticker, num_state_space, shuffled_index):
+    def __init__(self, ticker, num_state_space, shuffled_index, store=None):
         '''
         :param ticker: string
         :param num_state_space: number of days used as an input `x`
         :param shuffled_index: an iterable of indices
+        :param store: MarketStore or its path, read instead of the csv if given
         '''
         self.ticker = str.upper(ticker)
         self.num_state_space = num_state_space
-        self.x, self.y = self.load_df(self.ticker, num_state_space)
+        self.x, self.y = self.load_df(self.ticker, num_state_space, store)
         self.index = shuffled_index
 
     @classmethod
-    def load_df(cls, ticker, num_state_space):
+    def load_df(cls, ticker, num_state_space, store=None):
         '''
         classmethod for easy use to other inheriting classes
         '''
-        df = pd.read_csv(f'iexfinance/iexdata/{ticker}') \
-            .drop('date', axis=1)
-        close_delta = np.log(df.close) - np.log(df.close.shift(1))
+        if store is None:
+            close = pd.read_csv(f'iexfinance/iexdata/{ticker}').close
+        else:
+            # Mapped from the store, no csv parsing
+            ohlcv, _ = open_store(store).load(ticker)
+            close = pd.Series(ohlcv[:, FIELDS.index('close')])
+        close_delta = np.log(close) - np.log(close.shift(1))
         close_delta[0] = 0.0
 
         stacked = [close_delta[i:num_state_space + i]
-                   for i in range(len(df)-num_state_space)]
+                   for i in range(len(close)-num_state_space)]
 
         # pd.DataFrame is necessary
         stacked = pd.DataFrame(np.column_stack(stacked))
@@ -66,16 +72,18 @@ class TickerDataDiscreteReturn(TickerData):
 
 # hmm looks like it doesn't need to inherit...
 class PortfolioData(TickerData):
-    def __init__(self, tickers, num_state_space, shuffled_index, transform=None):
+    def __init__(self, tickers, num_state_space, shuffled_index, transform=None, store=None):
         '''
         :param tickers: an iterable of strings
         :param num_state_space: number of days used as an input `x`
         :param shuffled_index: an iterable of indices
+        :param store: MarketStore or its path, read instead of the csvs if given
         '''
         assert iterable(tickers), 'tickers must be an iterable'
         self.tickers = [str.upper(ticker) for ticker in tickers]
         self.num_state_space = num_state_space
         self.index = shuffled_index
+        self.store = store
         self.xs, self.ys = self.load_tickers()
         self.transform = transform
 
@@ -83,7 +91,7 @@ class PortfolioData(TickerData):
         # xs will be of dimension 3
         xs, ys = [], []
         for ticker in self.tickers:
-            x, y = self.load_df(ticker, self.num_state_space)
+            x, y = self.load_df(ticker, self.num_state_space, self.store)
             xs += [x.values[np.newaxis, ...]]
             ys += [y[np.newaxis, ...]]
 
@@ -167,7 +175,6 @@ class TickersData(Dataset):
         return x, y, y_transformed
 
 
-from imblearn.combine import SMOTEENN
 class TickersDataWrapper(TickersData):
     def __init__(self, ticker_list, last_file_path, y_transform, smote_ratio=None):
         '''
@@ -180,6 +187,8 @@ class TickersDataWrapper(TickersData):
         http://imbalanced-learn.org/en/stable/api.html
         '''
         super(TickersDataWrapper, self).__init__(ticker_list, last_file_path, y_transform)
+        # imblearn (and sklearn with it) only when a wrapper is made
+        from imblearn.combine import SMOTEENN
         self.sme = SMOTEENN(ratio=smote_ratio)
         self.x_sampled, self.y_sampled = self.sme.fit_resample(self.x, self.y_transformed)
 
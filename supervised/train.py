@@ -8,6 +8,7 @@ from torch.utils.data import DataLoader
 
 from supervised.environment import *
 from supervised.utils import iterable
+from gym_exchange.gym_engine.market_store import open_store
 
 
 def train_validate_split(length, split_pct=PCT_TRAIN, shuffle=True):
@@ -29,7 +30,7 @@ def train_validate_split(length, split_pct=PCT_TRAIN, shuffle=True):
 
 # Eventually, PortfolioData should be the only class for DataClass
 # Okay, started deprecating Discrete... Discrete is really worthless...
-def get_dl(tickers, num_state_space, batch_size, DataClass, shuffle=True):
+def get_dl(tickers, num_state_space, batch_size, DataClass, shuffle=True, store=None):
 
     if isinstance(tickers, str):
         ticker = str.upper(tickers)
@@ -39,10 +40,14 @@ def get_dl(tickers, num_state_space, batch_size, DataClass, shuffle=True):
     ticker_dataset = partial(DataClass,
                              tickers=tickers,
                              num_state_space=num_state_space)
-
-    ticker_file = f'iexfinance/iexdata/{ticker}'
-    ticker_df = pd.read_csv(ticker_file)
-    train_data_length = len(ticker_df) - num_state_space
+    if store is not None:
+        ticker_dataset = partial(ticker_dataset, store=store)
+        # The manifest already knows the length, no need to read the file
+        num_rows = open_store(store).rows(ticker)
+    else:
+        ticker_file = f'iexfinance/iexdata/{ticker}'
+        num_rows = len(pd.read_csv(ticker_file))
+    train_data_length = num_rows - num_state_space
     train, validate = train_validate_split(train_data_length, shuffle=shuffle)
 
     train_dataloader = DataLoader(ticker_dataset(shuffled_index=train),
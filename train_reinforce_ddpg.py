@@ -5,7 +5,7 @@ import gym_exchange
 from reinforcement.run_exchange import RunExchangeContinuous
 
 from reinforcement.models_ddpg import DDPG
-from reinforcement import ReplayBuffer
+from reinforcement import ArrayReplayBuffer, PrioritizedReplayBuffer, LinearSchedule
 
 
 parser = argparse.ArgumentParser(description='Hyper-parameters for DDPG training')
@@ -13,9 +13,24 @@ parser.add_argument('--update_every',         default=20, type=int)
 parser.add_argument('--log_every',            default=2, type=int)
 parser.add_argument('--n_train',              default=200, type=int)
 parser.add_argument('--batch_size',           default=128, type=int)
+parser.add_argument('--replay_buffer',        default='', type=str,
+                    help='directory to map the replay buffer from and resume it, RAM only by default')
 parser.add_argument('--replay_buffer_length', default=100000, type=int)
+parser.add_argument('--prioritized',          action='store_true', help='prioritized replay')
+parser.add_argument('--alpha',                default=0.6, type=float)
+parser.add_argument('--beta',                 default=0.4, type=float,
+                    help='annealed to 1 over --beta_steps batches')
+parser.add_argument('--beta_steps',           default=100000, type=int)
+parser.add_argument('--frames',               action='store_true',
+                    help='store the rolling window states as deduplicated rows')
 parser.add_argument('--actor_learning_rate',  default=1e-4, type=float)
 parser.add_argument('--critic_learning_rate', default=1e-3, type=float)
+parser.add_argument('--num_actors',           default=0, type=int,
+                    help='processes stepping envs while this one only learns, 0 alternates the two')
+parser.add_argument('--publish_every',        default=10, type=int,
+                    help='learner updates between publishing the weights to the actors')
+parser.add_argument('--sync_every',           default=100, type=int,
+                    help='actor steps between picking up the published weights')
 parser.add_argument('--mode',                 default='train', type=str, choices=['train', 'test'])
 parser.add_argument('--hidden_dim',           default=256, type=int)
 parser.add_argument('--num_running_days',     default=20, type=int)
@@ -37,7 +52,15 @@ if __name__ == '__main__':
     ddpg = DDPG(env.observation_space.shape, args.hidden_dim,
                 env.action_space.shape[0], env, args).cuda()
 
-    rb = ReplayBuffer(args.replay_buffer_length)
+    # With --replay_buffer, picks up what a previous run left there, if anything
+    replay_path = args.replay_buffer or None
+    if args.prioritized:
+        rb = PrioritizedReplayBuffer(args.replay_buffer_length, args.alpha,
+                                     LinearSchedule(args.beta, 1.0, args.beta_steps),
+                                     frames=args.frames, path=replay_path)
+    else:
+        rb = ArrayReplayBuffer(args.replay_buffer_length, frames=args.frames, path=replay_path)
+    print('--- Replay buffer: {}'.format(rb))
 
     player = RunExchangeContinuous(env, rb, ddpg, args.num_running_days,
                                    args.batch_size, args.n_train,
@@ -45,7 +68,11 @@ if __name__ == '__main__':
                                    args.mode)
 
     try:
-        player.train_exchange_ddpg()
+        if args.num_actors:
+            player.train_exchange_ddpg_async(type(env.unwrapped), args.num_actors,
+                                             args.publish_every, args.sync_every)
+        else:
+            player.train_exchange_ddpg()
     except KeyboardInterrupt:
         print('\nKeyboard Interrupt!!!')
     finally:
@@ -53,4 +80,5 @@ if __name__ == '__main__':
         if args.mode == 'train':
             print('Saving...')
             # Implement saving option in DDPG?
+            rb.sync()
 
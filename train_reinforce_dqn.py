@@ -1,7 +1,6 @@
 import argparse
 import gym
 import gym_exchange
-import pickle
 
 from reinforcement.run_exchange import RunExchange
 
@@ -9,7 +8,7 @@ import torch
 import torch.optim as optim
 
 from reinforcement.models_dqn import DuelingDQN
-from reinforcement import ReplayMemory
+from reinforcement import ArrayReplayBuffer, PrioritizedReplayBuffer, LinearSchedule
 
 
 parser = argparse.ArgumentParser(description='Hyper-parameters for the DQN training')
@@ -20,9 +19,23 @@ parser.add_argument('--log_every',            default=2, type=int)
 parser.add_argument('--n_train',              default=200, type=int)
 parser.add_argument('--batch_size',           default=32, type=int)
 parser.add_argument('--gamma',                default=0.9, type=float)
-parser.add_argument('--replay_memory',        default='replay_memory.p', type=str)
+parser.add_argument('--replay_memory',        default='', type=str,
+                    help='directory to map the replay memory from and resume it, RAM only by default')
 parser.add_argument('--replay_memory_length', default=100000, type=int)
+parser.add_argument('--prioritized',          action='store_true', help='prioritized replay')
+parser.add_argument('--alpha',                default=0.6, type=float)
+parser.add_argument('--beta',                 default=0.4, type=float,
+                    help='annealed to 1 over --beta_steps batches')
+parser.add_argument('--beta_steps',           default=100000, type=int)
+parser.add_argument('--frames',               action='store_true',
+                    help='store the rolling window states as deduplicated rows')
 parser.add_argument('--learning_rate',        default=1e-7, type=float)
+parser.add_argument('--num_actors',           default=0, type=int,
+                    help='processes stepping envs while this one only learns, 0 alternates the two')
+parser.add_argument('--publish_every',        default=10, type=int,
+                    help='learner updates between publishing the weights to the actors')
+parser.add_argument('--sync_every',           default=100, type=int,
+                    help='actor steps between picking up the published weights')
 parser.add_argument('--mode',                 default='train', type=str, choices=['train', 'test'])
 
 # num_action_space not TRUE
@@ -49,12 +62,15 @@ if __name__ == '__main__':
     except FileNotFoundError:
         print('--- Exception Raised: Files for model states not found...')
 
-    # This is not supported for this version
-    # Just leaving as is for now ...
-    try:
-        rm = pickle.load(open(args.replay_memory, 'rb'))
-    except FileNotFoundError:
-        rm = ReplayMemory(args.replay_memory_length)
+    # With --replay_memory, picks up what a previous run left there, if anything
+    replay_path = args.replay_memory or None
+    if args.prioritized:
+        rm = PrioritizedReplayBuffer(args.replay_memory_length, args.alpha,
+                                     LinearSchedule(args.beta, 1.0, args.beta_steps),
+                                     frames=args.frames, path=replay_path)
+    else:
+        rm = ArrayReplayBuffer(args.replay_memory_length, frames=args.frames, path=replay_path)
+    print('--- Replay memory: {}'.format(rm))
 
     optimizer = optim.RMSprop(policy_q.parameters(), eps=args.learning_rate)
 
@@ -67,7 +83,11 @@ if __name__ == '__main__':
                          gamma=args.gamma, mode=args.mode)
 
     try:
-        player.train_exchange_dqn()
+        if args.num_actors:
+            player.train_exchange_dqn_async(type(env.unwrapped), args.num_actors,
+                                             args.publish_every, args.sync_every)
+        else:
+            player.train_exchange_dqn()
     except KeyboardInterrupt:
         print('\nKeyboard Interrupt!!!')
     finally:
@@ -76,3 +96,4 @@ if __name__ == '__main__':
             print('Saving...')
             torch.save(policy_q.state_dict(), 'my_duel_policy_vanilla.pt')
             torch.save(target_q.state_dict(), 'my_duel_target_vanilla.pt')
+            rm.sync()